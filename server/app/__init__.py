@@ -1,36 +1,29 @@
 from flask import Flask, request, jsonify, current_app
-import requests
 from flask_cors import CORS
-from flask_migrate import Migrate
-from flask_jwt_extended import JWTManager, verify_jwt_in_request, get_jwt_identity
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from datetime import datetime, timedelta
+from flask_jwt_extended import JWTManager, verify_jwt_in_request, get_jwt
+from datetime import datetime
 from functools import wraps
-from sqlalchemy.exc import OperationalError
 import logging
-from logging.handlers import RotatingFileHandler
 import os
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
 from app.commands import init_commands  # Add this import
 
-from app.extensions import db
+from app.extensions import db, limiter
 from app.models.user import User
 from app.models.transaction import Transaction
+from app.models.access_code import AccessCode
+from app.models.entitlement_change import EntitlementChange
+from app.models.refund import Refund
+from app.utils import sms, passwords, gateways, devices, usage, logging_setup, metrics, query_audit, profiling, json_provider, conditional, compression
+from app.utils.decorators import claims_phone_number
 from app.routes.admin import admin_bp
 from app.routes.auth import auth_bp
 from app.routes.payments import payments_bp
+from app.routes.gateway import gateway_bp
 
 
 # Initialize extensions
-migrate = Migrate()
 jwt = JWTManager()
-limiter = Limiter(
-    key_func=get_remote_address,
-    storage_uri=os.getenv('RATELIMIT_STORAGE_URL', 'memory://') if os.getenv('FLASK_ENV') != 'production' else 'redis://localhost:6379',
-    strategy='fixed-window'
-)
 
 def create_app():
     """Factory function to create and configure the Flask app."""
@@ -53,79 +46,62 @@ def create_app():
     app.config['TWILIO_ACCOUNT_SID'] = os.getenv('TWILIO_ACCOUNT_SID')
     app.config['TWILIO_AUTH_TOKEN'] = os.getenv('TWILIO_AUTH_TOKEN')
     app.config['TWILIO_PHONE_NUMBER'] = os.getenv('TWILIO_PHONE_NUMBER')
-    app.config['RATELIMIT_STORAGE_URL'] = 'redis://localhost:6379' if os.getenv('FLASK_ENV') == 'production' else 'memory://'
     # app.config['CORS_HEADERS'] = 'Content-Type, Authorization'
 
+    # Set up logging before anything below logs
+    logging_setup.init_app(app)
+    json_provider.init_app(app)
+
     # Override database URI with environment variables
     if os.getenv('DATABASE_URI'):
         app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI')
     elif os.getenv('DEV_DATABASE_URI'):
         app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DEV_DATABASE_URI')
 
+    # Metrics hooks go first so requests rejected by later hooks (rate limits) are still counted
+    metrics.init_app(app)
+    query_audit.init_app(app)
+    profiling.init_app(app)
+
     # Initialize extensions with app
     db.init_app(app)
-    migrate.init_app(app, db)
     jwt.init_app(app)
     limiter.init_app(app)
     CORS(app, supports_credentials=True, resources={
             r"/api/*": {
                 "origins": ["http://localhost:3000"],
                 "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-                "allow_headers": ["Content-Type", "Authorization", "X-CSRF-TOKEN"]
+                "allow_headers": ["Content-Type", "Authorization", "X-CSRF-TOKEN", "Idempotency-Key"]
             }
         })
     
+    sms.init_app(app)
+    passwords.init_app(app)
+    gateways.init_app(app)
+    devices.init_app(app)
+    usage.init_app(app)
+    conditional.init_app(app)
+    # Registered last so it runs first after the view, and request metrics include its cost
+    compression.init_app(app)
+
     # Register commands - this should come AFTER db initialization
     init_commands(app)  # This registers all your CLI commands
-    # Set up logging
-    if not app.debug:
-        handler = RotatingFileHandler('server.log', maxBytes=100000, backupCount=3)
-        handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        handler.setLevel(logging.INFO)
-        app.logger.addHandler(handler)
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('Internet Portal startup')
+    app.logger.info('Internet Portal startup')
 
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(payments_bp, url_prefix='/api/payments')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(gateway_bp, url_prefix='/api/gateway')
 
-    # Scheduler task to check for expired transactions
-    def check_expired_transactions():
-        with app.app_context():
-            expired_transactions = Transaction.query.filter(
-                Transaction.status == 'SUCCESSFUL',
-                Transaction.expiry <= datetime.utcnow()
-            ).all()
-            for tx in expired_transactions:
-                app.logger.info(f"Transaction expired: transaction_id={tx.transaction_id}, phone_number={tx.phone_number}")
-                disconnect_user(tx.phone_number)
-                tx.status = 'EXPIRED'
-                db.session.commit()
-
-    # Initialize and start the scheduler
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(check_expired_transactions, 'interval', minutes=1)
-    scheduler.start()
-
-    # Database initialization
-    with app.app_context():
-        try:
-            if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI']:
-                db.engine.connect()
-                app.logger.info("Connected to PostgreSQL database")
-            db.create_all()
-        except OperationalError as e:
-            app.logger.error(f"Database connection failed: {str(e)}")
-            app.logger.error("""
-                PostgreSQL database might not exist. Create it with:
-                sudo -u postgres createdb your_db_name
-                Then verify permissions for your application user""")
+    # No database work here: tables come from `flask db upgrade` (or `flask init-db`),
+    # so CLI commands, tests and worker boots do not wait on the database
 
     # Error handlers
+    @app.errorhandler(429)
+    def rate_limited(error):
+        return jsonify({"error": "Too many requests", "details": str(error.description)}), 429
+
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({"error": "Resource not found"}), 404
@@ -148,23 +124,18 @@ def create_app():
 
     return app
 
-def disconnect_user(phone_number):
-    """Placeholder function to disconnect user from Wi-Fi."""
-    current_app.logger.info(f"Disconnecting user: phone_number={phone_number}")
-    # TODO: Implement Wi-Fi disconnection logic here
-
 def payment_required(f):
     """Decorator to ensure user has an active package."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user_id = None
+        claims = {}
         try:
             verify_jwt_in_request()
-            user_id = get_jwt_identity()
+            claims = get_jwt()
         except:
             pass
 
-        phone_number = request.args.get('phone_number') or (User.query.get(user_id).phone_number if user_id else None)
+        phone_number = request.args.get('phone_number') or claims_phone_number(claims)
         if not phone_number:
             return jsonify({"error": "Phone number required"}), 400
 
@@ -174,27 +145,3 @@ def payment_required(f):
 
         return f(*args, **kwargs)
     return decorated_function
-
-def register_commands(app):
-    """Register CLI commands."""
-    from flask_migrate import Migrate
-    Migrate(app, db)
-    
-    
-# Placeholder function to disconnect user from Wi-Fi
-def disconnect_user(phone_number):
-    current_app.logger.info(f"Disconnecting user: phone_number={phone_number}")
-    try:
-        # Example: Call a router API to disconnect the user
-        # You may need to map phone_number to a MAC address or IP in your system
-        response = requests.post(
-            'http://router-ip:port/disconnect',
-            json={'phone_number': phone_number},
-            auth=('admin', 'password')  # Replace with your router credentials
-        )
-        response.raise_for_status()
-        current_app.logger.info(f"User disconnected successfully: phone_number={phone_number}")
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Failed to disconnect user: phone_number={phone_number}, error={str(e)}")
-        
-        
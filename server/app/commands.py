@@ -2,13 +2,12 @@
 import click
 from flask.cli import with_appcontext
 from flask import current_app
+from sqlalchemy.exc import OperationalError
 from app.extensions import db
 from app.models.user import User
 from app.models.admin import Admin
 import os
 from dotenv import load_dotenv
-import pyotp
-import qrcode
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +15,7 @@ load_dotenv()
 def display_qr_code(uri):
     """Display QR code in terminal or provide instructions."""
     try:
+        import qrcode  # Only admin creation needs it; keeps it off every app start
         qr = qrcode.QRCode()
         qr.add_data(uri)
         qr.print_ascii(tty=True)
@@ -25,8 +25,35 @@ def display_qr_code(uri):
         click.echo(f"Secret: {uri.split('secret=')[1].split('&')[0]}")
         click.echo(f"Or visit: https://qrcode.tec-it.com and paste this URL:\n{uri}")
 
+def bind_migrate():
+    """Bind Flask-Migrate to the current app on first use."""
+    from flask_migrate import Migrate
+    if 'migrate' not in current_app.extensions:
+        Migrate(current_app._get_current_object(), db)
+
+
+class LazyMigrateGroup(click.Group):
+    """`flask db`, loading Flask-Migrate and Alembic only when a db command runs.
+
+    Importing Alembic costs more than the rest of the app's imports put
+    together, and only migrations need it.
+    """
+
+    def _migrate_group(self):
+        from flask_migrate.cli import db as db_group
+        bind_migrate()
+        return db_group
+
+    def list_commands(self, ctx):
+        return self._migrate_group().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._migrate_group().get_command(ctx, name)
+
+
 def init_commands(app):
     """Register custom CLI commands with the Flask app."""
+    app.cli.add_command(LazyMigrateGroup('db', help='Perform database migrations.'))
 
     @app.cli.command("reset-db")
     @with_appcontext
@@ -55,7 +82,7 @@ def init_commands(app):
             
         except Exception as e:
             db.session.rollback()
-            current_app.logger.error(f"Database reset failed: {str(e)}")
+            current_app.logger.error("Database reset failed: %s", e)
             click.echo(f"❌ Error resetting database: {str(e)}", err=True)
 
     def seed_db_functional(admin_phone, admin_email, admin_username, admin_pass):
@@ -168,10 +195,21 @@ def init_commands(app):
     @app.cli.command("init-db")
     @with_appcontext
     def init_db():
-        """Initialize the database (create tables)."""
+        """Initialize the database (create tables) and mark it as migrated to the latest revision."""
         try:
             db.create_all()
             click.echo("✅ Database tables created")
+            # The migration chain assumes these tables already exist, so start it at head
+            from flask_migrate import stamp
+            bind_migrate()
+            stamp()
+            click.echo("✅ Migrations stamped at head")
+        except OperationalError as e:
+            click.echo(f"❌ Database connection failed: {str(e)}", err=True)
+            if 'postgresql' in current_app.config['SQLALCHEMY_DATABASE_URI']:
+                click.echo("PostgreSQL database might not exist. Create it with:\n"
+                           "  sudo -u postgres createdb your_db_name\n"
+                           "Then verify permissions for your application user", err=True)
         except Exception as e:
             click.echo(f"❌ Error initializing database: {str(e)}", err=True)
 
@@ -190,4 +228,40 @@ def init_commands(app):
         except Exception as e:
             db.session.rollback()
             click.echo(f"❌ Error seeding database: {str(e)}", err=True)
-            
\ No newline at end of file
+            
+    @app.cli.command("process-refunds")
+    @click.option('--batch-size', default=None, type=int, help='Refunds to submit in this run')
+    @with_appcontext
+    def process_refunds(batch_size):
+        """Submit due refunds from the refund queue once."""
+        from app.utils.refund_queue import process_refund_queue
+        try:
+            attempted = process_refund_queue(batch_size)
+            click.echo(f"✅ Processed {attempted} refund(s)")
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"❌ Error processing refunds: {str(e)}", err=True)
+
+    @app.cli.command("ingest-usage")
+    @click.argument('source', type=click.File('r'), default='-')
+    @click.option('--batch-size', default=10000, type=int, help='Counters handed to the aggregator at a time')
+    @with_appcontext
+    def ingest_usage(source, batch_size):
+        """Ingest byte counters from a file or stdin: one 'mac,bytes_in,bytes_out' line per client."""
+        from app.utils.usage import parse_counters, ingest_counters
+        accepted = rejected = 0
+        batch = []
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            batch.append(line.split(','))
+            if len(batch) >= batch_size:
+                rows, bad = parse_counters(batch)
+                ingest_counters(rows)
+                accepted, rejected, batch = accepted + len(rows), rejected + bad, []
+        rows, bad = parse_counters(batch)
+        ingest_counters(rows)
+        accepted, rejected = accepted + len(rows), rejected + bad
+        devices = current_app.extensions['usage'].flush()
+        click.echo(f"✅ Ingested {accepted} counter(s) for {devices} device(s), rejected {rejected}")
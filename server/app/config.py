@@ -11,11 +11,149 @@ class Config:
     SQLALCHEMY_ECHO = False  # Disable SQL query logging in production
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-jwt-secret-key')
 
+    # Logging: records are queued and written by a background listener.
+    # LOG_LEVELS sets per-module levels, e.g. "app.routes.payments=DEBUG,werkzeug=WARNING"
+    LOG_FILE = os.getenv('LOG_FILE', 'server.log')  # Empty to log to stderr only
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text or json
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+    LOG_TO_STDERR = os.getenv('LOG_TO_STDERR', 'true').lower() == 'true'
+
+    # Prometheus metrics. Under Gunicorn, also set PROMETHEUS_MULTIPROC_DIR so workers are aggregated
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+    # Scrapes must send "Authorization: Bearer <token>"; without one /metrics answers 503 outside debug mode
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Per-request SQL audit (debugging and tests): X-Query-Count/X-DB-Time headers, N+1 warnings, query budgets.
+    # QUERY_BUDGETS overrides the default per endpoint, e.g. "payments.get_payment_history=2,admin.get_devices=3"
+    QUERY_AUDIT_ENABLED = os.getenv('QUERY_AUDIT_ENABLED', 'false').lower() == 'true'
+    QUERY_AUDIT_REPEAT_THRESHOLD = int(os.getenv('QUERY_AUDIT_REPEAT_THRESHOLD', 5))
+    QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 0))  # 0 for no default budget
+    QUERY_BUDGETS = os.getenv('QUERY_BUDGETS', '')
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false').lower() == 'true'  # Always on under TESTING
+
+    # On-demand request profiling (admin X-Profile header or /api/admin/profiling) and tracemalloc reports
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 3600))  # Longest an armed sampling window may run
+
+    # Response encoding: 'orjson' (falls back to 'stdlib' when orjson is missing). Datetimes go out as ISO 8601
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+
+    # Response compression (brotli when installed, else gzip) for JSON and text bodies of at least COMPRESS_MIN_BYTES
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))  # 0-11; higher is smaller but much slower
+
     # Mobile money API credentials (replace with actual provider details)
     MOMO_API_USER_ID = os.getenv('MOMO_API_USER_ID')
     MOMO_API_KEY = os.getenv('MOMO_API_KEY', 'sandbox-key')
     MOMO_API_SECRET = os.getenv('MOMO_API_SECRET', 'sandbox-secret')
     MOMO_BASE_URL = os.getenv('MOMO_BASE_URL', 'https://sandbox.momoapi.com')
+    MOMO_POOL_SIZE = int(os.getenv('MOMO_POOL_SIZE', 100))  # Keep-alive connections kept per process
+
+    # Short-lived key-value store ('memory://' for one node, 'redis://...' when shared)
+    TTL_STORE_URL = os.getenv('TTL_STORE_URL', 'memory://')
+
+    # Payment retry protection
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400))
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+    PENDING_PAYMENT_DEDUP_SECONDS = int(os.getenv('PENDING_PAYMENT_DEDUP_SECONDS', 300))
+
+    # Verification result caching; 0 disables caching of that kind of result
+    VERIFY_PENDING_CACHE_SECONDS = int(os.getenv('VERIFY_PENDING_CACHE_SECONDS', 5))
+    VERIFY_TERMINAL_CACHE_SECONDS = int(os.getenv('VERIFY_TERMINAL_CACHE_SECONDS', 300))
+
+    # Background refund worker
+    REFUND_QUEUE_INTERVAL_SECONDS = int(os.getenv('REFUND_QUEUE_INTERVAL_SECONDS', 30))
+    REFUND_BATCH_SIZE = int(os.getenv('REFUND_BATCH_SIZE', 20))
+    REFUND_MAX_ATTEMPTS = int(os.getenv('REFUND_MAX_ATTEMPTS', 8))
+    REFUND_RETRY_BASE_SECONDS = int(os.getenv('REFUND_RETRY_BASE_SECONDS', 30))
+    REFUND_RETRY_MAX_SECONDS = int(os.getenv('REFUND_RETRY_MAX_SECONDS', 3600))
+
+    # Outgoing SMS ('twilio' or 'console'; unset means twilio, or console in debug mode without credentials)
+    SMS_BACKEND = os.getenv('SMS_BACKEND')
+    SMS_WORKERS = int(os.getenv('SMS_WORKERS', 2))
+    SMS_QUEUE_SIZE = int(os.getenv('SMS_QUEUE_SIZE', 1000))
+    SMS_RESEND_INTERVAL_SECONDS = int(os.getenv('SMS_RESEND_INTERVAL_SECONDS', 60))
+
+    # Phone verification codes (kept in the TTL store, not the users table)
+    OTP_TTL_SECONDS = int(os.getenv('OTP_TTL_SECONDS', 300))
+    OTP_MAX_ATTEMPTS = int(os.getenv('OTP_MAX_ATTEMPTS', 5))
+
+    # Password hashing work factors; existing hashes are upgraded on next login
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', 1000000))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 0)) or None  # None = CPU count
+    PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 32))
+    PASSWORD_HASH_TIMEOUT_SECONDS = int(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', 10))
+
+    # Token revocation check; 0 disables it and trusts JWT claims until expiry
+    PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', 1024))
+    PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv('PRINCIPAL_CACHE_TTL_SECONDS', 60))
+
+    # Rate limiting: memory:// is per process; use redis://... when several workers or nodes share budgets
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URL') or (
+        'redis://localhost:6379' if os.getenv('FLASK_ENV') == 'production' else 'memory://'
+    )
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter')
+    RATELIMIT_HEADERS_ENABLED = True
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True  # Keep limiting locally if Redis goes away
+    RATELIMIT_TRUST_CLIENT_MAC = os.getenv('RATELIMIT_TRUST_CLIENT_MAC', 'true').lower() == 'true'  # Gateway-attested MACs only
+    RATELIMIT_LOGIN = os.getenv('RATELIMIT_LOGIN', '5 per minute;30 per hour')
+    RATELIMIT_VERIFY_PHONE = os.getenv('RATELIMIT_VERIFY_PHONE', '3 per minute;10 per hour')
+    RATELIMIT_ACTIVATE_CODE = os.getenv('RATELIMIT_ACTIVATE_CODE', '10 per minute;50 per hour')
+    RATELIMIT_CHECK_CODE = os.getenv('RATELIMIT_CHECK_CODE', '30 per minute;300 per hour')
+    RATELIMIT_INITIATE = os.getenv('RATELIMIT_INITIATE', '5 per minute;30 per hour')
+    RATELIMIT_HEARTBEAT = os.getenv('RATELIMIT_HEARTBEAT', '30 per minute')
+
+    # Voucher guessing lockouts (kept in the TTL store)
+    LOCKOUT_MAC_THRESHOLD = int(os.getenv('LOCKOUT_MAC_THRESHOLD', 5))
+    LOCKOUT_FAILURE_WINDOW_SECONDS = int(os.getenv('LOCKOUT_FAILURE_WINDOW_SECONDS', 900))
+    LOCKOUT_BASE_SECONDS = int(os.getenv('LOCKOUT_BASE_SECONDS', 60))
+    LOCKOUT_MAX_SECONDS = int(os.getenv('LOCKOUT_MAX_SECONDS', 86400))
+    LOCKOUT_LEVEL_DECAY_SECONDS = int(os.getenv('LOCKOUT_LEVEL_DECAY_SECONDS', 86400))
+
+    # Gateway-facing endpoints (send as X-Gateway-Token; unset closes them outside debug mode)
+    GATEWAY_API_TOKEN = os.getenv('GATEWAY_API_TOKEN')
+    # Comma-separated addresses of gateways proxying portal traffic; X-Client-MAC from them is trusted without the token
+    GATEWAY_TRUSTED_ADDRESSES = os.getenv('GATEWAY_TRUSTED_ADDRESSES', '')
+    ACCESS_CHECK_BATCH_MAX = int(os.getenv('ACCESS_CHECK_BATCH_MAX', 1000))
+    ENTITLEMENT_FEED_MAX_LIMIT = int(os.getenv('ENTITLEMENT_FEED_MAX_LIMIT', 5000))
+    ENTITLEMENT_FEED_SETTLE_SECONDS = int(os.getenv('ENTITLEMENT_FEED_SETTLE_SECONDS', 2))
+    ENTITLEMENT_FEED_RETENTION_DAYS = int(os.getenv('ENTITLEMENT_FEED_RETENTION_DAYS', 7))
+
+    # Gateway drivers used to authorize and kick devices: loopback, ndsctl or http.
+    # GATEWAY_TARGETS is comma-separated: ssh destinations (or 'local') for ndsctl, base URLs for http
+    GATEWAY_DRIVER = os.getenv('GATEWAY_DRIVER', 'loopback')
+    GATEWAY_TARGETS = os.getenv('GATEWAY_TARGETS', '')
+    GATEWAY_DRIVER_TOKEN = os.getenv('GATEWAY_DRIVER_TOKEN')
+    GATEWAY_DRIVER_TIMEOUT = int(os.getenv('GATEWAY_DRIVER_TIMEOUT', 10))
+    GATEWAY_NDSCTL_PATH = os.getenv('GATEWAY_NDSCTL_PATH', 'ndsctl')
+
+    # Device index filled from X-Client-MAC; sightings are coalesced and upserted in batches
+    DEVICE_FLUSH_INTERVAL_SECONDS = int(os.getenv('DEVICE_FLUSH_INTERVAL_SECONDS', 5))
+    DEVICE_FLUSH_BATCH_SIZE = int(os.getenv('DEVICE_FLUSH_BATCH_SIZE', 500))
+
+    # Heartbeats and idle disconnects (SESSION_IDLE_TIMEOUT_SECONDS=0 disables kicking idle devices)
+    HEARTBEAT_BATCH_MAX = int(os.getenv('HEARTBEAT_BATCH_MAX', 5000))
+    SESSION_IDLE_TIMEOUT_SECONDS = int(os.getenv('SESSION_IDLE_TIMEOUT_SECONDS', 0))
+    IDLE_CHECK_INTERVAL_SECONDS = int(os.getenv('IDLE_CHECK_INTERVAL_SECONDS', 60))
+    IDLE_DISCONNECT_BATCH_SIZE = int(os.getenv('IDLE_DISCONNECT_BATCH_SIZE', 1000))
+    DEVICE_REAUTH_CHECK_SECONDS = int(os.getenv('DEVICE_REAUTH_CHECK_SECONDS', 30))  # Entitlement lookups per unauthorized device
+    ACTIVE_SESSION_WINDOW_SECONDS = int(os.getenv('ACTIVE_SESSION_WINDOW_SECONDS', 300))
+
+    # Data-usage counters from gateways, summed in memory and added to open usage sessions every flush interval
+    USAGE_FLUSH_INTERVAL_SECONDS = int(os.getenv('USAGE_FLUSH_INTERVAL_SECONDS', 5))
+    USAGE_BATCH_MAX = int(os.getenv('USAGE_BATCH_MAX', 50000))
+
+    # Signed access tickets checked offline by the gateway (unset secret disables them)
+    ACCESS_TICKET_SECRET = os.getenv('ACCESS_TICKET_SECRET')
+    ACCESS_TICKET_MAX_SECONDS = int(os.getenv('ACCESS_TICKET_MAX_SECONDS', 86400))
 
 class DevelopmentConfig(Config):
     """Development-specific configuration."""
@@ -1,3 +1,9 @@
 # app/extensions.py
 from flask_sqlalchemy import SQLAlchemy
+from flask_limiter import Limiter
+from app.utils.rate_limit import client_key
+
 db = SQLAlchemy()
+
+# Single limiter for the whole app; storage and strategy come from RATELIMIT_* config
+limiter = Limiter(key_func=client_key)
@@ -1,3 +1,7 @@
 from .user import User
 from .transaction import Transaction
-from .access_code import AccessCode  # Add this line
\ No newline at end of file
+from .access_code import AccessCode  # Add this line
+from .refund import Refund
+from .entitlement_change import EntitlementChange
+from .device import Device
+from .session_usage import SessionUsage
@@ -1,8 +1,11 @@
 from app.extensions import db
+from app.utils.serializers import RowListing
 from datetime import datetime
 
-class AccessCode(db.Model):
+class AccessCode(RowListing, db.Model):
     __tablename__ = 'access_codes'
+    LISTING_COLUMNS = ('id', 'code', 'plan_id', 'duration_hours', 'price', 'status', 'mac_address',
+                       'created_at', 'used_at', 'activated_at', 'expiry')
 
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(12), unique=True, nullable=False, index=True)  # Random 12-character code
@@ -10,7 +13,7 @@ class AccessCode(db.Model):
     duration_hours = db.Column(db.Integer, nullable=False)  # Duration in hours (e.g., 1, 24, 168)
     price = db.Column(db.Float, nullable=False)  # Price of the plan
     status = db.Column(db.String(20), nullable=False, default='unused')  # 'unused', 'activated', 'expired'
-    mac_address = db.Column(db.String(17), nullable=True)  # MAC address of the device
+    mac_address = db.Column(db.String(17), nullable=True, index=True)  # MAC address of the device
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     used_at = db.Column(db.DateTime, nullable=True)  # When the code was used
     activated_at = db.Column(db.DateTime, nullable=True)  # When the code was activated
@@ -1,6 +1,6 @@
 from app.extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
-import pyotp
+from app.utils.passwords import pbkdf2_hasher
+from app.utils.principals import invalidate_principal
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,26 +14,37 @@ class Admin(db.Model):
     is_admin = db.Column(db.Boolean, default=True)
     is_superuser = db.Column(db.Boolean, default=False)
     otp_secret = db.Column(db.String(32), nullable=True)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bump to revoke issued JWTs
+
+    @staticmethod
+    def password_hasher():
+        """PBKDF2 hasher using the configured PBKDF2_ITERATIONS."""
+        return pbkdf2_hasher()
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(
-            password,
-            method='pbkdf2:sha256',
-            salt_length=16
-        )
+        self.password_hash = self.password_hasher().hash(password)
+        self.revoke_tokens()
+
+    def revoke_tokens(self):
+        """Invalidate every JWT issued before this call."""
+        self.token_version = (self.token_version or 0) + 1
+        if self.id is not None:
+            invalidate_principal('admin', self.id)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return self.password_hasher().verify(self.password_hash, password)
     
     def generate_otp_secret(self):
         """Generate a new TOTP secret if none exists."""
         if not self.otp_secret:
+            import pyotp
             self.otp_secret = pyotp.random_base32()
             return self.otp_secret
         return self.otp_secret
 
     def get_totp_uri(self):
         """Generate a TOTP URI for QR code generation."""
+        import pyotp
         return pyotp.totp.TOTP(self.otp_secret).provisioning_uri(
             name=self.username,
             issuer_name='InternetPortal'
@@ -41,12 +52,23 @@ class Admin(db.Model):
 
     def verify_totp(self, token):
         """Verify a TOTP token."""
-        logger.debug(f"Inside verify_totp: token={token}, otp_secret={self.otp_secret}")
+        logger.debug("Inside verify_totp: token=%s, otp_secret=%s", token, self.otp_secret)
+        import pyotp
         totp = pyotp.TOTP(self.otp_secret)
         result = totp.verify(token, valid_window=1)
-        logger.debug(f"TOTP verification result: {result}")
+        logger.debug("TOTP verification result: %s", result)
         return result
 
+    def token_claims(self):
+        """Claims carried in the admin JWT so admin routes need no lookup."""
+        return {
+            'principal': 'admin',
+            'role': 'admin',
+            'is_admin': True,
+            'username': self.username,
+            'tv': self.token_version or 0
+        }
+
     def to_dict(self):
         return {
             'id': self.id,
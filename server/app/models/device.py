@@ -0,0 +1,30 @@
+from app.extensions import db
+from datetime import datetime
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class Device(db.Model):
+    """A client device seen behind the gateway, and the phone number last used on it."""
+    __tablename__ = 'devices'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mac_address = db.Column(db.String(17), unique=True, nullable=False, index=True)  # Normalised aa:bb:cc:dd:ee:ff
+    phone_number = db.Column(db.String(15), nullable=True, index=True)
+    first_seen = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    disconnected_at = db.Column(db.DateTime, nullable=True)  # Last idle-timeout kick; re-armed by a later sighting
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mac_address': self.mac_address,
+            'phone_number': self.phone_number,
+            'first_seen': self.first_seen.isoformat() if self.first_seen else None,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'disconnected_at': self.disconnected_at.isoformat() if self.disconnected_at else None
+        }
+
+    def __repr__(self):
+        return f'<Device mac={self.mac_address} phone={self.phone_number}>'
@@ -0,0 +1,36 @@
+from app.extensions import db
+from datetime import datetime
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class EntitlementChange(db.Model):
+    """Append-only log of access grants and exclusions; the id is the gateway sync cursor."""
+    __tablename__ = 'entitlement_changes'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    op = db.Column(db.String(10), nullable=False)  # grant, revoke, exclude, unexclude
+    subject_type = db.Column(db.String(10), nullable=False)  # phone, mac, code
+    subject = db.Column(db.String(50), nullable=False)
+    expiry = db.Column(db.DateTime, nullable=True)  # For grants: when access ends
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    @classmethod
+    def record(cls, op, subject_type, subject, expiry=None):
+        """Add a change to the current session; it is committed with the caller's change."""
+        change = cls(op=op, subject_type=subject_type, subject=subject, expiry=expiry)
+        db.session.add(change)
+        return change
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'op': self.op,
+            'type': self.subject_type,
+            'value': self.subject,
+            'expiry': self.expiry.isoformat() if self.expiry else None
+        }
+
+    def __repr__(self):
+        return f'<EntitlementChange id={self.id} op={self.op} {self.subject_type}={self.subject}>'
@@ -1,7 +1,9 @@
 from app.extensions import db
+from app.utils.serializers import RowListing
 
-class Exclusion(db.Model):
+class Exclusion(RowListing, db.Model):
     __tablename__ = 'exclusions'
+    LISTING_COLUMNS = ('id', 'type', 'value', 'reason', 'exclude_from_payment', 'exclude_from_connection')
 
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(20), nullable=False)  # 'PHONE' or 'MAC'
@@ -0,0 +1,37 @@
+from app.extensions import db
+from sqlalchemy.sql import func
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class Refund(db.Model):
+    """Queued refund for a failed payment, processed by the background worker."""
+    __tablename__ = 'refunds'
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.String(36), unique=True, nullable=False)  # One refund per transaction
+    reference_id = db.Column(db.String(36), unique=True, nullable=False)  # X-Reference-Id reused on every retry
+    amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='PENDING')  # PENDING, SUCCEEDED, FAILED
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'transaction_id': self.transaction_id,
+            'amount': self.amount,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+    def __repr__(self):
+        return f'<Refund transaction_id={self.transaction_id} status={self.status}>'
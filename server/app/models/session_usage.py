@@ -0,0 +1,39 @@
+from app.extensions import db
+from datetime import datetime
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class SessionUsage(db.Model):
+    """Bytes used by a device on its current entitlement, and the bundle's cap if it has one.
+
+    Devices sharing an entitlement share its cap: usage is summed per session_key.
+    """
+    __tablename__ = 'session_usage'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mac_address = db.Column(db.String(17), unique=True, nullable=False, index=True)
+    session_key = db.Column(db.String(40), nullable=True, index=True)  # 'tx:<transaction_id>' or 'code:<code>'
+    bytes_in = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_out = db.Column(db.BigInteger, nullable=False, default=0)
+    quota_bytes = db.Column(db.BigInteger, nullable=True)  # None for time-only packages
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    exceeded_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mac_address': self.mac_address,
+            'session_key': self.session_key,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'quota_bytes': self.quota_bytes,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'exceeded_at': self.exceeded_at.isoformat() if self.exceeded_at else None
+        }
+
+    def __repr__(self):
+        return f'<SessionUsage mac={self.mac_address} used={self.bytes_in + self.bytes_out}>'
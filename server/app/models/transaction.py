@@ -1,13 +1,20 @@
 from app.extensions import db
 from sqlalchemy.sql import func
+from app.utils.serializers import RowListing
 import logging
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class Transaction(db.Model):
+class Transaction(RowListing, db.Model):
     """Transaction model for payment records."""
     __tablename__ = 'transactions'
+    LISTING_COLUMNS = ('id', 'phone_number', 'package_id', 'amount', 'transaction_id', 'status', 'expiry',
+                       'created_at', 'completed_at')
+    __table_args__ = (
+        # Covers the active-package lookups done by access checks
+        db.Index('ix_transactions_phone_status_expiry', 'phone_number', 'status', 'expiry'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     phone_number = db.Column(db.String(15), nullable=False, index=True)
@@ -18,6 +25,7 @@ class Transaction(db.Model):
     expiry = db.Column(db.DateTime, nullable=True)  # Package expiry time
     created_at = db.Column(db.DateTime, server_default=func.now())
     completed_at = db.Column(db.DateTime, nullable=True)
+    mac_address = db.Column(db.String(17), nullable=True)  # Device that started the purchase (X-Client-MAC at /initiate)
 
     def to_dict(self):
         return {
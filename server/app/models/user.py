@@ -1,14 +1,18 @@
 from app.extensions import db
 from sqlalchemy.sql import func
-import bcrypt
+from app.utils.passwords import bcrypt_hasher
+from app.utils.principals import invalidate_principal
+from app.utils.serializers import RowListing
 import logging
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class User(db.Model):
+class User(RowListing, db.Model):
     """User model for registered and anonymous users."""
     __tablename__ = 'users'
+    LISTING_COLUMNS = ('id', 'phone_number', 'email', 'is_admin', 'is_superuser', 'is_phone_verified',
+                       'created_at', 'updated_at')
 
     id = db.Column(db.Integer, primary_key=True)
     phone_number = db.Column(db.String(15), unique=True, nullable=False)
@@ -17,22 +21,45 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
     is_superuser = db.Column(db.Boolean, default=False, nullable=False)
     is_phone_verified = db.Column(db.Boolean, default=False, nullable=False)
-    otp = db.Column(db.String(6), nullable=True)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bump to revoke issued JWTs
+    otp = db.Column(db.String(6), nullable=True)  # Unused: OTPs now live in the TTL store (app/utils/otp_store.py)
     otp_expiry = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, server_default=func.now())
     updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
     dummy_field = db.Column(db.String(50), nullable=True)  # Add this line
 
+    @staticmethod
+    def password_hasher():
+        """bcrypt hasher using the configured BCRYPT_ROUNDS."""
+        return bcrypt_hasher()
+
     def set_password(self, password):
         """Hash and set the user's password."""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        logger.debug(f"Password set for user: phone={self.phone_number}")
+        self.password_hash = self.password_hasher().hash(password)
+        self.revoke_tokens()
+        logger.debug("Password set for user: phone=%s", self.phone_number)
+
+    def revoke_tokens(self):
+        """Invalidate every JWT issued before this call."""
+        self.token_version = (self.token_version or 0) + 1
+        if self.id is not None:
+            invalidate_principal('user', self.id)
+
+    def token_claims(self):
+        """Claims carried in the user JWT so hot-path routes need no lookup."""
+        return {
+            'principal': 'user',
+            'role': 'admin' if self.is_admin else 'user',
+            'is_admin': bool(self.is_admin),
+            'phone_number': self.phone_number,
+            'tv': self.token_version or 0
+        }
 
     def check_password(self, password):
-        """Verify the user's password."""
+        """Verify the user's password on the calling thread (see app.utils.passwords.verify_password)."""
         if not self.password_hash:
             return False
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return self.password_hasher().verify(self.password_hash, password)
 
     def __repr__(self):
         return f'<User phone={self.phone_number} email={self.email}>'
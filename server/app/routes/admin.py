@@ -1,13 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_from_directory
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from app.models.admin import Admin
 from app.models.exclusion import Exclusion
 from app.models.transaction import Transaction
 from app.models.user import User
+from app.models.device import Device
+from app.models.access_code import AccessCode
 from app.extensions import db
+from app.utils.passwords import verify_password, PasswordPoolBusy
+from app.utils.decorators import portal_admin_required
+from app.utils.lockout import active_lockouts, clear_lockout
+from app.utils.entitlements import record_exclusion
+from app.utils.tickets import revoke_tickets, restore_tickets
+from app.utils.gateways import get_gateway, deauthorize_clients
+from app.utils.rate_limit import normalize_mac
+from app.utils.devices import active_device_count
+from app.utils import profiling
+from app.utils.conditional import conditional
 import logging
+import os
 from datetime import timedelta
-import pyotp
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.exceptions import BadRequest
 
@@ -34,24 +46,27 @@ def admin_login():
         
         admin = Admin.query.filter_by(username=data['username']).first()
         if not admin:
-            logger.warning(f"Admin login attempt failed: Admin not found for username={data['username']}")
+            logger.warning("Admin login attempt failed: Admin not found for username=%s", data['username'])
             return jsonify({"error": "Invalid credentials"}), 401
-        if not admin.check_password(data['password']):
-            logger.warning(f"Admin login attempt failed: Invalid password for username={data['username']}")
+        if not verify_password(admin, data['password']):
+            logger.warning("Admin login attempt failed: Invalid password for username=%s", data['username'])
             return jsonify({"error": "Invalid credentials"}), 401
 
         # Generate a temporary token for TOTP verification
         temp_token = create_access_token(identity=admin.id, expires_delta=timedelta(minutes=5))
-        logger.info(f"Admin login attempt: Username/password verified for username={admin.username}, temp token issued")
+        logger.info("Admin login attempt: Username/password verified for username=%s, temp token issued", admin.username)
         return jsonify({"message": "Username and password verified", "temp_token": temp_token}), 200
+    except PasswordPoolBusy:
+        logger.warning("Admin login rejected: password hashing pool is saturated")
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
     except BadRequest:
         logger.error("Admin login error: Invalid JSON payload")
         return jsonify({"error": "Invalid JSON payload"}), 400
     except SQLAlchemyError as e:
-        logger.error(f"Admin login error: Database error - {str(e)}")
+        logger.error("Admin login error: Database error - %s", e)
         return jsonify({"error": "Database error occurred"}), 500
     except Exception as e:
-        logger.error(f"Admin login error: Unexpected error - {str(e)}")
+        logger.error("Admin login error: Unexpected error - %s", e)
         return jsonify({"error": "Internal server error"}), 500
     
     
@@ -64,7 +79,7 @@ def verify_totp():
         # CHANGED: Simplified JWT identity extraction
         admin = Admin.query.get(get_jwt_identity())
         if not admin:
-            logger.warning(f"Admin TOTP verification failed: Admin not found")
+            logger.warning("Admin TOTP verification failed: Admin not found")
             return jsonify({"error": "Admin not found"}), 404
 
         # CHANGED: Removed silent=True for stricter JSON parsing
@@ -74,7 +89,7 @@ def verify_totp():
             return jsonify({"error": "TOTP code is required"}), 400
 
         totp_code = data['totp_code'].strip()
-        logger.debug(f"Verifying TOTP for {admin.username}")
+        logger.debug("Verifying TOTP for %s", admin.username)
         
         if not admin.otp_secret:
             logger.error("Admin TOTP verification failed: No TOTP secret set")
@@ -88,7 +103,7 @@ def verify_totp():
         access_token = create_access_token(
             identity=admin.id,
             expires_delta=timedelta(days=1),
-            additional_claims={"is_admin": True}
+            additional_claims=admin.token_claims()
         )
         
         response_data = {
@@ -116,44 +131,34 @@ def verify_totp():
         logger.error("Invalid JSON payload in TOTP verification")
         return jsonify({"error": "Invalid request format"}), 400
     except SQLAlchemyError as e:
-        logger.error(f"Database error during TOTP verification: {str(e)}")
+        logger.error("Database error during TOTP verification: %s", e)
         return jsonify({"error": "Database error"}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in TOTP verification: {str(e)}")
+        logger.error("Unexpected error in TOTP verification: %s", e)
         return jsonify({"error": "Internal server error"}), 500
     
 
 @admin_bp.route('/exclusions', methods=['GET'])
-@jwt_required()
+@portal_admin_required
+@conditional(tables=('exclusions',))
 def get_exclusions():
     """Get all exclusions."""
     try:
-        admin_id = get_jwt_identity()
-        admin = Admin.query.get(admin_id)
-        if not admin:
-            logger.warning(f"Exclusions fetch failed: Admin not found for id={admin_id}")
-            return jsonify({"error": "Admin not found"}), 404
-
-        exclusions = Exclusion.query.all()
-        return jsonify({"exclusions": [e.to_dict() for e in exclusions]}), 200
+        return jsonify({"exclusions": Exclusion.listing()}), 200
     except Exception as e:
-        logger.error(f"Exclusions fetch error: {str(e)}")
+        logger.error("Exclusions fetch error: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 @admin_bp.route('/exclusions', methods=['POST'])
-@jwt_required()
+@portal_admin_required
 def add_exclusion():
     """Add a new exclusion."""
     try:
-        admin_id = get_jwt_identity()
-        admin = Admin.query.get(admin_id)
-        if not admin:
-            logger.warning(f"Exclusion add failed: Admin not found for id={admin_id}")
-            return jsonify({"error": "Admin not found"}), 404
+        admin_username = get_jwt().get('username')
 
         data = request.get_json()
         if not data or not data.get('type') or not data.get('value'):
-            logger.warning(f"Exclusion add failed: Missing type or value for admin={admin.username}")
+            logger.warning("Exclusion add failed: Missing type or value for admin=%s", admin_username)
             return jsonify({"error": "Type and value are required"}), 400
 
         exclusion = Exclusion(
@@ -164,82 +169,248 @@ def add_exclusion():
             exclude_from_connection=data.get('exclude_from_connection', False)
         )
         db.session.add(exclusion)
+        record_exclusion(exclusion)
         db.session.commit()
-        logger.info(f"Exclusion added: type={exclusion.type}, value={exclusion.value}, admin={admin.username}")
+        if exclusion.exclude_from_connection:
+            revoke_tickets(exclusion.type.lower(), exclusion.value)
+            if exclusion.type.upper() == 'MAC':
+                deauthorize_clients(mac_addresses=[exclusion.value])
+            else:
+                deauthorize_clients(phone_numbers=[exclusion.value])
+        logger.info("Exclusion added: type=%s, value=%s, admin=%s", exclusion.type, exclusion.value, admin_username)
         return jsonify(exclusion.to_dict()), 201
     except Exception as e:
-        logger.error(f"Exclusion add error: {str(e)}")
+        logger.error("Exclusion add error: %s", e)
         db.session.rollback()
         return jsonify({"error": "Internal server error"}), 500
 
 @admin_bp.route('/exclusions/<int:exclusion_id>', methods=['DELETE'])
-@jwt_required()
+@portal_admin_required
 def delete_exclusion(exclusion_id):
     """Delete an exclusion."""
     try:
-        admin_id = get_jwt_identity()
-        admin = Admin.query.get(admin_id)
-        if not admin:
-            logger.warning(f"Exclusion delete failed: Admin not found for id={admin_id}")
-            return jsonify({"error": "Admin not found"}), 404
+        admin_username = get_jwt().get('username')
 
         exclusion = Exclusion.query.get(exclusion_id)
         if not exclusion:
-            logger.warning(f"Exclusion delete failed: Exclusion not found for id={exclusion_id}, admin={admin.username}")
+            logger.warning("Exclusion delete failed: Exclusion not found for id=%s, admin=%s", exclusion_id, admin_username)
             return jsonify({"error": "Exclusion not found"}), 404
 
         db.session.delete(exclusion)
+        record_exclusion(exclusion, removed=True)
         db.session.commit()
-        logger.info(f"Exclusion deleted: id={exclusion_id}, admin={admin.username}")
+        if exclusion.exclude_from_connection:
+            restore_tickets(exclusion.type.lower(), exclusion.value)
+        logger.info("Exclusion deleted: id=%s, admin=%s", exclusion_id, admin_username)
         return jsonify({"message": "Exclusion deleted"}), 200
     except Exception as e:
-        logger.error(f"Exclusion delete error: {str(e)}")
+        logger.error("Exclusion delete error: %s", e)
         db.session.rollback()
         return jsonify({"error": "Internal server error"}), 500
 
 @admin_bp.route('/transactions', methods=['GET'])
-@jwt_required()
+@portal_admin_required
+@conditional(tables=('transactions',))
 def get_transactions():
     """Get all transactions."""
     try:
-        admin_id = get_jwt_identity()
-        admin = Admin.query.get(admin_id)
-        if not admin:
-            logger.warning(f"Transactions fetch failed: Admin not found for id={admin_id}")
-            return jsonify({"error": "Admin not found"}), 404
-
-        transactions = Transaction.query.all()
-        return jsonify({"transactions": [t.to_dict() for t in transactions]}), 200
+        return jsonify({"transactions": Transaction.listing()}), 200
     except Exception as e:
-        logger.error(f"Transactions fetch error: {str(e)}")
+        logger.error("Transactions fetch error: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 @admin_bp.route('/users', methods=['GET'])
-@jwt_required()
+@portal_admin_required
+@conditional(tables=('users',))
 def get_users():
     """Get all users."""
     try:
-        admin_id = get_jwt_identity()
-        admin = Admin.query.get(admin_id)
-        if not admin:
-            logger.warning(f"Users fetch failed: Admin not found for id={admin_id}")
-            return jsonify({"error": "Admin not found"}), 404
+        return jsonify({"users": User.listing()}), 200
+    except Exception as e:
+        logger.error("Users fetch error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
 
-        users = User.query.all()
-        return jsonify({"users": [u.to_dict() for u in users]}), 200
+@admin_bp.route('/access-codes', methods=['GET'])
+@portal_admin_required
+@conditional(tables=('access_codes',))
+def get_access_codes():
+    """Access codes, newest first, optionally only those with one status."""
+    try:
+        statement = AccessCode.listing_select().order_by(AccessCode.id.desc())
+        if request.args.get('status'):
+            statement = statement.where(AccessCode.status == request.args['status'])
+        statement = statement.limit(min(request.args.get('limit', 1000, type=int), 10000))
+        return jsonify({"access_codes": AccessCode.listing(statement)}), 200
     except Exception as e:
-        logger.error(f"Users fetch error: {str(e)}")
+        logger.error("Access codes fetch error: %s", e)
         return jsonify({"error": "Internal server error"}), 500
     
 @admin_bp.route('/me', methods=['GET'])
-@jwt_required()
+@portal_admin_required
+@conditional(key=lambda: (get_jwt_identity(), get_jwt().get('username')))
 def get_admin():
     """Get current admin's details."""
     admin_id = get_jwt_identity()
-    admin = Admin.query.get(admin_id)
-    if not admin:
-        logger.warning(f"Admin fetch failed: admin_id={admin_id}")
-        return jsonify({"error": "Admin not found"}), 404
+    logger.info("Current admin fetched: admin_id=%s", admin_id)
+    return jsonify({"admin": {"id": admin_id, "username": get_jwt().get('username')}}), 200
+
+
+@admin_bp.route('/lockouts', methods=['GET'])
+@portal_admin_required
+def get_lockouts():
+    """List devices and IPs currently locked out of code activation."""
+    try:
+        return jsonify({"lockouts": active_lockouts()}), 200
+    except Exception as e:
+        logger.error("Lockouts fetch error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/lockouts/<path:key>', methods=['DELETE'])
+@portal_admin_required
+def delete_lockout(key):
+    """Lift a lockout early, e.g. for a customer who mistyped their voucher."""
+    try:
+        clear_lockout(key)
+        logger.info("Lockout cleared: key=%s, admin=%s", key, get_jwt().get('username'))
+        return jsonify({"message": "Lockout cleared"}), 200
+    except Exception as e:
+        logger.error("Lockout clear error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/tickets/revoke', methods=['POST'])
+@portal_admin_required
+def revoke_access_tickets():
+    """Revoke one access ticket (jti) or every ticket for a mac/phone/code."""
+    data = request.get_json(silent=True) or {}
+    if not data.get('jti') and not (data.get('type') in ('mac', 'phone', 'code') and data.get('value')):
+        return jsonify({"error": "Provide jti, or type (mac, phone or code) and value"}), 400
+    try:
+        entry = revoke_tickets(data.get('type'), data.get('value'), jti=data.get('jti'))
+        if not entry:
+            return jsonify({"error": "Invalid value"}), 400
+        logger.info("Access tickets revoked: entry=%s, admin=%s", entry, get_jwt().get('username'))
+        return jsonify({"message": "Tickets revoked", "entry": entry}), 200
+    except Exception as e:
+        logger.error("Ticket revoke error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/devices', methods=['GET'])
+@portal_admin_required
+@conditional(tables=('devices',))
+def get_devices():
+    """Devices seen behind the gateway, optionally for one phone number or MAC."""
+    try:
+        query = Device.query
+        if request.args.get('phone_number'):
+            query = query.filter_by(phone_number=request.args['phone_number'])
+        if request.args.get('mac_address'):
+            query = query.filter_by(mac_address=normalize_mac(request.args['mac_address']))
+        devices = query.order_by(Device.last_seen.desc()).limit(request.args.get('limit', 100, type=int)).all()
+        return jsonify({"devices": [d.to_dict() for d in devices]}), 200
+    except Exception as e:
+        logger.error("Devices fetch error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/sessions/active', methods=['GET'])
+@portal_admin_required
+def get_active_sessions():
+    """Number of devices heard from (heartbeat or portal request) within the activity window."""
+    window = request.args.get('window_seconds', current_app.config.get('ACTIVE_SESSION_WINDOW_SECONDS', 300), type=int)
+    try:
+        return jsonify({"active_sessions": active_device_count(window), "window_seconds": window}), 200
+    except Exception as e:
+        logger.error("Active sessions count error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/gateway/clients', methods=['GET'])
+@portal_admin_required
+def get_gateway_clients():
+    """Clients currently known to the configured gateways."""
+    try:
+        return jsonify({"clients": get_gateway().list_clients()}), 200
+    except Exception as e:
+        logger.error("Gateway clients fetch error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/gateway/deauthorize', methods=['POST'])
+@portal_admin_required
+def deauthorize_gateway_clients():
+    """Kick devices by MAC and/or phone number; one gateway call however many are listed."""
+    data = request.get_json(silent=True) or {}
+    mac_addresses = data.get('mac_addresses') or []
+    phone_numbers = data.get('phone_numbers') or []
+    if not isinstance(mac_addresses, list) or not isinstance(phone_numbers, list) or not (mac_addresses or phone_numbers):
+        return jsonify({"error": "mac_addresses and/or phone_numbers lists are required"}), 400
+    try:
+        failed = deauthorize_clients(mac_addresses=mac_addresses, phone_numbers=phone_numbers)
+        logger.info("Gateway deauthorize requested: macs=%s, phones=%s, admin=%s", len(mac_addresses), len(phone_numbers), get_jwt().get('username'))
+        return jsonify({"message": "Deauthorize sent", "failed_gateways": failed}), 200
+    except Exception as e:
+        logger.error("Gateway deauthorize error: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@admin_bp.route('/profiling', methods=['POST'])
+@portal_admin_required
+def arm_profiling():
+    """Profile a sample of live requests (optionally one endpoint) on every worker for a while."""
+    data = request.get_json(silent=True) or {}
+    sample_rate = data.get('sample_rate', 0.1)
+    duration = data.get('duration_seconds', 300)
+    mode = data.get('mode', 'sample')
+    if not isinstance(sample_rate, (int, float)) or not 0 < sample_rate <= 1:
+        return jsonify({"error": "sample_rate must be in (0, 1]"}), 400
+    if not isinstance(duration, int) or not 0 < duration <= current_app.config.get('PROFILE_MAX_SECONDS', 3600):
+        return jsonify({"error": "duration_seconds is out of range"}), 400
+    if mode not in ('sample', 'cprofile'):
+        return jsonify({"error": "mode must be 'sample' or 'cprofile'"}), 400
+    settings = profiling.arm(sample_rate, duration, endpoint=data.get('endpoint'), mode=mode)
+    logger.info("Profiling armed: %s, admin=%s", settings, get_jwt().get('username'))
+    return jsonify({"message": "Profiling armed", "settings": settings}), 200
+
+@admin_bp.route('/profiling', methods=['DELETE'])
+@portal_admin_required
+def disarm_profiling():
+    profiling.disarm()
+    return jsonify({"message": "Profiling stopped"}), 200
+
+@admin_bp.route('/profiling/profiles', methods=['GET'])
+@portal_admin_required
+def get_profiles():
+    """Written profiles, newest first; .speedscope.json files open in speedscope.app."""
+    return jsonify({"profiles": profiling.list_profiles(current_app.config.get('PROFILE_DIR', 'profiles'))}), 200
+
+@admin_bp.route('/profiling/profiles/<name>', methods=['GET'])
+@portal_admin_required
+def download_profile(name):
+    return send_from_directory(os.path.abspath(current_app.config.get('PROFILE_DIR', 'profiles')), name, as_attachment=True)
+
+@admin_bp.route('/tracemalloc', methods=['POST'])
+@portal_admin_required
+def control_tracemalloc():
+    """Start or stop allocation tracing in this process. Tracing slows allocations, so stop it when done."""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    frames = data.get('frames', 25)
+    if action == 'start':
+        if not isinstance(frames, int) or isinstance(frames, bool) or not 1 <= frames <= 100:
+            return jsonify({"error": "frames must be an integer between 1 and 100"}), 400
+        profiling.start_tracemalloc(frames)
+    elif action == 'stop':
+        profiling.stop_tracemalloc()
+    else:
+        return jsonify({"error": "action must be 'start' or 'stop'"}), 400
+    logger.info("tracemalloc %s: pid=%s, admin=%s", action, os.getpid(), get_jwt().get('username'))
+    return jsonify({"message": "tracemalloc started" if action == 'start' else "tracemalloc stopped", "pid": os.getpid()}), 200
 
-    logger.info(f"Current admin fetched: admin_id={admin_id}")
-    return jsonify({"admin": admin.to_dict()}), 200
\ No newline at end of file
+@admin_bp.route('/tracemalloc/snapshot', methods=['GET'])
+@portal_admin_required
+def get_tracemalloc_snapshot():
+    """Top allocation sites and their growth since the previous snapshot; ?dump=1 also saves it to PROFILE_DIR."""
+    key_type = request.args.get('key_type', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"error": "key_type must be lineno, filename or traceback"}), 400
+    dump_dir = current_app.config.get('PROFILE_DIR', 'profiles') if request.args.get('dump') else None
+    report = profiling.tracemalloc_report(request.args.get('limit', 20, type=int), key_type, dump_dir)
+    if report is None:
+        return jsonify({"error": "tracemalloc is not running; POST /tracemalloc with action=start"}), 409
+    return jsonify(report), 200
@@ -1,31 +1,21 @@
 from flask import request, jsonify, current_app, Blueprint, make_response
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
 from app.models.user import User
-from app.extensions import db
+from app.extensions import db, limiter
+from app.utils.rate_limit import route_limit, identity_key
 import logging
 import re
-import random
-import string
-from datetime import timedelta, datetime
-import pytz
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException  # NEW: Import for Twilio error handling
+from datetime import timedelta
+from app.utils.ttl_store import get_store
+from app.utils.otp_store import issue_otp, check_otp
+from app.utils.passwords import verify_password, set_password, PasswordPoolBusy
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
-# Initialize Limiter
-limiter = Limiter(
-    get_remote_address,
-    app=current_app,
-    default_limits=["200 per day", "50 per hour"]
-)
-
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user with phone number and optional email/password."""
@@ -42,12 +32,12 @@ def register():
 
     # Validate phone number format
     if not re.match(r'^\+\d{10,15}$', phone_number):
-        logger.warning(f"Registration failed: Invalid phone number format: {phone_number}")
+        logger.warning("Registration failed: Invalid phone number format: %s", phone_number)
         return jsonify({"error": "Invalid phone number format"}), 400
 
     # Validate email if provided
     if email and not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', email):
-        logger.warning(f"Registration failed: Invalid email format: {email}")
+        logger.warning("Registration failed: Invalid email format: %s", email)
         return jsonify({"error": "Invalid email format"}), 400
 
     # Validate password if provided
@@ -60,10 +50,10 @@ def register():
         (User.phone_number == phone_number) | (User.email == email)
     ).first()
     if existing_user:
-        logger.warning(f"Registration failed: Duplicate found - phone_number={phone_number}, email={email}")
+        logger.warning("Registration failed: Duplicate found - phone_number=%s, email=%s", phone_number, email)
         return jsonify({"error": "Phone number or email already exists"}), 409
 
-    logger.info(f"Attempting registration: phone_number={phone_number}, email={email}")
+    logger.info("Attempting registration: phone_number=%s, email=%s", phone_number, email)
 
     # Database operations
     try:
@@ -74,27 +64,33 @@ def register():
             is_admin=data.get('is_admin', False)
         )
         if password:
-            user.set_password(password)
+            set_password(user, password)  # Hashed on the password pool
         db.session.add(user)
         db.session.commit()
-        logger.info(f"User registered successfully: phone_number={phone_number}")
+        logger.info("User registered successfully: phone_number=%s", phone_number)
         return jsonify({"message": "Registration successful"}), 201
+
+    except PasswordPoolBusy:
+        db.session.rollback()
+        logger.warning("Registration rejected: password hashing pool is saturated")
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
         
     except IntegrityError as e:
         db.session.rollback()
-        logger.error(f"Registration failed: IntegrityError - phone_number={phone_number}, email={email}, error={str(e)}")
+        logger.error("Registration failed: IntegrityError - phone_number=%s, email=%s, error=%s", phone_number, email, e)
         return jsonify({"error": "Phone number or email already exists"}), 409
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Registration failed: Unexpected error - phone_number={phone_number}, email={email}, error={str(e)}")
+        logger.error("Registration failed: Unexpected error - phone_number=%s, email=%s, error=%s", phone_number, email, e)
         return jsonify({"error": "Registration failed", "details": str(e)}), 500
     
     
     
 
 @auth_bp.route('/login', methods=['POST'])
-@limiter.limit("5 per minute")
+@limiter.limit(route_limit('RATELIMIT_LOGIN'))
+@limiter.limit(route_limit('RATELIMIT_LOGIN'), key_func=identity_key)
 def login():
     """Log in a user with phone number or email and password."""
     data = request.get_json()
@@ -112,21 +108,27 @@ def login():
         (User.phone_number == identifier) | (User.email == identifier)
     ).first()
 
-    # Authentication check
-    if not user or not user.check_password(password):
-        logger.warning(f"Login failed: Invalid credentials for {identifier}")
+    # Authentication check (hashing runs on the password pool)
+    try:
+        authenticated = user is not None and verify_password(user, password)
+    except PasswordPoolBusy:
+        logger.warning("Login rejected: password hashing pool is saturated")
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+    if not authenticated:
+        logger.warning("Login failed: Invalid credentials for %s", identifier)
         return jsonify({"error": "Invalid phone number or password"}), 401
 
     # Skip phone verification for non-admin users
     if user.is_admin and not user.is_phone_verified:
-        logger.warning(f"Login failed: Phone not verified for admin {identifier}")
+        logger.warning("Login failed: Phone not verified for admin %s", identifier)
         return jsonify({"error": "Phone number not verified"}), 403
 
     try:
         # Generate JWT token
         access_token = create_access_token(
             identity=user.id,
-            expires_delta=timedelta(days=1)
+            expires_delta=timedelta(days=1),
+            additional_claims=user.token_claims()
         )
         response = jsonify({
             "message": "Login successful",
@@ -138,10 +140,10 @@ def login():
             }
         })
         
-        logger.info(f"User logged in: user_id={user.id}")
+        logger.info("User logged in: user_id=%s", user.id)
         return response, 200
     except Exception as e:
-        logger.error(f"Login error: identifier={identifier}, error={str(e)}")
+        logger.error("Login error: identifier=%s, error=%s", identifier, e)
         return jsonify({"error": "Server error"}), 500
 
 @auth_bp.route('/logout', methods=['POST'])
@@ -151,10 +153,9 @@ def logout():
     return jsonify({"message": "Logout successful"}), 200
 
 
-from datetime import datetime, timezone
-import pytz
-
 @auth_bp.route('/verify-phone', methods=['POST'])
+@limiter.limit(route_limit('RATELIMIT_VERIFY_PHONE'))
+@limiter.limit(route_limit('RATELIMIT_VERIFY_PHONE'), key_func=identity_key)
 def verify_phone():
     data = request.get_json()
     if not data or not data.get('phone_number'):
@@ -163,44 +164,29 @@ def verify_phone():
 
     phone_number = data.get('phone_number')
     if not re.match(r'^\+\d{10,15}$', phone_number):
-        logger.warning(f"Phone verification failed: Invalid phone number format: {phone_number}")
+        logger.warning("Phone verification failed: Invalid phone number format: %s", phone_number)
         return jsonify({"error": "Invalid phone number format"}), 400
 
-    otp = ''.join(random.choices(string.digits, k=6))
-    logger.info(f"OTP generated for {phone_number}: {otp}")
-    
-    # NEW: Correct Twilio client initialization and add error handling
-    try:
-        client = Client(
-            current_app.config['TWILIO_ACCOUNT_SID'],
-            current_app.config['TWILIO_AUTH_TOKEN']
-        )
-        message = client.messages.create(
-            body=f"Your OTP is {otp}",
-            from_=current_app.config['TWILIO_PHONE_NUMBER'],
-            to=phone_number
-        )
-        logger.info(f"OTP sent to {phone_number}: {message.sid}")
-    except TwilioRestException as e:
-        logger.error(f"Twilio error: phone={phone_number}, error={str(e)}")
-        return jsonify({"error": "Failed to send OTP", "details": str(e)}), 500
-    except Exception as e:
-        logger.error(f"Unexpected error in Twilio: phone={phone_number}, error={str(e)}")
-        return jsonify({"error": "Failed to send OTP", "details": str(e)}), 500
+    # Don't resend while a recently sent OTP is still on its way
+    resend_interval = current_app.config.get('SMS_RESEND_INTERVAL_SECONDS', 60)
+    if not get_store().add(f"sms:otp-sent:{phone_number}", 1, ttl=resend_interval):
+        logger.info("OTP resend suppressed: phone=%s", phone_number)
+        return jsonify({"message": "OTP already sent. Please wait before requesting another."}), 200
 
     try:
-        user = User.query.filter_by(phone_number=phone_number).first()
-        if not user:
-            user = User(phone_number=phone_number)
-            db.session.add(user)
-        user.otp = otp
-        user.otp_expiry = datetime.now(pytz.timezone('Africa/Kampala')) + timedelta(minutes=5)
-        db.session.commit()
-        return jsonify({"message": "OTP sent successfully"}), 200
+        # Kept in the TTL store; the users table is only touched once the OTP is confirmed
+        otp = issue_otp(phone_number)
+        logger.info("OTP generated for %s: %s", phone_number, otp)
     except Exception as e:
-        db.session.rollback()
-        logger.error(f"Phone verification failed: phone={phone_number}, error={str(e)}")
+        get_store().delete(f"sms:otp-sent:{phone_number}")
+        logger.error("Phone verification failed: phone=%s, error=%s", phone_number, e)
         return jsonify({"error": "Server error during phone verification", "details": str(e)}), 500
+
+    # Delivery happens on the SMS worker pool; the OTP is already stored
+    if not current_app.extensions['sms'].enqueue(phone_number, f"Your OTP is {otp}"):
+        get_store().delete(f"sms:otp-sent:{phone_number}")
+        return jsonify({"error": "Failed to send OTP", "details": "SMS queue is full"}), 503
+    return jsonify({"message": "OTP sent successfully"}), 200
     
 
 @auth_bp.route('/confirm-otp', methods=['POST'])
@@ -214,31 +200,25 @@ def confirm_otp():
     otp = data.get('otp')
 
     try:
-        user = User.query.filter_by(phone_number=phone_number).first()
-        logger.info(f"User found: {user}, OTP: {user.otp}, Expiry: {user.otp_expiry}")
-        if not user:
-            logger.warning(f"OTP confirmation failed: User not found for {phone_number}")
-            return jsonify({"error": "User not found"}), 404
-        if user.otp != otp:
-            logger.warning(f"OTP confirmation failed: Invalid OTP for {phone_number}")
-            return jsonify({"error": "Invalid OTP"}), 401
-        # Convert offset-naive otp_expiry to offset-aware
-        kampala_tz = pytz.timezone('Africa/Kampala')
-        expiry_aware = kampala_tz.localize(user.otp_expiry)
-        if expiry_aware < datetime.now(kampala_tz):
-            logger.warning(f"OTP confirmation failed: Expired OTP for {phone_number}")
+        result = check_otp(phone_number, otp)
+        if result == 'expired':
+            logger.warning("OTP confirmation failed: Expired or missing OTP for %s", phone_number)
             return jsonify({"error": "Expired OTP"}), 401
+        if result != 'valid':
+            logger.warning("OTP confirmation failed: Invalid OTP for %s", phone_number)
+            return jsonify({"error": "Invalid OTP"}), 401
 
-        logger.info(f"Updating user: otp=None, otp_expiry=None, is_phone_verified=True")
-        user.otp = None
-        user.otp_expiry = None
+        user = User.query.filter_by(phone_number=phone_number).first()
+        if not user:
+            user = User(phone_number=phone_number)
+            db.session.add(user)
         user.is_phone_verified = True
         db.session.commit()
-        logger.info(f"Phone verified: phone={phone_number}")
+        logger.info("Phone verified: phone=%s", phone_number)
         return jsonify({"message": "Phone number verified successfully"}), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"OTP confirmation failed: phone={phone_number}, error={str(e)}")
+        logger.error("OTP confirmation failed: phone=%s, error=%s", phone_number, e)
         return jsonify({"error": "Server error during OTP confirmation", "details": str(e)}), 500
 
 @auth_bp.route('/me', methods=['GET'])
@@ -248,10 +228,10 @@ def get_user():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     if not user:
-        logger.warning(f"User fetch failed: user_id={user_id}")
+        logger.warning("User fetch failed: user_id=%s", user_id)
         return jsonify({"error": "User not found"}), 404
 
-    logger.info(f"current user fetched: user_id={user_id}")
+    logger.info("current user fetched: user_id=%s", user_id)
     return jsonify({"user": user.to_dict()}), 200
 
 
@@ -266,12 +246,12 @@ def check_user():
 
     phone_number = data.get('phone_number')
     if not re.match(r'^\+\d{10,15}$', phone_number):
-        logger.warning(f"Check user failed: Invalid phone number format: {phone_number}")
+        logger.warning("Check user failed: Invalid phone number format: %s", phone_number)
         return jsonify({"error": "Invalid phone number format"}), 400
 
     user = User.query.filter_by(phone_number=phone_number).first()
     if not user:
-        logger.info(f"User not found: phone={phone_number}")
+        logger.info("User not found: phone=%s", phone_number)
         return jsonify({"exists": False}), 404
-    logger.info(f"User found: phone={phone_number}, verified={user.is_phone_verified}")
+    logger.info("User found: phone=%s, verified=%s", phone_number, user.is_phone_verified)
     return jsonify({"exists": True, "is_phone_verified": user.is_phone_verified}), 200
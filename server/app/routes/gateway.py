@@ -0,0 +1,106 @@
+from flask import request, jsonify, current_app, Blueprint
+from sqlalchemy import func
+from app.extensions import db
+from app.models.entitlement_change import EntitlementChange
+from app.utils.decorators import gateway_required
+from app.utils.entitlements import entitlement_snapshot
+from app.utils.tickets import denied_entries
+from app.utils.devices import note_device
+from app.utils.gateways import reauthorize_devices
+from app.utils.usage import parse_counters, ingest_counters
+import logging
+from datetime import datetime, timedelta
+
+# Set up logging
+logger = logging.getLogger(__name__)
+gateway_bp = Blueprint('gateway', __name__)
+
+@gateway_bp.route('/entitlements', methods=['GET'])
+@gateway_required
+def get_entitlements():
+    """Changes to grants and exclusions since a cursor, for gateways that authorize locally.
+
+    Without ?since (or when the cursor is older than the retained log) the
+    response is a full snapshot with reset=true; the gateway replaces its
+    allow-list and continues from the returned cursor.
+    """
+    since = request.args.get('since', type=int)
+    limit = min(request.args.get('limit', 1000, type=int), current_app.config.get('ENTITLEMENT_FEED_MAX_LIMIT', 5000))
+    now = datetime.utcnow()
+    # Hold back the newest rows briefly so a transaction that took a lower id
+    # but committed later is not skipped past
+    settle = timedelta(seconds=current_app.config.get('ENTITLEMENT_FEED_SETTLE_SECONDS', 2))
+
+    oldest_id = db.session.query(func.min(EntitlementChange.id)).scalar()
+    if since is None or (oldest_id is not None and since < oldest_id - 1):
+        # Read the cursor first, from settled rows only: anything newer, or written
+        # during the snapshot, is replayed next poll (grants and revokes are idempotent)
+        cursor = db.session.query(func.max(EntitlementChange.id)).filter(
+            EntitlementChange.created_at <= now - settle
+        ).scalar() or 0
+        entries = entitlement_snapshot(now)
+        logger.info("Entitlement snapshot served: entries=%s, cursor=%s", len(entries), cursor)
+        return jsonify({"reset": True, "cursor": cursor, "changes": entries, "has_more": False,
+                        "server_time": now.isoformat()}), 200
+
+    changes = EntitlementChange.query.filter(
+        EntitlementChange.id > since,
+        EntitlementChange.created_at <= now - settle
+    ).order_by(EntitlementChange.id).limit(limit + 1).all()
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    cursor = changes[-1].id if changes else since
+    return jsonify({
+        "reset": False,
+        "cursor": cursor,
+        "changes": [c.to_dict() for c in changes],
+        "has_more": has_more,
+        "server_time": now.isoformat()
+    }), 200
+
+@gateway_bp.route('/ticket-denylist', methods=['GET'])
+@gateway_required
+def get_ticket_denylist():
+    """Revoked ticket ids and subjects; gateways refuse matching tickets until they drop off."""
+    return jsonify({
+        "denied": denied_entries(),
+        "ttl_seconds": current_app.config.get('ACCESS_TICKET_MAX_SECONDS', 86400),
+        "server_time": datetime.utcnow().isoformat()
+    }), 200
+
+@gateway_bp.route('/heartbeat', methods=['POST'])
+@gateway_required
+def gateway_heartbeat():
+    """Mark the listed clients as live. Buffered in memory and written in batches, so it can be called often."""
+    data = request.get_json(silent=True)
+    macs = data.get('mac_addresses') if isinstance(data, dict) else None
+    if not isinstance(macs, list):
+        return jsonify({"error": "mac_addresses list is required"}), 400
+    limit = current_app.config.get('HEARTBEAT_BATCH_MAX', 5000)
+    if len(macs) > limit:
+        return jsonify({"error": f"At most {limit} clients per heartbeat"}), 413
+    sighted = [mac for mac in macs if isinstance(mac, str)]
+    for mac in sighted:
+        note_device(mac)
+    reauthorize_devices(sighted)
+    return jsonify({"accepted": len(macs)}), 202
+
+@gateway_bp.route('/usage', methods=['POST'])
+@gateway_required
+def ingest_usage():
+    """Byte counters per client since the gateway's last report: [[mac, bytes_in, bytes_out], ...].
+
+    Counters are summed in memory and flushed every few seconds; devices
+    over their data bundle are deauthorized after the flush.
+    """
+    data = request.get_json(silent=True)
+    counters = data.get('counters') if isinstance(data, dict) else None
+    if not isinstance(counters, list):
+        return jsonify({"error": "counters list is required"}), 400
+    limit = current_app.config.get('USAGE_BATCH_MAX', 50000)
+    if len(counters) > limit:
+        return jsonify({"error": f"At most {limit} counters per request"}), 413
+    rows, rejected = parse_counters(counters)
+    ingest_counters(rows)
+    return jsonify({"accepted": len(rows), "rejected": rejected}), 202
@@ -1,12 +1,26 @@
 from flask import request, jsonify, current_app, Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from app.models.transaction import Transaction
 from app.models.user import User
-from app.utils.momo_api import MobileMoneyAPI
-from app.extensions import db
-from app.utils.decorators import payment_required
+from app.extensions import db, limiter
+from app.utils.rate_limit import route_limit
+from app.utils.lockout import lockout_keys, locked_for, record_failure, record_success
+from app.utils.decorators import payment_required, admin_required, claims_phone_number, gateway_required
+from app.utils.entitlements import batch_entitlements, record_grant
+from app.utils.tickets import issue_access_ticket
+from app.utils.conditional import conditional
+from app.utils.gateways import authorize_device, reauthorize_devices, fas_auth_url
+from app.utils.usage import start_usage_session, entitlement_key
+from app.utils.rate_limit import normalize_mac, client_mac
 from app.models.access_code import AccessCode  # Add this import
+from app.models.refund import Refund
 from app.utils.code_generator import generate_random_code  # Add this import
+from app.utils.idempotency import idempotent
+from app.utils.metrics import record_cache
+from app.utils.query_audit import query_budget
+from app.utils.refund_queue import enqueue_refund
+from app.utils.singleflight import SingleFlight
+from app.utils.ttl_store import get_store
 import logging
 import uuid
 # CHANGED: Simplify datetime imports without aliasing
@@ -20,10 +34,17 @@ payments_bp = Blueprint('payments', __name__)
 PACKAGES = [
     {"id": "1", "name": "1 Hour", "duration_hours": 1, "price": 0.5},
     {"id": "2", "name": "1 Day", "duration_hours": 24, "price": 2.0},
-    {"id": "3", "name": "1 Week", "duration_hours": 168, "price": 10.0}
+    {"id": "3", "name": "1 Week", "duration_hours": 168, "price": 10.0},
+    {"id": "4", "name": "1 GB (1 Week)", "duration_hours": 168, "price": 3.0, "data_mb": 1024}
 ]
 
+def package_quota_bytes(package_id):
+    """Data cap for a package in bytes, or None for time-only packages."""
+    package = next((p for p in PACKAGES if p['id'] == package_id), None)
+    return package['data_mb'] * 1024 * 1024 if package and package.get('data_mb') else None
+
 @payments_bp.route('/packages', methods=['GET'])
+@conditional(key=lambda: PACKAGES, private=False)
 def get_packages():
     """List available internet packages."""
     logger.info("Fetching available packages")
@@ -32,6 +53,8 @@ def get_packages():
 from app.models.exclusion import Exclusion
 
 @payments_bp.route('/initiate', methods=['POST'])
+@idempotent
+@limiter.limit(route_limit('RATELIMIT_INITIATE'))
 def initiate_payment():
     """Initiate a mobile money payment for a package."""
     try:
@@ -42,6 +65,7 @@ def initiate_payment():
 
         phone_number = data.get('phone_number')
         package_id = data.get('package_id')
+        mac_address = client_mac()
 
         # Check if phone number is excluded from payment
         exclusion = Exclusion.query.filter_by(type='PHONE', value=phone_number).first()
@@ -52,7 +76,8 @@ def initiate_payment():
                 package_id=package_id,
                 amount=0.0,  # Free for excluded users
                 transaction_id=str(uuid.uuid4()),
-                status='SUCCESSFUL'
+                status='SUCCESSFUL',
+                mac_address=mac_address
             )
             package = next((p for p in PACKAGES if p['id'] == package_id), None)
             if package:
@@ -60,8 +85,11 @@ def initiate_payment():
                 transaction.expiry = datetime.utcnow() + timedelta(hours=package['duration_hours'])
             transaction.completed_at = datetime.utcnow()
             db.session.add(transaction)
+            record_grant('phone', phone_number, transaction.expiry)
             db.session.commit()
-            logger.info(f"Payment skipped for excluded user: phone={phone_number}, transaction_id={transaction.transaction_id}")
+            authorize_device(mac_address, transaction.expiry, phone_number, package_quota_bytes(package_id),
+                             entitlement_key('tx', transaction.transaction_id))
+            logger.info("Payment skipped for excluded user: phone=%s, transaction_id=%s", phone_number, transaction.transaction_id)
             return jsonify({
                 "message": "Access granted without payment",
                 "transaction_id": transaction.transaction_id,
@@ -71,33 +99,58 @@ def initiate_payment():
         # Find package
         package = next((p for p in PACKAGES if p['id'] == package_id), None)
         if not package:
-            logger.warning(f"Payment initiation failed: Invalid package ID: {package_id}")
+            logger.warning("Payment initiation failed: Invalid package ID: %s", package_id)
             return jsonify({"error": "Invalid package ID"}), 404
 
+        # Reuse an in-flight payment for the same phone and package instead of prompting again
+        dedup_window = current_app.config.get('PENDING_PAYMENT_DEDUP_SECONDS', 300)
+        pending = Transaction.query.filter(
+            Transaction.phone_number == phone_number,
+            Transaction.package_id == package_id,
+            Transaction.status == 'PENDING',
+            Transaction.created_at >= datetime.utcnow() - timedelta(seconds=dedup_window)
+        ).order_by(Transaction.created_at.desc()).first()
+        if pending:
+            if not mac_address or pending.mac_address != mac_address:
+                # Someone else's purchase; its id would let them poll (and be authorized by) it
+                logger.info("Payment pending from another device: phone=%s", phone_number)
+                return jsonify({"error": "A payment for this number is already awaiting approval"}), 409
+            logger.info("Payment already pending: transaction_id=%s, phone=%s", pending.transaction_id, phone_number)
+            return jsonify({
+                "message": "Payment already in progress",
+                "transaction_id": pending.transaction_id,
+                "status": pending.status
+            }), 200
+
+        # Hand the DB connection back while waiting on MoMo, so slow provider calls cannot drain the pool
+        db.session.commit()
+
         # Initialize mobile money API
         logger.debug("Initializing MobileMoneyAPI")
+        from app.utils.momo_api import MobileMoneyAPI  # requests is imported on first payment, not at startup
         momo_api = MobileMoneyAPI()
 
         # Initiate payment
-        logger.debug(f"Initiating payment: phone={phone_number}, price={package['price']}, package_id={package_id}")
+        logger.debug("Initiating payment: phone=%s, price=%s, package_id=%s", phone_number, package['price'], package_id)
         result = momo_api.initiate_payment(phone_number, package['price'], package_id)
         if 'error' in result:
-            logger.error(f"MobileMoneyAPI error: {result['error']}")
+            logger.error("MobileMoneyAPI error: %s", result['error'])
             return jsonify({"error": result['error']}), 500
 
         # Create transaction record
-        logger.debug(f"Creating transaction: transaction_id={result['transaction_id']}")
+        logger.debug("Creating transaction: transaction_id=%s", result['transaction_id'])
         transaction = Transaction(
             phone_number=phone_number,
             package_id=package_id,
             amount=package['price'],
             transaction_id=result['transaction_id'],
-            status=result['status']
+            status=result['status'],
+            mac_address=mac_address
         )
         db.session.add(transaction)
         db.session.commit()
 
-        logger.info(f"Payment initiated: transaction_id={result['transaction_id']}, phone={phone_number}")
+        logger.info("Payment initiated: transaction_id=%s, phone=%s", result['transaction_id'], phone_number)
         return jsonify({
             "message": "Payment initiated",
             "transaction_id": result['transaction_id'],
@@ -105,10 +158,23 @@ def initiate_payment():
         }), 200
 
     except Exception as e:
-        logger.error(f"Error in initiate_payment: {str(e)}", exc_info=True)
+        logger.error("Error in initiate_payment: %s", e, exc_info=True)
         db.session.rollback()
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+@payments_bp.route('/heartbeat', methods=['POST'])
+@limiter.limit(route_limit('RATELIMIT_HEARTBEAT'))
+def client_heartbeat():
+    """Keep-alive from the client's browser; the X-Client-MAC sighting is recorded on the way in.
+
+    A device that lost its gateway session (idle kick) while still entitled is let back in.
+    """
+    mac_address = client_mac()
+    if not mac_address:
+        return jsonify({"error": "Device MAC address is required"}), 400
+    reauthorize_devices([mac_address])
+    return '', 204
+
 @payments_bp.route('/check-access', methods=['GET'])
 @payment_required
 def check_access():
@@ -123,20 +189,53 @@ def check_access():
     mac_exclusion = Exclusion.query.filter_by(type='MAC', value=mac_address, exclude_from_connection=True).first() if mac_address else None
 
     if phone_exclusion or mac_exclusion:
-        logger.info(f"Access denied due to exclusion: phone={phone_number}, mac={mac_address}")
+        logger.info("Access denied due to exclusion: phone=%s, mac=%s", phone_number, mac_address)
         return jsonify({"error": "Access denied due to exclusion"}), 403
 
     return jsonify({"message": "Access granted"}), 200
 
-@payments_bp.route('/verify/<transaction_id>', methods=['POST'])
-def verify_payment(transaction_id):
-    """Verify the status of a payment and activate package if successful."""
+# Statuses that will not change again, so the provider is never asked twice
+TERMINAL_STATUSES = ('SUCCESSFUL', 'REFUNDED', 'EXPIRED')
+
+_verify_flight = SingleFlight()
+
+def verify_cache_key(transaction_id):
+    return f"verify:{transaction_id}"
+
+def _verification_body(transaction, status, refund_status=None):
+    body = {
+        "transaction_id": transaction.transaction_id,
+        "status": status,
+        "phone_number": transaction.phone_number,
+        "package_id": transaction.package_id,
+        "amount": transaction.amount,
+        "expiry": transaction.expiry.isoformat() if transaction.expiry else None
+    }
+    if refund_status:
+        body["refund_status"] = refund_status
+    return body
+
+def _verify_transaction(transaction_id):
+    """Check the provider once and return (body, http_status, purchasing MAC) for caching."""
     transaction = Transaction.query.filter_by(transaction_id=transaction_id).first()
     if not transaction:
-        logger.warning(f"Payment verification failed: Transaction not found: {transaction_id}")
-        return jsonify({"error": "Transaction not found"}), 404
+        logger.warning("Payment verification failed: Transaction not found: %s", transaction_id)
+        return {"error": "Transaction not found"}, 404, None
+
+    if transaction.status in TERMINAL_STATUSES:
+        return _verification_body(transaction, transaction.status), 200, transaction.mac_address
+
+    if transaction.status == 'FAILED':
+        # Provider already said FAILED; report refund progress without asking again
+        refund = Refund.query.filter_by(transaction_id=transaction_id).first()
+        if refund:
+            return _verification_body(transaction, transaction.status, refund.status), 200, transaction.mac_address
+
+    # Hand the DB connection back while waiting on MoMo; the row is reloaded afterwards
+    db.session.commit()
 
     # Initialize mobile money API
+    from app.utils.momo_api import MobileMoneyAPI
     momo_api = MobileMoneyAPI()
 
     # Verify payment
@@ -144,46 +243,112 @@ def verify_payment(transaction_id):
     if 'error' in result:
         transaction.status = 'FAILED'
         db.session.commit()
-        return jsonify(result), 500
+        return result, 500, None
 
     # Update transaction status
     transaction.status = result['status']
+    refund_status = None
     if result['status'] == 'SUCCESSFUL':
         package = next((p for p in PACKAGES if p['id'] == transaction.package_id), None)
         if package:
             # CHANGED: Use direct datetime and timedelta
             transaction.expiry = datetime.utcnow() + timedelta(hours=package['duration_hours'])
         transaction.completed_at = datetime.utcnow()
+        record_grant('phone', transaction.phone_number, transaction.expiry)
     elif result['status'] == 'FAILED':
-        # Attempt refund if payment failed
-        refund_result = momo_api.refund_payment(transaction_id, transaction.amount)
-        if 'error' in refund_result:
-            logger.error(f"Refund failed for transaction: {transaction_id}")
-        else:
-            transaction.status = 'REFUNDED'
+        # Refund in the background; the worker retries until MoMo accepts it
+        refund = enqueue_refund(transaction)
+        refund_status = refund.status
 
     db.session.commit()
+    if result['status'] == 'SUCCESSFUL':
+        # Only the device that started the purchase is let through, once, as the payment lands
+        authorize_device(transaction.mac_address, transaction.expiry, transaction.phone_number,
+                         package_quota_bytes(transaction.package_id), entitlement_key('tx', transaction_id))
+
+    logger.info("Payment verified: transaction_id=%s, status=%s", transaction_id, result['status'])
+    return _verification_body(transaction, result['status'], refund_status), 200, transaction.mac_address
+
+def _verify_and_cache(transaction_id):
+    body, status_code, mac_address = _verify_transaction(transaction_id)
+    if status_code == 200:
+        if body['status'] in TERMINAL_STATUSES:
+            ttl = current_app.config.get('VERIFY_TERMINAL_CACHE_SECONDS', 300)
+        else:
+            ttl = current_app.config.get('VERIFY_PENDING_CACHE_SECONDS', 5)
+        if body['status'] == 'SUCCESSFUL' and body.get('expiry'):
+            # Never serve SUCCESSFUL past the expiry; the sweep flips the row to EXPIRED then
+            remaining = (datetime.fromisoformat(body['expiry']) - datetime.utcnow()).total_seconds()
+            ttl = min(ttl, int(remaining))
+        if ttl > 0:
+            get_store().set(verify_cache_key(transaction_id),
+                            {"body": body, "status": status_code, "mac_address": mac_address}, ttl=ttl)
+    return body, status_code, mac_address
+
+def _issue_ticket_once(transaction_id, expiry, mac_address, phone_number):
+    """Ticket for the purchasing device, handed out on the first poll that sees the payment succeed only."""
+    ticket = issue_access_ticket(expiry, mac_address=mac_address, phone_number=phone_number)
+    if not ticket:
+        return None
+    remaining = int((expiry - datetime.utcnow()).total_seconds())
+    if remaining <= 0 or not get_store().add(f"ticket-issued:{transaction_id}", True, ttl=remaining):
+        return None
+    return ticket
+
+@payments_bp.route('/check-access/batch', methods=['POST'])
+@gateway_required
+def check_access_batch():
+    """Entitlements for many clients in one call, for gateways polling all their clients."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON body required"}), 400
+
+    lists = {key: data.get(key) or [] for key in ('phone_numbers', 'mac_addresses', 'codes')}
+    if not all(isinstance(v, list) for v in lists.values()):
+        return jsonify({"error": "phone_numbers, mac_addresses and codes must be lists"}), 400
+
+    total = sum(len(v) for v in lists.values())
+    max_batch = current_app.config.get('ACCESS_CHECK_BATCH_MAX', 1000)
+    if total > max_batch:
+        return jsonify({"error": f"At most {max_batch} identifiers per request"}), 400
+
+    now = datetime.utcnow()
+    result = batch_entitlements(lists['phone_numbers'], lists['mac_addresses'], lists['codes'], now=now)
+    logger.info("Batch access check: identifiers=%s", total)
+    return jsonify({"checked_at": now.isoformat(), **result}), 200
 
-    logger.info(f"Payment verified: transaction_id={transaction_id}, status={result['status']}")
-    return jsonify({
-        "transaction_id": transaction_id,
-        "status": result['status'],
-        "phone_number": transaction.phone_number,
-        "amount": transaction.amount,
-        "expiry": transaction.expiry.isoformat() if transaction.expiry else None
-    }), 200
+@payments_bp.route('/verify/<transaction_id>', methods=['POST'])
+def verify_payment(transaction_id):
+    """Verify the status of a payment; the device that initiated it is activated when it succeeds."""
+    # Pollers share a cached result and, on a miss, a single provider call
+    cached = get_store().get(verify_cache_key(transaction_id))
+    record_cache('verify', cached is not None)
+    if cached is None:
+        body, status_code, purchase_mac = _verify_flight.do(transaction_id, lambda: _verify_and_cache(transaction_id))
+    else:
+        body, status_code, purchase_mac = cached['body'], cached['status'], cached.get('mac_address')
+
+    # Polling never authorizes a device: the purchasing MAC was let through when the payment succeeded
+    if status_code == 200 and body.get('status') == 'SUCCESSFUL':
+        expiry = datetime.fromisoformat(body['expiry']) if body.get('expiry') else None
+        mac_address = client_mac()
+        if mac_address and mac_address == purchase_mac:
+            ticket = _issue_ticket_once(transaction_id, expiry, mac_address, body['phone_number'])
+            if ticket:
+                body = {**body, "access_ticket": ticket}
+    return jsonify(body), status_code
 
 @payments_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_payment_history():
     """Get payment history for the authenticated user."""
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
-        logger.warning(f"Payment history fetch failed: user_id={user_id}")
+    phone_number = claims_phone_number(get_jwt())
+    if not phone_number:
+        logger.warning("Payment history fetch failed: user_id=%s", user_id)
         return jsonify({"error": "User not found"}), 404
 
-    transactions = Transaction.query.filter_by(phone_number=user.phone_number).all()
+    transactions = Transaction.query.filter_by(phone_number=phone_number).all()
     history = [
         {
             "transaction_id": t.transaction_id,
@@ -196,7 +361,7 @@ def get_payment_history():
         for t in transactions
     ]
 
-    logger.info(f"Payment history fetched: user_id={user_id}")
+    logger.info("Payment history fetched: user_id=%s", user_id)
     return jsonify({"history": history}), 200
 
 @payments_bp.route("/momo/callback", methods=["POST"])
@@ -214,14 +379,11 @@ def momo_callback():
     }), 200
     
 @payments_bp.route('/generate-codes', methods=['POST'])
-@jwt_required()
+@admin_required
+@query_budget(5)  # Collision check, insert, count, plus a retry
 def generate_access_codes():
     """Admin-only endpoint to generate unique access codes for a plan."""
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or not user.is_admin:
-        logger.warning(f"Unauthorized attempt to generate codes: user_id={user_id}")
-        return jsonify({"error": "Admin access required"}), 403
 
     data = request.get_json()
     if not data or not data.get('plan_id') or not data.get('quantity'):
@@ -233,38 +395,41 @@ def generate_access_codes():
 
     package = next((p for p in PACKAGES if p['id'] == plan_id), None)
     if not package:
-        logger.warning(f"Generate codes failed: Invalid plan ID: {plan_id}")
+        logger.warning("Generate codes failed: Invalid plan ID: %s", plan_id)
         return jsonify({"error": "Invalid plan ID"}), 404
 
     if not isinstance(quantity, int) or quantity <= 0 or quantity > 100:
-        logger.warning(f"Generate codes failed: Invalid quantity: {quantity}")
+        logger.warning("Generate codes failed: Invalid quantity: %s", quantity)
         return jsonify({"error": "Quantity must be an integer between 1 and 100"}), 400
 
-    codes = []
     try:
-        for _ in range(quantity):
-            max_attempts = 10
-            for _ in range(max_attempts):
-                code = generate_random_code()
-                if not AccessCode.query.filter_by(code=code).first():
-                    access_code = AccessCode(
-                        code=code,
-                        plan_id=plan_id,
-                        duration_hours=package['duration_hours'],
-                        price=package['price'],
-                        status='unused'
-                    )
-                    db.session.add(access_code)
-                    codes.append({
-                        "code": code,
-                        "plan_name": package['name'],
-                        "duration_hours": package['duration_hours'],
-                        "price": package['price']
-                    })
-                    break
-            else:
-                logger.error(f"Failed to generate unique code after {max_attempts} attempts")
-                return jsonify({"error": "Unable to generate unique code. Try again."}), 500
+        # Draw candidates in batches and check each batch for collisions with one query
+        new_codes = set()
+        max_attempts = 10
+        for _ in range(max_attempts):
+            candidates = {generate_random_code() for _ in range(quantity - len(new_codes))} - new_codes
+            taken = {c for (c,) in db.session.query(AccessCode.code).filter(AccessCode.code.in_(candidates)).all()}
+            new_codes |= candidates - taken
+            if len(new_codes) == quantity:
+                break
+        else:
+            logger.error("Failed to generate unique code after %s attempts", max_attempts)
+            return jsonify({"error": "Unable to generate unique code. Try again."}), 500
+
+        # One executemany insert; the new rows' ids are never needed
+        db.session.execute(db.insert(AccessCode), [{
+            "code": code,
+            "plan_id": plan_id,
+            "duration_hours": package['duration_hours'],
+            "price": package['price'],
+            "status": 'unused'
+        } for code in new_codes])
+        codes = [{
+            "code": code,
+            "plan_name": package['name'],
+            "duration_hours": package['duration_hours'],
+            "price": package['price']
+        } for code in new_codes]
 
         db.session.commit()
         # Calculate remaining codes
@@ -272,7 +437,7 @@ def generate_access_codes():
         used_codes = AccessCode.query.count()
         remaining_codes = max_codes - used_codes
 
-        logger.info(f"Generated {quantity} access codes for plan_id={plan_id} by user_id={user_id}")
+        logger.info("Generated %s access codes for plan_id=%s by user_id=%s", quantity, plan_id, user_id)
         return jsonify({
             "message": f"Generated {quantity} access codes",
             "codes": codes,
@@ -280,7 +445,7 @@ def generate_access_codes():
         }), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Failed to generate codes: {str(e)}")
+        logger.error("Failed to generate codes: %s", e)
         return jsonify({"error": "Server error", "details": str(e)}), 500
     
 # @payments_bp.route('/generate-codes', methods=['POST'])
@@ -341,6 +506,7 @@ def generate_access_codes():
 #     return jsonify({"message": f"Generated {quantity} access codes", "codes": codes}), 200
 
 @payments_bp.route('/activate-code', methods=['POST'])
+@limiter.limit(route_limit('RATELIMIT_ACTIVATE_CODE'))
 def activate_access_code():
     """Activate an access code, store MAC address, and start session."""
     data = request.get_json()
@@ -349,39 +515,68 @@ def activate_access_code():
         return jsonify({"error": "Access code is required"}), 400
 
     code = data.get('code')
-    mac_address = request.headers.get('X-Client-MAC') or data.get('mac_address')
+    # In FAS mode the browser passes on the clientmac NoDogSplash gave it; it is not trusted for lockouts
+    mac_address = client_mac() or normalize_mac(data.get('mac_address'))
     if not mac_address:
-        logger.warning(f"Activate code failed: Missing MAC address for code={code}")
+        logger.warning("Activate code failed: Missing MAC address for code=%s", code)
         return jsonify({"error": "Device MAC address is required"}), 400
 
+    # Refuse locked-out devices before touching the database
+    guess_keys = lockout_keys()
+    retry_after = locked_for(guess_keys)
+    if retry_after:
+        logger.warning("Activate code refused: locked out mac_address=%s, retry_after=%s", mac_address, retry_after)
+        return jsonify({"error": "Too many invalid codes. Try again later.", "retry_after": retry_after}), 429, {"Retry-After": str(retry_after)}
+
     access_code = AccessCode.query.filter_by(code=code).first()
     if not access_code:
-        logger.warning(f"Activate code failed: Invalid code: {code}")
+        record_failure(guess_keys)
+        logger.warning("Activate code failed: Invalid code: %s", code)
         return jsonify({"error": "Invalid access code"}), 404
 
     if access_code.status != 'unused':
-        logger.warning(f"Activate code failed: Code already used: {code}, status={access_code.status}")
+        record_failure(guess_keys)
+        logger.warning("Activate code failed: Code already used: %s, status=%s", code, access_code.status)
         return jsonify({"error": "Access code has already been used or expired"}), 400
 
+    record_success(guess_keys)
+
     try:
         access_code.status = 'used'
         access_code.mac_address = mac_address
         access_code.used_at = datetime.utcnow()
         access_code.activated_at = datetime.utcnow()
         access_code.expiry = datetime.utcnow() + timedelta(hours=access_code.duration_hours)
+        record_grant('code', code, access_code.expiry)
+        record_grant('mac', mac_address, access_code.expiry)
         db.session.commit()
-        logger.info(f"Access code activated: code={code}, mac_address={mac_address}")
-        return jsonify({
+        logger.info("Access code activated: code=%s, mac_address=%s", code, mac_address)
+        body = {
             "message": "Access code activated successfully. Session started.",
             "code": code,
             "plan_id": access_code.plan_id,
             "duration_hours": access_code.duration_hours,
             "price": access_code.price,
             "expiry": access_code.expiry.isoformat()
-        }), 200
+        }
+        ticket = issue_access_ticket(access_code.expiry, package=access_code.plan_id,
+                                     mac_address=mac_address, code=code)
+        if ticket:
+            body["access_ticket"] = ticket
+        # In FAS mode NoDogSplash authorizes the client itself once it follows authaction
+        auth_url = fas_auth_url(data.get('authaction'), data.get('tok'), data.get('redir'))
+        if auth_url:
+            body["auth_url"] = auth_url
+            if normalize_mac(mac_address):
+                start_usage_session(normalize_mac(mac_address), entitlement_key('code', code),
+                                    package_quota_bytes(access_code.plan_id))
+        else:
+            authorize_device(mac_address, access_code.expiry, quota_bytes=package_quota_bytes(access_code.plan_id),
+                             entitlement=entitlement_key('code', code))
+        return jsonify(body), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Failed to activate code: {code}, error={str(e)}")
+        logger.error("Failed to activate code: %s, error=%s", code, e)
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
 @payments_bp.route('/start-session', methods=['POST'])
@@ -395,19 +590,22 @@ def start_session():
     code = data.get('code')
     access_code = AccessCode.query.filter_by(code=code).first()
     if not access_code:
-        logger.warning(f"Start session failed: Invalid code: {code}")
+        logger.warning("Start session failed: Invalid code: %s", code)
         return jsonify({"error": "Invalid access code"}), 404
 
     if access_code.status != 'pending':
-        logger.warning(f"Start session failed: Code not pending: {code}, status={access_code.status}")
+        logger.warning("Start session failed: Code not pending: %s, status=%s", code, access_code.status)
         return jsonify({"error": "Access code is not pending activation"}), 400
 
     # Start the countdown
     access_code.status = 'activated'
     access_code.expiry = datetime.utcnow() + timedelta(hours=access_code.duration_hours)
+    record_grant('code', code, access_code.expiry)
+    if access_code.mac_address:
+        record_grant('mac', access_code.mac_address, access_code.expiry)
     db.session.commit()
 
-    logger.info(f"Session started for access code: code={code}, expiry={access_code.expiry}")
+    logger.info("Session started for access code: code=%s, expiry=%s", code, access_code.expiry)
     return jsonify({
         "message": "Session started",
         "code": code,
@@ -446,37 +644,44 @@ def start_session():
 #     }), 200
     
 @payments_bp.route('/check-code-access', methods=['GET'])
+@limiter.limit(route_limit('RATELIMIT_CHECK_CODE'))
 def check_code_access():
     """Check if an access code is still valid and provides access."""
     code = request.args.get('code')
     if not code:
         return jsonify({"error": "Access code required"}), 400
 
+    guess_keys = lockout_keys()
+    retry_after = locked_for(guess_keys)
+    if retry_after:
+        return jsonify({"error": "Too many invalid codes. Try again later.", "retry_after": retry_after}), 429, {"Retry-After": str(retry_after)}
+
     access_code = AccessCode.query.filter_by(code=code).first()
     if not access_code:
-        logger.warning(f"Check code access failed: Invalid code: {code}")
+        record_failure(guess_keys)
+        logger.warning("Check code access failed: Invalid code: %s", code)
         return jsonify({"error": "Invalid access code"}), 404
 
     if access_code.status == 'unused':
-        logger.warning(f"Check code access failed: Code not activated: {code}")
+        logger.warning("Check code access failed: Code not activated: %s", code)
         return jsonify({"error": "Access code not yet activated"}), 400
 
     if access_code.status == 'pending':
-        logger.info(f"Check code access: Code pending: {code}")
+        logger.info("Check code access: Code pending: %s", code)
         return jsonify({
             "message": "Access code pending. Connect to the internet to start your session.",
             "code": code
         }), 200
 
     if access_code.status != 'activated':
-        logger.warning(f"Check code access failed: Code not activated: {code}")
+        logger.warning("Check code access failed: Code not activated: %s", code)
         return jsonify({"error": "Access code not activated"}), 400
 
     current_time = datetime.utcnow()
     if access_code.expiry < current_time:
         access_code.status = 'expired'
         db.session.commit()
-        logger.info(f"Access code expired: code={code}")
+        logger.info("Access code expired: code=%s", code)
         return jsonify({"error": "Access code has expired"}), 400
 
     return jsonify({
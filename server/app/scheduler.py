@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from app.extensions import db
+from app.models.transaction import Transaction
+from app.models.access_code import AccessCode
+from app.models.entitlement_change import EntitlementChange
+from app.models.refund import Refund
+from app.utils import metrics
+from app.utils.metrics import timed_job
+from app.utils.refund_queue import process_refund_queue
+from app.utils.gateways import deauthorize_clients
+from app.utils.devices import idle_devices, mark_disconnected, macs_for_phones
+from app.utils.entitlements import ACTIVE_CODE_STATUSES, batch_entitlements
+from app.utils.rate_limit import normalize_mac
+from app.utils.ttl_store import get_store
+from app.routes.payments import verify_cache_key
+
+
+def create_scheduler(app):
+    """Build the background scheduler for the app's periodic jobs, unstarted.
+
+    Only the serving entry points start it: run.py in single-process modes,
+    run_scheduler.py as its own process next to Gunicorn. Web workers never
+    run it, so each job runs once per deployment rather than once per worker.
+    """
+    # Scheduler task to expire packages and access codes, kicking their devices in one batch
+    @timed_job('check_expired_transactions')
+    def check_expired_transactions():
+        with app.app_context():
+            now = datetime.utcnow()
+            expired_transactions = Transaction.query.filter(
+                Transaction.status == 'SUCCESSFUL',
+                Transaction.expiry <= now
+            ).all()
+            expired_codes = AccessCode.query.filter(
+                AccessCode.status.in_(ACTIVE_CODE_STATUSES),
+                AccessCode.expiry <= now
+            ).all()
+            if not expired_transactions and not expired_codes:
+                return
+            for tx in expired_transactions:
+                app.logger.info("Transaction expired: transaction_id=%s, phone_number=%s", tx.transaction_id, tx.phone_number)
+                tx.status = 'EXPIRED'
+            for access_code in expired_codes:
+                access_code.status = 'expired'
+            # Read targets before commit expires the loaded rows
+            mac_addresses = [c.mac_address for c in expired_codes if c.mac_address]
+            phone_numbers = [tx.phone_number for tx in expired_transactions]
+            transaction_ids = [tx.transaction_id for tx in expired_transactions]
+            db.session.commit()
+            store = get_store(app)
+            for transaction_id in transaction_ids:
+                # /verify would otherwise keep answering SUCCESSFUL from its cache
+                store.delete(verify_cache_key(transaction_id))
+            deauthorize_clients(mac_addresses=lapsed_devices(mac_addresses, phone_numbers, now))
+
+    def lapsed_devices(mac_addresses, phone_numbers, now):
+        """MACs to kick for these expiries, minus any that a renewal or another code still covers."""
+        live_phones = batch_entitlements(phone_numbers=phone_numbers, now=now)['phone_numbers']
+        lapsed_phones = [phone for phone, entry in live_phones.items() if not entry['access']]
+        candidates = batch_entitlements(mac_addresses=list(mac_addresses) + macs_for_phones(lapsed_phones),
+                                        now=now)['mac_addresses']
+        macs = [mac for mac, entry in candidates.items() if not entry['access']]
+        if not macs:
+            return []
+        # Devices whose own purchase (recorded at /initiate) is still running
+        purchased = {normalize_mac(mac) for (mac,) in db.session.query(Transaction.mac_address).filter(
+            Transaction.mac_address.in_(macs),
+            Transaction.status == 'SUCCESSFUL',
+            Transaction.expiry > now
+        )}
+        return [mac for mac in macs if mac not in purchased]
+
+    # Scheduler task to submit queued refunds in batches
+    @timed_job('process_refunds')
+    def process_refunds():
+        with app.app_context():
+            try:
+                process_refund_queue()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error("Refund queue processing failed: %s", e)
+            if metrics.enabled():
+                metrics.set_backlog('refunds', Refund.query.filter_by(status='PENDING').count())
+
+    # Scheduler task to drop expired OTPs, lockouts and idempotency keys from the in-memory store
+    @timed_job('purge_ttl_store')
+    def purge_ttl_store():
+        purged = get_store(app).purge()
+        if purged:
+            app.logger.info("TTL store purged: entries=%s", purged)
+
+    # Scheduler task to trim the gateway change log; gateways behind it re-sync from a snapshot
+    @timed_job('prune_entitlement_changes')
+    def prune_entitlement_changes():
+        with app.app_context():
+            cutoff = datetime.utcnow() - timedelta(days=app.config['ENTITLEMENT_FEED_RETENTION_DAYS'])
+            deleted = EntitlementChange.query.filter(EntitlementChange.created_at < cutoff).delete(synchronize_session=False)
+            db.session.commit()
+            if deleted:
+                app.logger.info("Entitlement changes pruned: rows=%s", deleted)
+
+    # Scheduler task to kick devices that stopped sending heartbeats
+    @timed_job('disconnect_idle_sessions')
+    def disconnect_idle_sessions():
+        with app.app_context():
+            now = datetime.utcnow()
+            macs = idle_devices(app.config['SESSION_IDLE_TIMEOUT_SECONDS'], app.config['IDLE_DISCONNECT_BATCH_SIZE'], now)
+            if macs:
+                deauthorize_clients(mac_addresses=macs)
+                mark_disconnected(macs, now)
+                app.logger.info("Idle sessions disconnected: devices=%s", len(macs))
+
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(check_expired_transactions, 'interval', minutes=1)
+    scheduler.add_job(process_refunds, 'interval', seconds=app.config['REFUND_QUEUE_INTERVAL_SECONDS'],
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(purge_ttl_store, 'interval', minutes=5)
+    scheduler.add_job(prune_entitlement_changes, 'interval', hours=1)
+    if app.config['SESSION_IDLE_TIMEOUT_SECONDS']:
+        scheduler.add_job(disconnect_idle_sessions, 'interval', seconds=app.config['IDLE_CHECK_INTERVAL_SECONDS'],
+                          max_instances=1, coalesce=True)
+    metrics.watch_scheduler(scheduler)
+    return scheduler
+
@@ -0,0 +1,74 @@
+import atexit
+import logging
+import os
+import threading
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_start_lock = threading.Lock()
+_shutdown_hooks = []
+
+
+class LazyThreads:
+    """Worker threads that start on first use in each process.
+
+    Threads do not survive fork, so a component created in a preloaded
+    Gunicorn master must not start them there: each worker starts its own
+    the first time the component is used. CLI commands and tests that
+    never use a component never start its threads at all.
+    """
+
+    def __init__(self, target, name, count=1):
+        self.target = target
+        self.name = name
+        self.count = count
+        self.threads = []
+        self._pid = None
+
+    @property
+    def running(self):
+        return self._pid == os.getpid()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            names = [self.name] if self.count == 1 else [f"{self.name}-{i}" for i in range(self.count)]
+            self.threads = [threading.Thread(target=self.target, name=name, daemon=True) for name in names]
+            for thread in self.threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def join(self, timeout):
+        if not self.running:
+            return
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+def on_shutdown(fn):
+    """Run fn when the process exits, or earlier when shutdown() is called by a server hook."""
+    _shutdown_hooks.append(fn)
+
+
+def shutdown():
+    """Flush and stop background components, newest first. Safe to call more than once."""
+    while _shutdown_hooks:
+        fn = _shutdown_hooks.pop()
+        try:
+            fn()
+        except Exception as e:
+            logger.error("Background shutdown failed: %s", e)
+
+
+def _reset_after_fork():
+    global _start_lock
+    # The parent may have held the lock at the moment it forked
+    _start_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(shutdown)
@@ -0,0 +1,65 @@
+import gzip
+import logging
+from flask import request, current_app
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+_brotli = {'module': None, 'checked': False}
+
+
+def _brotli_module():
+    if not _brotli['checked']:
+        try:
+            import brotli  # Optional; gzip is used alone without it
+            _brotli['module'] = brotli
+        except ImportError:
+            logger.info("brotli is not installed, compressing with gzip only")
+        _brotli['checked'] = True
+    return _brotli['module']
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for a request's Accept-Encoding, preferring brotli when installed."""
+    if accept_encodings.quality('br') > 0 and _brotli_module() is not None:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def _after_request(response):
+    if (response.status_code < 200 or response.status_code in (204, 206, 304) or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    if not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+        return response
+    # The body depends on Accept-Encoding from here on, compressed or not
+    response.vary.add('Accept-Encoding')
+    config = current_app.config
+    if (response.calculate_content_length() or 0) < config.get('COMPRESS_MIN_BYTES', 1024):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if encoding == 'br':
+        body = _brotli_module().compress(data, quality=config.get('COMPRESS_BROTLI_QUALITY', 4))
+    else:
+        body = gzip.compress(data, compresslevel=config.get('COMPRESS_GZIP_LEVEL', 6), mtime=0)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A strong ETag names exact bytes; the compressed body is different bytes
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Compress JSON and text responses above COMPRESS_MIN_BYTES with brotli or gzip, per Accept-Encoding."""
+    if app.config.get('COMPRESS_ENABLED', True):
+        app.after_request(_after_request)
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import secrets
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.utils.metrics import record_cache
+from app.utils.ttl_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+EPOCH_KEY = 'table_version:epoch'
+
+# Tables some conditional view depends on; commits touching others are not counted
+_tracked_tables = set()
+_listening = False
+
+
+def _version_key(table):
+    return f"table_version:{table}"
+
+
+def _modified_key(table):
+    return f"table_modified:{table}"
+
+
+def table_versions(tables, store=None):
+    """[(version, modified_at_epoch_seconds or None), ...] for each table."""
+    store = store or get_store()
+    return [(store.get(_version_key(t), 0), store.get(_modified_key(t))) for t in tables]
+
+
+def bump_tables(tables, store=None):
+    store = store or get_store()
+    now = time.time()
+    for table in tables:
+        store.incr(_version_key(table))
+        store.set(_modified_key(table), now)
+
+
+def _epoch(store):
+    # Counters restart from zero when the store does (MemoryStore on every boot);
+    # the epoch changes with them so ETags from before the restart cannot match
+    epoch = store.get(EPOCH_KEY)
+    if epoch is None:
+        store.add(EPOCH_KEY, secrets.token_hex(8))
+        epoch = store.get(EPOCH_KEY)
+    return epoch
+
+
+def conditional(tables=(), key=None, private=True):
+    """Answer GETs with ETag/Last-Modified and 304 Not Modified when nothing changed.
+
+    The validators come from the version counters of `tables`, bumped on
+    every commit that writes them, plus the path, the query string and
+    whatever `key()` returns (identity, static content). Versions are
+    read before the view runs, so a 304 skips the queries and encoding
+    entirely, and a write racing the view only makes the ETag older than
+    the body, never newer. Put it below the auth decorator.
+    """
+    _tracked_tables.update(tables)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            store = get_store()
+            versions = table_versions(tables, store)
+            parts = (request.path, request.query_string, _epoch(store) if tables else None, versions,
+                     key() if key else None)
+            etag = hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+            stamps = [modified for _, modified in versions if modified]
+            last_modified = datetime.fromtimestamp(int(max(stamps)), timezone.utc) if stamps else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(last_modified and since and last_modified <= since)
+            record_cache('conditional', not_modified)
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)  # Weak, so it survives compression of the body
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache' if private else 'public, no-cache'
+            if private:
+                response.vary.update(('Authorization', 'Cookie'))
+            return response
+        return decorated_function
+    return decorator
+
+
+def _note_tables(session, tables):
+    tables = [t for t in tables if t in _tracked_tables]
+    if tables:
+        session.info.setdefault('changed_tables', set()).update(tables)
+
+
+def _after_flush(session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here
+    tables = {obj.__table__.name for obj in session.new}
+    tables.update(obj.__table__.name for obj in session.deleted)
+    tables.update(obj.__table__.name for obj in session.dirty if session.is_modified(obj))
+    _note_tables(session, tables)
+
+
+def _do_orm_execute(state):
+    # Bulk inserts, upserts and query.delete()/update() bypass the flush
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, 'table', None)
+        if table is not None:
+            _note_tables(state.session, (table.name,))
+
+
+def _after_commit(session):
+    tables = session.info.pop('changed_tables', None)
+    if tables and has_app_context():
+        try:
+            bump_tables(tables)
+        except Exception as e:
+            # Until the next write to these tables, revalidating clients may keep a stale copy
+            logger.error("Table version bump failed: tables=%s, error=%s", sorted(tables), e)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    # A rolled-back savepoint leaves the outer transaction's writes to commit
+    if not previous_transaction.nested:
+        session.info.pop('changed_tables', None)
+
+
+def init_app(app):
+    """Count commits per table in the TTL store for conditional() views.
+
+    With several workers or nodes TTL_STORE_URL must point at Redis, as
+    for the other shared state, so every worker sees every bump.
+    """
+    global _listening
+    if not _listening:
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'do_orm_execute', _do_orm_execute)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
+        _listening = True
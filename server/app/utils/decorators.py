@@ -1,26 +1,36 @@
 from functools import wraps
-from flask import request, jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask import request, jsonify, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
 from app.models import User, Transaction
+from app.utils.principals import token_is_current, principal_kind
 from datetime import datetime
+import hmac
 import logging
 
 # Configure logger
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+
+def claims_phone_number(claims):
+    """Phone number from user JWT claims, looking the user up only for older tokens."""
+    if not claims or principal_kind(claims) == 'admin':
+        return None
+    if claims.get('phone_number'):
+        return claims['phone_number']
+    user = User.query.get(claims['sub'])
+    return user.phone_number if user else None
+
 
 def payment_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user_id = None
+        claims = {}
         try:
             verify_jwt_in_request()
-            user_id = get_jwt_identity()
+            claims = get_jwt()
         except Exception:
             pass
 
-        phone_number = request.args.get('phone_number') or \
-                       (User.query.get(user_id).phone_number if user_id else None)
+        phone_number = request.args.get('phone_number') or claims_phone_number(claims)
 
         if not phone_number:
             return jsonify({"error": "Phone number required"}), 400
@@ -39,32 +49,67 @@ def payment_required(f):
     return decorated_function
 
 
-def admin_required(f):
+def _claims_required(f, principals):
+    """Authorize from signed JWT claims alone; no principal SELECT on the hot path."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
             # 1. Verify JWT first
             verify_jwt_in_request()
-            
-            # 2. Get user
-            user_id = get_jwt_identity()
-            user = User.query.get(user_id)
-            
-            # 3. Validate admin status
-            if not user or not user.is_admin:
-                logger.warning(f"Admin access denied for user_id={user_id}")
+            claims = get_jwt()
+
+            # 2. Validate admin status from claims
+            if not claims.get('is_admin') or principal_kind(claims) not in principals:
+                logger.warning("Admin access denied for identity=%s", claims.get('sub'))
                 return jsonify({
                     "error": "Administrator privileges required",
                     "code": "ADMIN_ACCESS_DENIED"
                 }), 403
-            
-            return f(*args, **kwargs)
-            
+
+            # 3. Reject tokens issued before a revocation
+            if not token_is_current(claims):
+                logger.warning("Revoked token used: principal=%s, identity=%s", principal_kind(claims), claims.get('sub'))
+                return jsonify({
+                    "error": "Token has been revoked",
+                    "code": "TOKEN_REVOKED"
+                }), 401
         except Exception as e:
-            logger.error(f"Admin check failed: {str(e)}")
+            logger.error("Admin check failed: %s", e)
             return jsonify({
                 "error": "Authorization verification failed",
                 "code": "AUTH_VERIFICATION_ERROR"
             }), 401
-            
-    return decorated_function
\ No newline at end of file
+
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def admin_required(f):
+    """Any administrator: portal admins or users flagged is_admin."""
+    return _claims_required(f, ('admin', 'user'))
+
+
+def portal_admin_required(f):
+    """Admins from the admins table who completed TOTP verification."""
+    return _claims_required(f, ('admin',))
+
+
+def gateway_required(f):
+    """Require the shared gateway token, X-Gateway-Token.
+
+    Fails closed: without GATEWAY_API_TOKEN the endpoints answer 503,
+    except in debug mode, where they stay open for local testing.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected = current_app.config.get('GATEWAY_API_TOKEN')
+        if expected:
+            supplied = request.headers.get('X-Gateway-Token', '')
+            if not hmac.compare_digest(supplied.encode(), expected.encode()):
+                logger.warning("Gateway request rejected: bad token from %s", request.remote_addr)
+                return jsonify({"error": "Invalid gateway token"}), 401
+        elif not current_app.debug:
+            logger.error("Gateway request rejected: GATEWAY_API_TOKEN is not configured")
+            return jsonify({"error": "Gateway API is not configured"}), 503
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,185 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from app.extensions import db
+from app.models.device import Device
+from app.utils.background import LazyThreads, on_shutdown
+from app.utils.metrics import set_backlog
+from app.utils.rate_limit import normalize_mac, client_mac
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement, kept well under SQLite's bound-parameter limit
+UPSERT_CHUNK = 200
+
+
+def upsert_devices(rows):
+    """Insert or refresh device rows keyed by MAC; a known phone number is never overwritten with None."""
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            stmt = insert(Device).values(rows[i:i + UPSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(index_elements=['mac_address'], set_={
+                'last_seen': stmt.excluded.last_seen,
+                'phone_number': func.coalesce(stmt.excluded.phone_number, Device.phone_number)
+            })
+            db.session.execute(stmt)
+    else:
+        by_mac = {row['mac_address']: row for row in rows}
+        for device in Device.query.filter(Device.mac_address.in_(list(by_mac))).all():
+            row = by_mac.pop(device.mac_address)
+            device.last_seen = row['last_seen']
+            device.phone_number = row['phone_number'] or device.phone_number
+        db.session.add_all(Device(**row) for row in by_mac.values())
+    db.session.commit()
+
+
+class DeviceRecorder:
+    """Coalesces device sightings in memory and writes them in batched upserts.
+
+    Requests only update a dict, so a device polling every few seconds
+    costs one row write per flush interval rather than one per request.
+    A background thread flushes every interval, or sooner once batch_size
+    distinct devices are waiting.
+    """
+
+    def __init__(self, app, interval=5, batch_size=500):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._threads = LazyThreads(self._run, 'device-recorder')
+
+    def note(self, mac_address, phone_number=None):
+        mac = normalize_mac(mac_address)
+        if not mac:
+            return
+        self._threads.ensure_started()
+        if phone_number and len(phone_number) > 15:
+            phone_number = None  # Not a phone number; would fail the whole batch on insert
+        now = datetime.utcnow()
+        with self._lock:
+            previous = self._pending.get(mac)
+            self._pending[mac] = {
+                'mac_address': mac,
+                'phone_number': phone_number or (previous['phone_number'] if previous else None),
+                'first_seen': previous['first_seen'] if previous else now,
+                'last_seen': now
+            }
+            waiting = len(self._pending)
+        set_backlog('devices', waiting)
+        if waiting >= self.batch_size:
+            self._wake.set()
+
+    def pending_macs(self, phone_numbers=None):
+        """Buffered MACs, optionally only those noted with one of the phone numbers."""
+        with self._lock:
+            if phone_numbers is None:
+                return list(self._pending)
+            phones = set(phone_numbers)
+            return [mac for mac, row in self._pending.items() if row['phone_number'] in phones]
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        set_backlog('devices', 0)
+        if not rows:
+            return 0
+        with self.app.app_context():
+            try:
+                upsert_devices(rows)
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Device upsert failed, keeping %s rows for the next flush: %s", len(rows), e)
+                with self._lock:
+                    for row in rows:
+                        self._pending.setdefault(row['mac_address'], row)
+                    set_backlog('devices', len(self._pending))
+                return 0
+        return len(rows)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def shutdown(self):
+        self._stopped = True
+        self._wake.set()
+        self._threads.join(self.interval + 1)
+        self.flush()
+
+
+def note_device(mac_address, phone_number=None):
+    """Record that a device was seen, optionally with the phone number used on it."""
+    current_app.extensions['devices'].note(mac_address, phone_number)
+
+
+def macs_for_phones(phone_numbers):
+    """MACs last used with any of the phone numbers, in one query plus not-yet-flushed sightings."""
+    phone_numbers = list(dict.fromkeys(p for p in phone_numbers if p))
+    if not phone_numbers:
+        return []
+    rows = db.session.query(Device.mac_address).filter(Device.phone_number.in_(phone_numbers)).all()
+    return list(dict.fromkeys([mac for (mac,) in rows] + current_app.extensions['devices'].pending_macs(phone_numbers)))
+
+
+def active_device_count(window_seconds, now=None):
+    """Devices seen within the window, counting sightings still waiting in the buffer."""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=window_seconds)
+    pending = current_app.extensions['devices'].pending_macs()
+    query = db.session.query(func.count(Device.id)).filter(Device.last_seen >= cutoff)
+    if pending:
+        query = query.filter(Device.mac_address.notin_(pending))
+    return query.scalar() + len(pending)
+
+
+def idle_devices(idle_seconds, limit, now=None):
+    """MACs silent for idle_seconds that have not been kicked since they were last seen."""
+    now = now or datetime.utcnow()
+    pending = current_app.extensions['devices'].pending_macs()
+    query = db.session.query(Device.mac_address).filter(
+        Device.last_seen < now - timedelta(seconds=idle_seconds),
+        or_(Device.disconnected_at.is_(None), Device.disconnected_at < Device.last_seen)
+    )
+    if pending:
+        query = query.filter(Device.mac_address.notin_(pending))
+    return [mac for (mac,) in query.order_by(Device.last_seen).limit(limit).all()]
+
+
+def mark_disconnected(mac_addresses, now=None):
+    if mac_addresses:
+        Device.query.filter(Device.mac_address.in_(mac_addresses)).update(
+            {Device.disconnected_at: now or datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+
+def _note_request():
+    # A sighting only: a phone number in the request proves nothing, so devices are
+    # linked to phones by authorize_device, after a purchase or activation succeeds
+    mac_address = client_mac()
+    if mac_address:
+        current_app.extensions['devices'].note(mac_address)
+
+
+def init_app(app):
+    """Track X-Client-MAC on every request and flush sightings in the background."""
+    recorder = DeviceRecorder(
+        app,
+        interval=app.config.get('DEVICE_FLUSH_INTERVAL_SECONDS', 5),
+        batch_size=app.config.get('DEVICE_FLUSH_BATCH_SIZE', 500)
+    )
+    app.extensions['devices'] = recorder
+    app.before_request(_note_request)
+    on_shutdown(recorder.shutdown)
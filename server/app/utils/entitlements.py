@@ -0,0 +1,194 @@
+import logging
+from datetime import datetime
+from sqlalchemy import func
+from app.extensions import db
+from app.models.access_code import AccessCode
+from app.models.device import Device
+from app.models.entitlement_change import EntitlementChange
+from app.models.exclusion import Exclusion
+from app.models.transaction import Transaction
+from app.utils.rate_limit import normalize_mac
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Access code statuses that grant access until the code's expiry
+ACTIVE_CODE_STATUSES = ('used', 'activated')
+
+
+def record_grant(subject_type, value, expiry):
+    """Log a grant for the gateway feed. Committed together with the caller's change."""
+    if subject_type == 'mac':
+        value = normalize_mac(value)
+    if value and expiry:
+        EntitlementChange.record('grant', subject_type, value, expiry)
+
+
+def record_exclusion(exclusion, removed=False):
+    """Log an exclusion that blocks connection (or its removal) for the gateway feed."""
+    if not exclusion.exclude_from_connection:
+        return
+    subject_type = exclusion.type.lower()
+    value = normalize_mac(exclusion.value) if subject_type == 'mac' else exclusion.value
+    if value:
+        EntitlementChange.record('unexclude' if removed else 'exclude', subject_type, value)
+
+
+def _mac_variants(macs):
+    """Stored MACs are whatever the gateway sent, so match common spellings of each."""
+    variants = set()
+    for mac in macs:
+        variants.update({mac, mac.upper(), mac.replace(':', '-'), mac.upper().replace(':', '-')})
+    return list(variants)
+
+
+def _entry(expiry, now):
+    if expiry is None or expiry <= now:
+        return {"access": False, "remaining_seconds": 0, "expiry": None}
+    return {"access": True, "remaining_seconds": int((expiry - now).total_seconds()), "expiry": expiry.isoformat()}
+
+
+def batch_entitlements(phone_numbers=(), mac_addresses=(), codes=(), now=None):
+    """Entitlements for many clients at once.
+
+    Uses one aggregate query per identifier type plus one exclusion
+    query, however many clients are asked about. MACs are returned
+    under their normalised aa:bb:cc:dd:ee:ff form.
+    """
+    now = now or datetime.utcnow()
+    phone_numbers = list(dict.fromkeys(p for p in phone_numbers if p))
+    macs = list(dict.fromkeys(m for m in (normalize_mac(m) for m in mac_addresses) if m))
+    codes = list(dict.fromkeys(c for c in codes if c))
+
+    excluded = set()
+    if phone_numbers or macs:
+        excluded = {value for (value,) in db.session.query(Exclusion.value).filter(
+            Exclusion.exclude_from_connection.is_(True),
+            Exclusion.value.in_(phone_numbers + _mac_variants(macs))
+        )}
+        excluded |= {normalize_mac(v) for v in excluded if normalize_mac(v)}
+
+    phone_expiry = {}
+    if phone_numbers:
+        phone_expiry = dict(db.session.query(Transaction.phone_number, func.max(Transaction.expiry)).filter(
+            Transaction.phone_number.in_(phone_numbers),
+            Transaction.status == 'SUCCESSFUL',
+            Transaction.expiry > now
+        ).group_by(Transaction.phone_number).all())
+
+    mac_expiry = {}
+    if macs:
+        rows = db.session.query(AccessCode.mac_address, func.max(AccessCode.expiry)).filter(
+            AccessCode.mac_address.in_(_mac_variants(macs)),
+            AccessCode.status.in_(ACTIVE_CODE_STATUSES),
+            AccessCode.expiry > now
+        ).group_by(AccessCode.mac_address).all()
+        for mac, expiry in rows:
+            key = normalize_mac(mac)
+            if key and (key not in mac_expiry or expiry > mac_expiry[key]):
+                mac_expiry[key] = expiry
+
+    code_expiry = {}
+    if codes:
+        code_expiry = dict(db.session.query(AccessCode.code, AccessCode.expiry).filter(
+            AccessCode.code.in_(codes),
+            AccessCode.status.in_(ACTIVE_CODE_STATUSES)
+        ).all())
+
+    def build(values, expiries):
+        result = {}
+        for value in values:
+            if value in excluded:
+                result[value] = {"access": False, "remaining_seconds": 0, "expiry": None, "reason": "excluded"}
+            else:
+                result[value] = _entry(expiries.get(value), now)
+        return result
+
+    return {
+        "phone_numbers": build(phone_numbers, phone_expiry),
+        "mac_addresses": build(macs, mac_expiry),
+        "codes": build(codes, code_expiry)
+    }
+
+
+def device_entitlements(mac_addresses, now=None):
+    """The latest-expiring live entitlement of each device, for authorizing it again.
+
+    A device is covered by access codes activated on it, by its own
+    purchases (the MAC recorded at /initiate) and by purchases of the
+    phone it was linked to when a purchase succeeded. Excluded devices
+    and phones are left out. Returns {mac: {"expiry", "package_id", "key"}}
+    with key the entitlement's usage session key.
+    """
+    now = now or datetime.utcnow()
+    macs = list(dict.fromkeys(m for m in (normalize_mac(m) for m in mac_addresses) if m))
+    if not macs:
+        return {}
+
+    found = {}
+
+    def offer(mac, expiry, package_id, key, phone_number=None):
+        mac = normalize_mac(mac)
+        if mac and (mac not in found or expiry > found[mac][0]):
+            found[mac] = (expiry, package_id, key, phone_number)
+
+    for mac, expiry, plan_id, code in db.session.query(
+        AccessCode.mac_address, AccessCode.expiry, AccessCode.plan_id, AccessCode.code
+    ).filter(
+        AccessCode.mac_address.in_(_mac_variants(macs)),
+        AccessCode.status.in_(ACTIVE_CODE_STATUSES),
+        AccessCode.expiry > now
+    ):
+        offer(mac, expiry, plan_id, f"code:{code}")
+
+    live = (Transaction.status == 'SUCCESSFUL', Transaction.expiry > now)
+    columns = (Transaction.expiry, Transaction.package_id, Transaction.transaction_id, Transaction.phone_number)
+    for mac, expiry, package_id, transaction_id, phone in db.session.query(Transaction.mac_address, *columns).filter(
+        Transaction.mac_address.in_(macs), *live
+    ):
+        offer(mac, expiry, package_id, f"tx:{transaction_id}", phone)
+    for mac, expiry, package_id, transaction_id, phone in db.session.query(Device.mac_address, *columns).join(
+        Transaction, Transaction.phone_number == Device.phone_number
+    ).filter(Device.mac_address.in_(macs), *live):
+        offer(mac, expiry, package_id, f"tx:{transaction_id}", phone)
+    if not found:
+        return {}
+
+    phones = [phone for _, _, _, phone in found.values() if phone]
+    excluded = {value for (value,) in db.session.query(Exclusion.value).filter(
+        Exclusion.exclude_from_connection.is_(True),
+        Exclusion.value.in_(phones + _mac_variants(list(found)))
+    )}
+    excluded |= {normalize_mac(v) for v in excluded if normalize_mac(v)}
+    return {mac: {"expiry": expiry, "package_id": package_id, "key": key}
+            for mac, (expiry, package_id, key, phone) in found.items()
+            if mac not in excluded and phone not in excluded}
+
+
+def entitlement_snapshot(now=None):
+    """Every live grant and connection exclusion, in change-feed format (without ids)."""
+    now = now or datetime.utcnow()
+    entries = []
+
+    for phone_number, expiry in db.session.query(Transaction.phone_number, func.max(Transaction.expiry)).filter(
+        Transaction.status == 'SUCCESSFUL',
+        Transaction.expiry > now
+    ).group_by(Transaction.phone_number):
+        entries.append({"op": "grant", "type": "phone", "value": phone_number, "expiry": expiry.isoformat()})
+
+    for code, mac, expiry in db.session.query(AccessCode.code, AccessCode.mac_address, AccessCode.expiry).filter(
+        AccessCode.status.in_(ACTIVE_CODE_STATUSES),
+        AccessCode.expiry > now
+    ):
+        entries.append({"op": "grant", "type": "code", "value": code, "expiry": expiry.isoformat()})
+        if normalize_mac(mac):
+            entries.append({"op": "grant", "type": "mac", "value": normalize_mac(mac), "expiry": expiry.isoformat()})
+
+    for kind, value in db.session.query(Exclusion.type, Exclusion.value).filter(
+        Exclusion.exclude_from_connection.is_(True)
+    ):
+        value = normalize_mac(value) if kind.upper() == 'MAC' else value
+        if value:
+            entries.append({"op": "exclude", "type": kind.lower(), "value": value, "expiry": None})
+
+    return entries
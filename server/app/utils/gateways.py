@@ -0,0 +1,279 @@
+import json
+import logging
+import subprocess
+import threading
+import urllib.parse
+from datetime import datetime
+from flask import current_app
+from app.utils.metrics import timed_call
+from app.utils.rate_limit import normalize_mac
+from app.utils.ttl_store import get_store
+from app.utils.devices import note_device, macs_for_phones
+from app.utils.entitlements import device_entitlements
+from app.utils.usage import start_usage_session, entitlement_key
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """A gateway rejected a command or could not be reached."""
+
+
+class LoopbackDriver:
+    """In-process stand-in for a router; keeps authorized clients and every call made."""
+
+    def __init__(self, name='loopback'):
+        self.name = name
+        self.clients = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def authorize(self, clients):
+        with self._lock:
+            self.calls.append(('authorize', list(clients)))
+            for mac, seconds in clients:
+                self.clients[mac] = {"mac": mac, "state": "Authenticated", "session_seconds": seconds}
+
+    def deauthorize(self, macs):
+        with self._lock:
+            self.calls.append(('deauthorize', list(macs)))
+            for mac in macs:
+                self.clients.pop(mac, None)
+
+    def list_clients(self):
+        with self._lock:
+            return list(self.clients.values())
+
+
+class NdsctlDriver:
+    """NoDogSplash through ndsctl, run locally or on the router over ssh.
+
+    A batch becomes one shell script piped to a single `sh -s`, so
+    authorizing a thousand clients costs one process (and one ssh
+    session) instead of a thousand.
+    """
+
+    def __init__(self, target='local', ndsctl='ndsctl', timeout=10):
+        self.name = target
+        self.ndsctl = ndsctl
+        self.timeout = timeout
+        self._prefix = [] if target == 'local' else ['ssh', '-o', 'BatchMode=yes', target]
+
+    def _run(self, script):
+        try:
+            result = subprocess.run(self._prefix + ['sh', '-s'], input=script, capture_output=True,
+                                    text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise GatewayError(f"ndsctl on {self.name} failed: {e}")
+        if result.returncode != 0:
+            raise GatewayError(f"ndsctl on {self.name} exited {result.returncode}: {result.stderr.strip()}")
+        return result.stdout
+
+    def authorize(self, clients):
+        # ndsctl takes the session timeout in minutes; 0 means the gateway default
+        lines = [f"{self.ndsctl} auth {mac} {max(1, -(-int(seconds) // 60)) if seconds else 0}"
+                 for mac, seconds in clients]
+        self._run('\n'.join(lines) + '\n')
+
+    def deauthorize(self, macs):
+        self._run(''.join(f"{self.ndsctl} deauth {mac}\n" for mac in macs))
+
+    def list_clients(self):
+        try:
+            data = json.loads(self._run(f"{self.ndsctl} json\n") or '{}')
+        except ValueError as e:
+            raise GatewayError(f"ndsctl on {self.name} returned invalid JSON: {e}")
+        return [{"mac": normalize_mac(mac) or mac, "ip": info.get('ip'), "state": info.get('state')}
+                for mac, info in (data.get('clients') or {}).items()]
+
+
+class HttpDriver:
+    """Gateways (or an agent on them) exposing /authorize, /deauthorize and /clients over HTTP."""
+
+    def __init__(self, base_url, token=None, timeout=10):
+        import requests
+        self.name = base_url
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._session = requests.Session()
+        if token:
+            self._session.headers['X-Gateway-Token'] = token
+
+    def _request(self, method, path, **kwargs):
+        import requests
+        try:
+            response = self._session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+            return response.json() if response.content else {}
+        except (requests.RequestException, ValueError) as e:
+            raise GatewayError(f"{method} {self.base_url}{path} failed: {e}")
+
+    def authorize(self, clients):
+        self._request('POST', '/authorize', json={"clients": [{"mac": mac, "seconds": seconds} for mac, seconds in clients]})
+
+    def deauthorize(self, macs):
+        self._request('POST', '/deauthorize', json={"macs": list(macs)})
+
+    def list_clients(self):
+        return self._request('GET', '/clients').get('clients', [])
+
+
+class GatewayGroup:
+    """Fans each batch out to every gateway: one call per gateway, whatever the batch size.
+
+    A failing gateway is logged and skipped so the others still get the batch.
+    """
+
+    def __init__(self, drivers):
+        self.drivers = drivers
+
+    def _each(self, op, *args):
+        results, failed = [], []
+        for driver in self.drivers:
+            try:
+                with timed_call('gateway', op):
+                    results.append((driver, getattr(driver, op)(*args)))
+            except GatewayError as e:
+                failed.append(driver.name)
+                logger.error("Gateway %s failed: gateway=%s, error=%s", op, driver.name, e)
+        return results, failed
+
+    def authorize(self, clients):
+        return self._each('authorize', clients)[1]
+
+    def deauthorize(self, macs):
+        return self._each('deauthorize', macs)[1]
+
+    def list_clients(self):
+        results, _ = self._each('list_clients')
+        return [dict(client, gateway=driver.name) for driver, clients in results for client in clients]
+
+
+def fas_auth_url(authaction, tok, redir=None):
+    """Where to send a client to finish NoDogSplash FAS authentication, or None if the params are unusable."""
+    parsed = urllib.parse.urlparse(authaction or '')
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc or not tok:
+        return None
+    query = {"tok": tok}
+    if redir:
+        query["redir"] = redir
+    return f"{authaction}{'&' if parsed.query else '?'}{urllib.parse.urlencode(query)}"
+
+
+def create_gateway(config):
+    name = config.get('GATEWAY_DRIVER') or 'loopback'
+    targets = [t.strip() for t in (config.get('GATEWAY_TARGETS') or '').split(',') if t.strip()]
+    timeout = config.get('GATEWAY_DRIVER_TIMEOUT', 10)
+    if name == 'loopback':
+        drivers = [LoopbackDriver(t) for t in targets] or [LoopbackDriver()]
+    elif name == 'ndsctl':
+        drivers = [NdsctlDriver(t, config.get('GATEWAY_NDSCTL_PATH', 'ndsctl'), timeout) for t in targets or ['local']]
+    elif name == 'http':
+        if not targets:
+            raise ValueError("GATEWAY_TARGETS must list gateway URLs for the http driver")
+        drivers = [HttpDriver(t, config.get('GATEWAY_DRIVER_TOKEN'), timeout) for t in targets]
+    else:
+        raise ValueError(f"Unknown GATEWAY_DRIVER: {name}")
+    return GatewayGroup(drivers)
+
+
+def init_app(app):
+    """Create the app's gateway drivers from config."""
+    app.extensions['gateway'] = create_gateway(app.config)
+    app.logger.info("Gateway driver configured: %s", app.config.get('GATEWAY_DRIVER') or 'loopback')
+
+
+def get_gateway():
+    return current_app.extensions['gateway']
+
+
+def authorize_clients(clients):
+    """Authorize (mac, seconds) pairs on every gateway in one call each. Returns failed gateway names."""
+    batch = {}
+    for mac, seconds in clients:
+        mac = normalize_mac(mac)
+        if mac:
+            batch[mac] = max(int(seconds or 0), batch.get(mac, 0))
+    if not batch:
+        return []
+    failed = get_gateway().authorize(list(batch.items()))
+    logger.info("Gateway authorize: clients=%s, failed_gateways=%s", len(batch), failed)
+    return failed
+
+
+def authorize_device(mac_address, expiry, phone_number=None, quota_bytes=None, entitlement=None):
+    """Open the gateway for a device until expiry, once per device and entitlement.
+
+    Safe to call concurrently and repeatedly: an atomic claim in the TTL
+    store lets one caller at a time through to the gateway, and repeats
+    for the same MAC and expiry stop at the authorized mark. The mark is
+    only written once the gateway accepts the device, so a failed call is
+    retried by the next attempt. A device that has used up its data
+    bundle is not re-opened for the same entitlement. `entitlement` is the
+    usage session key from usage.entitlement_key(), shared by every device
+    on one purchase or code.
+    """
+    if phone_number:
+        note_device(mac_address, phone_number)
+    mac = normalize_mac(mac_address)
+    if not mac or not expiry:
+        return
+    seconds = int((expiry - datetime.utcnow()).total_seconds())
+    store = get_store()
+    if seconds <= 0 or store.get(f"gw:authorized:{mac}") == expiry.isoformat():
+        return
+    # Held only while this call talks to the gateway; expires by itself if the process dies meanwhile
+    claim = f"gw:authorizing:{mac}"
+    if not store.add(claim, True, ttl=current_app.config.get('GATEWAY_DRIVER_TIMEOUT', 10) * 3):
+        return
+    try:
+        if store.get(f"gw:authorized:{mac}") == expiry.isoformat():
+            return  # Another caller finished between the check and the claim
+        if not start_usage_session(mac, entitlement or entitlement_key('expiry', expiry.isoformat()), quota_bytes):
+            return
+        failed = authorize_clients([(mac, seconds)])
+        if failed:
+            logger.warning("Device authorization failed: mac=%s, gateways=%s", mac, failed)
+            return
+        store.set(f"gw:authorized:{mac}", expiry.isoformat(), ttl=seconds)
+    finally:
+        store.delete(claim)
+
+
+def reauthorize_devices(mac_addresses):
+    """Open the gateway again for sighted devices that lost their session but are still entitled.
+
+    Covers devices kicked for idling or by an admin while their purchase
+    or code runs on; heartbeats call it, so each device is looked up at
+    most once per DEVICE_REAUTH_CHECK_SECONDS while it is not authorized.
+    """
+    store = get_store()
+    check_seconds = current_app.config.get('DEVICE_REAUTH_CHECK_SECONDS', 30)
+    macs = [mac for mac in dict.fromkeys(normalize_mac(m) for m in mac_addresses)
+            if mac and store.get(f"gw:authorized:{mac}") is None
+            and store.add(f"gw:reauth-check:{mac}", True, ttl=check_seconds)]
+    if not macs:
+        return 0
+    from app.routes.payments import package_quota_bytes  # The payments routes import this module
+    entitled = device_entitlements(macs)
+    for mac, entitlement in entitled.items():
+        authorize_device(mac, entitlement['expiry'], quota_bytes=package_quota_bytes(entitlement['package_id']),
+                         entitlement=entitlement['key'])
+    if entitled:
+        logger.info("Devices re-authorized on sighting: count=%s", len(entitled))
+    return len(entitled)
+
+
+def deauthorize_clients(mac_addresses=(), phone_numbers=()):
+    """Deauthorize devices by MAC and by the MACs indexed for each phone, in one call per gateway."""
+    macs = list(dict.fromkeys(m for m in (normalize_mac(m) for m in list(mac_addresses) + macs_for_phones(phone_numbers)) if m))
+    if not macs:
+        return []
+    failed = get_gateway().deauthorize(macs)
+    store = get_store()
+    for mac in macs:
+        # Let the next successful poll authorize the device again
+        store.delete(f"gw:authorized:{mac}")
+    logger.info("Gateway deauthorize: clients=%s, failed_gateways=%s", len(macs), failed)
+    return failed
@@ -0,0 +1,75 @@
+import hashlib
+import logging
+from functools import wraps
+from flask import request, jsonify, current_app
+from app.utils.metrics import record_cache
+from app.utils.ttl_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _fingerprint():
+    """Hash of the request body, used to reject key reuse with a different payload."""
+    return hashlib.sha256(request.get_data() or b'').hexdigest()
+
+
+def idempotent(f):
+    """Replay the first response for requests that repeat an Idempotency-Key.
+
+    Requests without the header are passed straight through. While the
+    first request is still running, repeats get a 409 instead of running
+    the view a second time. Only responses below 500 are remembered so
+    that clients can retry server errors with the same key.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": "Idempotency-Key is too long"}), 400
+
+        store = get_store()
+        store_key = f"idem:{request.path}:{key}"
+        fingerprint = _fingerprint()
+        ttl = current_app.config.get('IDEMPOTENCY_TTL_SECONDS', 86400)
+
+        claimed = store.add(store_key, {"state": "in_flight", "fingerprint": fingerprint},
+                            ttl=current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+        record_cache('idempotency', not claimed)
+        if not claimed:
+            cached = store.get(store_key)
+            if cached is None:
+                # Lock expired between add() and get(); let the client retry
+                return jsonify({"error": "Request with this Idempotency-Key is in progress"}), 409
+            if cached.get('fingerprint') != fingerprint:
+                logger.warning("Idempotency-Key reused with different payload: path=%s", request.path)
+                return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+            if cached.get('state') == 'in_flight':
+                return jsonify({"error": "Request with this Idempotency-Key is in progress"}), 409
+            logger.info("Idempotent replay: path=%s", request.path)
+            response = jsonify(cached['body'])
+            response.status_code = cached['status']
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            store.delete(store_key)
+            raise
+
+        if response.status_code < 500 and response.is_json:
+            store.set(store_key, {
+                "state": "done",
+                "fingerprint": fingerprint,
+                "status": response.status_code,
+                "body": response.get_json()
+            }, ttl=ttl)
+        else:
+            store.delete(store_key)
+        return response
+    return decorated_function
@@ -0,0 +1,69 @@
+import logging
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """Flask's stdlib provider, but dates and datetimes go out as ISO 8601.
+
+    Flask's default renders datetimes as HTTP dates, while every to_dict()
+    in the app already used isoformat(); this way both paths agree and
+    serializers can hand raw datetimes to the provider.
+    """
+
+    sort_keys = False  # Dicts are built in a deliberate order; sorting only costs time
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(IsoJSONProvider):
+    """JSON provider backed by orjson, which encodes datetimes, UUIDs and dataclasses natively in C."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self._orjson = orjson
+
+    def _options(self, indent=False):
+        option = self._orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= self._orjson.OPT_SORT_KEYS
+        if indent:
+            option |= self._orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj, indent=False):
+        return self._orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        # Skip the bytes -> str -> bytes round trip that dumps() would cost
+        return self._app.response_class(self._encode(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Install the JSON provider named by JSON_PROVIDER: 'orjson' (default) or 'stdlib'."""
+    name = app.config.get('JSON_PROVIDER', 'orjson')
+    if name == 'orjson':
+        try:
+            app.json = OrjsonProvider(app)
+            return
+        except ImportError:
+            logger.warning("orjson is not installed, falling back to the stdlib JSON provider")
+    elif name != 'stdlib':
+        raise ValueError(f"Unknown JSON_PROVIDER: {name}")
+    app.json = IsoJSONProvider(app)
@@ -0,0 +1,84 @@
+import logging
+import time
+from flask import current_app
+from app.utils.rate_limit import client_mac
+from app.utils.ttl_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def lockout_keys():
+    """Identities a guess is charged to: the device MAC, when the gateway attests it.
+
+    A MAC from the client alone is not charged, since rotating it would
+    dodge the lock, and neither is the IP, which the whole venue shares
+    behind its NAT. Such guesses are left to the per-IP rate limit.
+    """
+    mac = client_mac()
+    return [f"mac:{mac}"] if mac else []
+
+
+def locked_for(keys):
+    """Seconds until every key is unlocked; 0 if none is locked. Touches only the store."""
+    store = get_store()
+    remaining = 0
+    for key in keys:
+        lock = store.get(f"lockout:lock:{key}")
+        if lock:
+            remaining = max(remaining, lock['until'] - time.time())
+    return max(0, int(remaining + 0.999))
+
+
+def record_failure(keys):
+    """Count a failed guess; lock a key once it reaches its threshold.
+
+    Each lockout doubles the previous one (LOCKOUT_BASE_SECONDS up to
+    LOCKOUT_MAX_SECONDS). Failure counts decay after
+    LOCKOUT_FAILURE_WINDOW_SECONDS and the doubling level after
+    LOCKOUT_LEVEL_DECAY_SECONDS without further lockouts.
+    """
+    store = get_store()
+    config = current_app.config
+    for key in keys:
+        failures = store.incr(f"lockout:fails:{key}", ttl=config.get('LOCKOUT_FAILURE_WINDOW_SECONDS', 900))
+        if failures < config.get('LOCKOUT_MAC_THRESHOLD', 5):
+            continue
+        level = store.incr(f"lockout:level:{key}", ttl=config.get('LOCKOUT_LEVEL_DECAY_SECONDS', 86400))
+        duration = min(config.get('LOCKOUT_MAX_SECONDS', 86400),
+                       config.get('LOCKOUT_BASE_SECONDS', 60) * 2 ** (level - 1))
+        store.set(f"lockout:lock:{key}", {
+            "until": time.time() + duration,
+            "level": level,
+            "failures": failures
+        }, ttl=duration)
+        store.delete(f"lockout:fails:{key}")
+        logger.warning("Lockout applied: key=%s, level=%s, seconds=%s", key, level, duration)
+
+
+def record_success(keys):
+    store = get_store()
+    for key in keys:
+        store.delete(f"lockout:fails:{key}")
+
+
+def active_lockouts():
+    """Current lockouts for the admin dashboard."""
+    now = time.time()
+    lockouts = []
+    for store_key, lock in get_store().scan('lockout:lock:'):
+        remaining = int(lock['until'] - now)
+        if remaining > 0:
+            lockouts.append({
+                "key": store_key[len('lockout:lock:'):],
+                "level": lock['level'],
+                "failures": lock.get('failures'),
+                "remaining_seconds": remaining
+            })
+    return sorted(lockouts, key=lambda l: l['remaining_seconds'], reverse=True)
+
+
+def clear_lockout(key):
+    store = get_store()
+    for prefix in ('lockout:lock:', 'lockout:fails:', 'lockout:level:'):
+        store.delete(prefix + key)
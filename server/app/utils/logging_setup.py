@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from app.utils.background import on_shutdown
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# The listener running for this process; create_app may be called more than once
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def parse_levels(spec):
+    """'app.routes.payments=DEBUG,werkzeug=WARNING' -> {'app.routes.payments': 'DEBUG', 'werkzeug': 'WARNING'}"""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def build_handlers(config):
+    """The file and stderr handlers LOG_FILE, LOG_TO_STDERR and LOG_FORMAT ask for, formatter attached."""
+    formatter = JsonFormatter() if config.get('LOG_FORMAT') == 'json' else logging.Formatter(TEXT_FORMAT)
+
+    handlers = []
+    if config.get('LOG_FILE'):
+        file_handler = RotatingFileHandler(config['LOG_FILE'], maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                           backupCount=config.get('LOG_BACKUP_COUNT', 5), delay=True)
+        handlers.append(file_handler)
+    if config.get('LOG_TO_STDERR', True):
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def init_app(app):
+    """Route all logging through a queue so file and console I/O happen on a listener thread.
+
+    Request threads only put the record on an in-memory queue, after
+    QueueHandler.prepare() has merged its arguments into the message (it
+    does that on the calling thread); the line format and the writes run
+    on the listener. Messages use %-style arguments so records below the
+    configured level are never formatted at all.
+    """
+    global _listener, _queue_handler
+    config = app.config
+    handlers = build_handlers(config)
+
+    root = logging.getLogger()
+    if _listener is None:
+        # Registered before any other component, so it stops last and their final flushes are still logged
+        on_shutdown(_stop_listener)
+    else:
+        _listener.stop()
+        root.removeHandler(_queue_handler)
+        for handler in _listener.handlers:
+            handler.close()
+
+    log_queue = queue.Queue(-1)
+    _queue_handler = QueueHandler(log_queue)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(_queue_handler)
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    for name, level in parse_levels(config.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def _stop_listener():
+    # Drain queued records before the process exits
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # The listener thread stays behind in the parent; forked workers (a preloaded
+    # Gunicorn master) need their own queue and listener or their records are lost
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.Queue(-1)
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
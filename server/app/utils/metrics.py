@@ -0,0 +1,185 @@
+import hmac
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, g, has_request_context, request, current_app
+from app.utils.sql_timing import on_statement
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Created by init_app; every helper below is a no-op until then (or with METRICS_ENABLED=false)
+_metrics = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class _Metrics:
+    def __init__(self):
+        # prometheus_client is only needed when metrics are enabled
+        from prometheus_client import Counter, Gauge, Histogram
+        self.request_latency = Histogram('http_request_duration_seconds', 'Request latency by endpoint',
+                                         ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+        self.requests = Counter('http_requests_total', 'Requests by endpoint and status',
+                                ['method', 'endpoint', 'status'])
+        self.in_flight = Gauge('http_requests_in_flight', 'Requests being handled',
+                               multiprocess_mode='livesum')
+        self.db_queries = Histogram('http_request_db_queries', 'SQL statements per request',
+                                    ['endpoint'], buckets=QUERY_COUNT_BUCKETS)
+        self.db_time = Histogram('http_request_db_seconds', 'Time spent in SQL per request',
+                                 ['endpoint'], buckets=LATENCY_BUCKETS)
+        self.external_latency = Histogram('external_call_duration_seconds', 'MoMo, Twilio and gateway call latency',
+                                          ['service', 'operation', 'outcome'], buckets=LATENCY_BUCKETS)
+        self.job_duration = Histogram('scheduler_job_duration_seconds', 'Scheduler job run time',
+                                      ['job'], buckets=LATENCY_BUCKETS + (30, 60))
+        self.job_failures = Counter('scheduler_job_failures_total', 'Scheduler job runs that raised', ['job'])
+        self.job_skipped = Counter('scheduler_job_skipped_total',
+                                   'Runs missed or skipped because the previous run was still going', ['job', 'reason'])
+        self.backlog = Gauge('work_backlog', 'Items waiting in in-process queues and buffers', ['queue'],
+                             multiprocess_mode='livesum')
+        self.cache = Counter('cache_requests_total', 'Cache lookups by result', ['cache', 'result'])
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_db_queries = 0
+    g._metrics_db_seconds = 0.0
+    g._metrics_in_flight = True
+    _metrics.in_flight.inc()
+
+
+def _after_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        _metrics.request_latency.labels(request.method, endpoint).observe(time.perf_counter() - start)
+        _metrics.requests.labels(request.method, endpoint, str(response.status_code)).inc()
+        _metrics.db_queries.labels(endpoint).observe(g._metrics_db_queries)
+        _metrics.db_time.labels(endpoint).observe(g._metrics_db_seconds)
+    return response
+
+
+def _teardown_request(exc):
+    # Only requests that got through _before_request incremented the gauge
+    if g.pop('_metrics_in_flight', False):
+        _metrics.in_flight.dec()
+
+
+def _record_statement(statement, elapsed):
+    if has_request_context() and '_metrics_db_queries' in g:
+        g._metrics_db_queries += 1
+        g._metrics_db_seconds += elapsed
+
+
+@contextmanager
+def timed_call(service, operation):
+    """Time an outbound call: `with timed_call('momo', 'verify'): ...`"""
+    if _metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        _metrics.external_latency.labels(service, operation, outcome).observe(time.perf_counter() - start)
+
+
+def timed_job(name):
+    """Decorator recording a scheduler job's duration and failures."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _metrics is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                _metrics.job_failures.labels(name).inc()
+                raise
+            finally:
+                _metrics.job_duration.labels(name).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def watch_scheduler(scheduler):
+    """Count runs APScheduler missed or skipped because the previous one overran."""
+    if _metrics is None:
+        return
+    from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+
+    def on_event(event):
+        job = scheduler.get_job(event.job_id)
+        name = job.name if job else event.job_id
+        reason = 'missed' if event.code == EVENT_JOB_MISSED else 'still_running'
+        _metrics.job_skipped.labels(name, reason).inc()
+
+    scheduler.add_listener(on_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+
+def enabled():
+    return _metrics is not None
+
+
+def set_backlog(queue_name, size):
+    if _metrics is not None:
+        _metrics.backlog.labels(queue_name).set(size)
+
+
+def record_cache(cache, hit):
+    if _metrics is not None:
+        _metrics.cache.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def metrics_view():
+    """Prometheus scrape endpoint; needs METRICS_TOKEN as a bearer token, except in debug mode."""
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif not current_app.debug:
+        logger.error("Metrics scrape rejected: METRICS_TOKEN is not configured")
+        return Response('Metrics endpoint is not configured\n', status=503, mimetype='text/plain')
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # Under Gunicorn each worker writes its samples to files; merge them per scrape
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Drop a dead Gunicorn worker's live gauges; call from the child_exit server hook."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+def init_app(app):
+    """Instrument requests and SQL and expose /metrics.
+
+    Set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before the
+    workers start so samples from every Gunicorn worker are aggregated.
+    """
+    global _metrics
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    if _metrics is None:
+        _metrics = _Metrics()
+        on_statement(_record_statement)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', metrics_view)
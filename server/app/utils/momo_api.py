@@ -1,12 +1,35 @@
 import requests
 import logging
+import threading
 from flask import current_app
 import uuid
 from datetime import datetime, timedelta
+from app.utils.metrics import timed_call
+from app.utils.singleflight import SingleFlight
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Shared by every request in the process: pooled keep-alive connections to MoMo and one access token
+_session = None
+_session_lock = threading.Lock()
+_tokens = {}
+_token_flight = SingleFlight()
+
+
+def _http(pool_size):
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
 class MobileMoneyAPI:
     """Class to handle MTN MoMo Collections API interactions."""
     
@@ -16,14 +39,23 @@ class MobileMoneyAPI:
         self.api_secret = current_app.config['MOMO_API_SECRET']
         self.subscription_type = current_app.config.get('MOMO_SUBSCRIPTION_TYPE', 'collection')
         self.api_user_id = current_app.config.get('MOMO_API_USER_ID', 'your-api-user-id')  # Set in .env
-        self.token = None
-        self.token_expiry = None
+        self.http = _http(current_app.config.get('MOMO_POOL_SIZE', 100))
 
     def get_access_token(self):
-        """Obtain an access token for MTN MoMo API."""
-        if self.token and self.token_expiry and self.token_expiry > datetime.utcnow():
-            return self.token
+        """Obtain an access token for MTN MoMo API, shared across requests until shortly before it expires."""
+        key = (self.base_url, self.api_user_id)
+        cached = _tokens.get(key)
+        if cached and cached[1] > datetime.utcnow():
+            return cached[0]
+        # Requests that find no token share one fetch for this key; other keys are never held up by it
+        return _token_flight.do(key, lambda: self._store_token(key))
 
+    def _store_token(self, key):
+        token, expiry = self._fetch_access_token()
+        _tokens[key] = (token, expiry)
+        return token
+
+    def _fetch_access_token(self):
         try:
             headers = {
                 'Ocp-Apim-Subscription-Key': self.api_secret,
@@ -32,21 +64,20 @@ class MobileMoneyAPI:
             payload = {
                 'grant_type': 'client_credentials'
             }
-            response = requests.post(
-                f'{self.base_url}/collection/token/',
-                auth=(self.api_user_id, self.api_key),
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
+            with timed_call('momo', 'token'):
+                response = self.http.post(
+                    f'{self.base_url}/collection/token/',
+                    auth=(self.api_user_id, self.api_key),
+                    json=payload,
+                    headers=headers,
+                    timeout=10
+                )
             response.raise_for_status()
             data = response.json()
-            self.token = data['access_token']
-            self.token_expiry = datetime.utcnow() + timedelta(seconds=data['expires_in'] - 300)  # Buffer
             logger.info("MTN MoMo access token obtained")
-            return self.token
+            return data['access_token'], datetime.utcnow() + timedelta(seconds=data['expires_in'] - 300)  # Buffer
         except requests.RequestException as e:
-            logger.error(f"Failed to obtain MTN MoMo access token: {str(e)}")
+            logger.error("Failed to obtain MTN MoMo access token: %s", e)
             raise
 
     def initiate_payment(self, phone_number: str, amount: float, package_id: str) -> dict:
@@ -81,22 +112,23 @@ class MobileMoneyAPI:
                 'payeeNote': 'Internet Portal Payment'
             }
 
-            response = requests.post(
-                f'{self.base_url}/collection/v1_0/requesttopay',
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
+            with timed_call('momo', 'request_to_pay'):
+                response = self.http.post(
+                    f'{self.base_url}/collection/v1_0/requesttopay',
+                    json=payload,
+                    headers=headers,
+                    timeout=10
+                )
             response.raise_for_status()
 
-            logger.info(f"Payment initiated: transaction_id={transaction_id}, phone={phone_number}")
+            logger.info("Payment initiated: transaction_id=%s, phone=%s", transaction_id, phone_number)
             return {
                 'transaction_id': transaction_id,
                 'status': 'PENDING',
                 'message': 'Payment initiated'
             }
         except requests.RequestException as e:
-            logger.error(f"Payment initiation failed: phone={phone_number}, error={str(e)}")
+            logger.error("Payment initiation failed: phone=%s, error=%s", phone_number, e)
             return {'error': 'Payment initiation failed', 'details': str(e)}
 
     def verify_payment(self, transaction_id: str) -> dict:
@@ -120,11 +152,12 @@ class MobileMoneyAPI:
                 'Ocp-Apim-Subscription-Key': self.api_secret
             }
             
-            response = requests.get(
-                f'{self.base_url}/collection/v1_0/requesttopay/{transaction_id}',
-                headers=headers,
-                timeout=10
-            )
+            with timed_call('momo', 'verify'):
+                response = self.http.get(
+                    f'{self.base_url}/collection/v1_0/requesttopay/{transaction_id}',
+                    headers=headers,
+                    timeout=10
+                )
             response.raise_for_status()
             data = response.json()
 
@@ -132,7 +165,7 @@ class MobileMoneyAPI:
             raw_status = data.get('status', '').upper()
             status = 'SUCCESSFUL' if raw_status == 'SUCCESS' else raw_status
             
-            logger.info(f"Payment verified: transaction_id={transaction_id}, status={status}")
+            logger.info("Payment verified: transaction_id=%s, status=%s", transaction_id, status)
             
             return {
                 'transaction_id': transaction_id,
@@ -144,7 +177,7 @@ class MobileMoneyAPI:
             }
             
         except requests.exceptions.HTTPError as e:
-            logger.error(f"Payment verification HTTP error: {transaction_id}, status={e.response.status_code}")
+            logger.error("Payment verification HTTP error: %s, status=%s", transaction_id, e.response.status_code)
             return {
                 'error': 'PAYMENT_VERIFICATION_FAILED',
                 'status': 'FAILED',
@@ -153,25 +186,26 @@ class MobileMoneyAPI:
             }
             
         except Exception as e:
-            logger.error(f"Payment verification failed: {transaction_id}, error={str(e)}")
+            logger.error("Payment verification failed: %s, error=%s", transaction_id, e)
             return {
                 'error': 'VERIFICATION_SYSTEM_ERROR',
                 'status': 'UNKNOWN',
                 'details': str(e)
             }
 
-    def refund_payment(self, transaction_id: str, amount: float) -> dict:
+    def refund_payment(self, transaction_id: str, amount: float, refund_id: str = None) -> dict:
         """
         Initiate a refund for a failed or canceled transaction.
         Args:
             transaction_id: Unique transaction ID.
             amount: Amount to refund.
+            refund_id: Reference ID to reuse when retrying, so MoMo can reject duplicates.
         Returns:
             Dict with refund status or error message.
         """
         try:
             token = self.get_access_token()
-            refund_id = str(uuid.uuid4())
+            refund_id = refund_id or str(uuid.uuid4())
             headers = {
                 'Authorization': f'Bearer {token}',
                 'X-Reference-Id': refund_id,
@@ -188,20 +222,32 @@ class MobileMoneyAPI:
                 'payeeNote': 'Internet Portal Refund'
             }
 
-            response = requests.post(
-                f'{self.base_url}/collection/v1_0/refund',
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
+            with timed_call('momo', 'refund'):
+                response = self.http.post(
+                    f'{self.base_url}/collection/v1_0/refund',
+                    json=payload,
+                    headers=headers,
+                    timeout=10
+                )
             response.raise_for_status()
 
-            logger.info(f"Refund processed: transaction_id={transaction_id}, amount={amount}")
+            logger.info("Refund processed: transaction_id=%s, amount=%s", transaction_id, amount)
             return {
                 'transaction_id': transaction_id,
                 'status': 'REFUNDED',
                 'message': 'Refund processed'
             }
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 409:
+                # Reference ID already used: an earlier attempt reached MoMo
+                logger.info("Refund already submitted: transaction_id=%s, refund_id=%s", transaction_id, refund_id)
+                return {
+                    'transaction_id': transaction_id,
+                    'status': 'REFUNDED',
+                    'message': 'Refund already submitted'
+                }
+            logger.error("Refund failed: transaction_id=%s, error=%s", transaction_id, e)
+            return {'error': 'Refund failed', 'details': str(e)}
         except requests.RequestException as e:
-            logger.error(f"Refund failed: transaction_id={transaction_id}, error={str(e)}")
+            logger.error("Refund failed: transaction_id=%s, error=%s", transaction_id, e)
             return {'error': 'Refund failed', 'details': str(e)}
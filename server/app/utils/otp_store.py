@@ -0,0 +1,49 @@
+import hmac
+import logging
+import secrets
+import string
+import time
+from flask import current_app
+from app.utils.ttl_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def issue_otp(phone_number):
+    """Generate an OTP for phone_number and keep it in the TTL store until it expires."""
+    otp = ''.join(secrets.choice(string.digits) for _ in range(6))
+    ttl = current_app.config.get('OTP_TTL_SECONDS', 300)
+    store = get_store()
+    # The wall-clock expiry lets check_otp put a wrongly guessed OTP back with its remaining lifetime
+    store.set(f"otp:{phone_number}", {"otp": otp, "expires_at": time.time() + ttl}, ttl=ttl)
+    store.delete(f"otp:attempts:{phone_number}")
+    return otp
+
+
+def check_otp(phone_number, otp):
+    """Check an OTP, consuming it on success.
+
+    Returns 'valid', 'invalid' or 'expired'. The OTP is taken out of the
+    store before comparing, so two concurrent confirms cannot both
+    succeed; a wrong guess puts it back for its remaining lifetime.
+    After OTP_MAX_ATTEMPTS wrong guesses the OTP is discarded and later
+    checks report it as expired.
+    """
+    store = get_store()
+    entry = store.pop(f"otp:{phone_number}")
+    if entry is None:
+        return 'expired'
+
+    if hmac.compare_digest(str(entry['otp']), str(otp)):
+        store.delete(f"otp:attempts:{phone_number}")
+        return 'valid'
+
+    attempts = store.incr(f"otp:attempts:{phone_number}", ttl=current_app.config.get('OTP_TTL_SECONDS', 300))
+    remaining = entry['expires_at'] - time.time()
+    if attempts >= current_app.config.get('OTP_MAX_ATTEMPTS', 5):
+        logger.warning("OTP discarded after %s failed attempts: phone=%s", attempts, phone_number)
+    elif remaining > 0:
+        # add, not set: an OTP issued meanwhile takes precedence over the old one
+        store.add(f"otp:{phone_number}", entry, ttl=remaining)
+    return 'invalid'
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.extensions import db
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_BCRYPT_ROUNDS = 12
+DEFAULT_PBKDF2_ITERATIONS = 1_000_000
+
+
+class BcryptHasher:
+    """bcrypt hashes for User passwords, with a configurable cost."""
+
+    def __init__(self, rounds=DEFAULT_BCRYPT_ROUNDS):
+        self.rounds = rounds
+
+    def hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        # Format: $2b$<cost>$<salt+hash>
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+class Pbkdf2Hasher:
+    """Werkzeug PBKDF2-SHA256 hashes for Admin passwords, with configurable iterations."""
+
+    def __init__(self, iterations=DEFAULT_PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def hash(self, password):
+        return generate_password_hash(password, method=f'pbkdf2:sha256:{self.iterations}', salt_length=16)
+
+    def verify(self, password_hash, password):
+        return check_password_hash(password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # Format: pbkdf2:sha256:<iterations>$<salt>$<hash>
+        method = password_hash.split('$', 1)[0].split(':')
+        if len(method) != 3 or method[0] != 'pbkdf2':
+            return True
+        try:
+            return int(method[2]) != self.iterations
+        except ValueError:
+            return True
+
+
+def bcrypt_hasher():
+    rounds = current_app.config.get('BCRYPT_ROUNDS', DEFAULT_BCRYPT_ROUNDS) if has_app_context() else DEFAULT_BCRYPT_ROUNDS
+    return BcryptHasher(rounds)
+
+
+def pbkdf2_hasher():
+    iterations = current_app.config.get('PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS) if has_app_context() else DEFAULT_PBKDF2_ITERATIONS
+    return Pbkdf2Hasher(iterations)
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hashes are queued or one outlasts the timeout; callers should answer 503."""
+
+
+class PasswordHashingPool:
+    """Bounded thread pool for password hashing.
+
+    bcrypt and hashlib's PBKDF2 both release the GIL while hashing, so
+    threads give real parallelism here without the cost of a process
+    pool. Work beyond workers + max_queue is rejected immediately
+    instead of piling up behind request threads.
+    """
+
+    def __init__(self, workers=None, max_queue=32, timeout=10):
+        workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # The hash keeps its slot until it finishes; the caller just stops waiting
+            logger.warning("Password hash timed out after %ss", self.timeout)
+            raise PasswordPoolBusy() from None
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def verify_password(principal, password):
+    """Check a User/Admin password off the request thread.
+
+    On success, a hash made with a different work factor than the one
+    configured is replaced and committed, so cost changes roll out as
+    people log in. Raises PasswordPoolBusy when the pool is saturated.
+    """
+    password_hash = principal.password_hash
+    if not password_hash:
+        return False
+    hasher = principal.password_hasher()
+    pool = current_app.extensions['password_pool']
+    if not pool.run(hasher.verify, password_hash, password):
+        return False
+
+    if hasher.needs_rehash(password_hash):
+        try:
+            principal.password_hash = pool.run(hasher.hash, password)
+            db.session.commit()
+            logger.info("Password rehashed: %s id=%s", type(principal).__name__, principal.id)
+        except Exception as e:
+            # The login itself succeeded; the upgrade can happen next time
+            db.session.rollback()
+            logger.warning("Password rehash skipped: %s id=%s, error=%s", type(principal).__name__, principal.id, e)
+    return True
+
+
+def set_password(principal, password):
+    """principal.set_password() with the hashing done off the request thread.
+
+    Raises PasswordPoolBusy when the pool is saturated.
+    """
+    pool = current_app.extensions['password_pool']
+    principal.password_hash = pool.run(principal.password_hasher().hash, password)
+    principal.revoke_tokens()
+
+
+def init_app(app):
+    app.extensions['password_pool'] = PasswordHashingPool(
+        workers=app.config.get('PASSWORD_HASH_WORKERS'),
+        max_queue=app.config.get('PASSWORD_HASH_QUEUE_SIZE', 32),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT_SECONDS', 10)
+    )
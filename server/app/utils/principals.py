@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from app.utils.metrics import record_cache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class TokenVersionCache:
+    """Small LRU of principal token versions with a freshness limit.
+
+    Entries expire after `ttl` seconds so a revocation made by another
+    worker is picked up within that window; revocations made in this
+    process are applied immediately through invalidate().
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            version, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return version
+
+    def set(self, key, version):
+        with self._lock:
+            self._data[key] = (version, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_cache = TokenVersionCache()
+
+
+def principal_kind(claims):
+    """'admin' or 'user'. Tokens issued before the principal claim existed
+    are told apart by their is_admin claim, which only admin tokens had."""
+    return claims.get('principal') or ('admin' if claims.get('is_admin') else 'user')
+
+
+def invalidate_principal(kind, principal_id):
+    _cache.invalidate((kind, str(principal_id)))
+
+
+def _load_token_version(kind, principal_id):
+    # Imported here: the models import this module for invalidate_principal
+    from app.extensions import db
+    from app.models.admin import Admin
+    from app.models.user import User
+    model = Admin if kind == 'admin' else User
+    row = db.session.query(model.token_version).filter(model.id == principal_id).first()
+    return None if row is None else (row[0] or 0)
+
+
+def token_is_current(claims):
+    """Check the token's version claim against the principal's current version.
+
+    With PRINCIPAL_CACHE_SIZE=0 the check is skipped entirely and claims
+    are trusted until the token expires.
+    """
+    size = current_app.config.get('PRINCIPAL_CACHE_SIZE', 1024)
+    if not size:
+        return True
+    _cache.maxsize = size
+    _cache.ttl = current_app.config.get('PRINCIPAL_CACHE_TTL_SECONDS', 60)
+
+    key = (principal_kind(claims), str(claims.get('sub')))
+    version = _cache.get(key)
+    record_cache('principal', version is not None)
+    if version is None:
+        version = _load_token_version(*key)
+        if version is None:
+            return False
+        _cache.set(key, version)
+    return version == claims.get('tv', 0)
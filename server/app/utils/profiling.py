@@ -0,0 +1,256 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from flask import g, request, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+from app.utils.principals import principal_kind, token_is_current
+from app.utils.ttl_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ARM_KEY = 'profiling:armed'
+# How long a worker trusts its last read of the arming switch, so unprofiled requests stay store-free
+ARM_CHECK_SECONDS = 1.0
+
+_armed_cache = {'checked': 0.0, 'value': None}
+_baseline = {'snapshot': None}
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and writes speedscope profiles.
+
+    Sampling only looks at the profiled thread from a helper thread, so the
+    request itself runs at close to full speed, unlike cProfile which hooks
+    every call.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _frame_id(self, code):
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def speedscope(self, name, metadata):
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "internet-portal",
+            "metadata": metadata,
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.elapsed,
+                "samples": self.samples,
+                "weights": self.weights
+            }]
+        }
+
+
+def arm(sample_rate, duration_seconds, endpoint=None, mode='sample'):
+    """Profile a fraction of matching requests on every worker for a while."""
+    settings = {"sample_rate": sample_rate, "endpoint": endpoint, "mode": mode,
+                "until": time.time() + duration_seconds}
+    get_store().set(ARM_KEY, settings, ttl=duration_seconds)
+    _armed_cache['checked'] = 0.0
+    return settings
+
+
+def disarm():
+    get_store().delete(ARM_KEY)
+    _armed_cache['checked'] = 0.0
+
+
+def armed_settings():
+    now = time.monotonic()
+    if now - _armed_cache['checked'] >= ARM_CHECK_SECONDS:
+        _armed_cache['value'] = get_store().get(ARM_KEY)
+        _armed_cache['checked'] = now
+    settings = _armed_cache['value']
+    if settings and settings['until'] > time.time():
+        return settings
+    return None
+
+
+def _header_requested():
+    """X-Profile: sample|cprofile on a request carrying a current portal-admin token."""
+    mode = request.headers.get('X-Profile')
+    if not mode:
+        return None
+    try:
+        verify_jwt_in_request()
+        claims = get_jwt()
+    except Exception:
+        return None
+    if not claims.get('is_admin') or principal_kind(claims) != 'admin' or not token_is_current(claims):
+        logger.warning("Profiling header ignored: not a portal admin")
+        return None
+    return 'cprofile' if mode.lower() == 'cprofile' else 'sample'
+
+
+def _before_request():
+    mode = _header_requested()
+    if mode is None:
+        settings = armed_settings()
+        if not settings or (settings['endpoint'] and settings['endpoint'] != request.endpoint):
+            return
+        if random.random() >= settings['sample_rate']:
+            return
+        mode = settings['mode']
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one cProfile per process; a concurrent request already holds it
+            logger.info("cProfile busy, sampling instead: endpoint=%s", request.endpoint)
+            mode = 'sample'
+    if mode != 'cprofile':
+        profiler = StackSampler(threading.get_ident(),
+                                current_app.config.get('PROFILE_SAMPLE_INTERVAL_MS', 5) / 1000)
+        profiler.start()
+    g._profiler = (mode, profiler, datetime.utcnow(), time.perf_counter())
+
+
+def _finish(status):
+    mode, profiler, started_at, start = g.pop('_profiler')
+    if mode == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+    duration_ms = (time.perf_counter() - start) * 1000
+    endpoint = request.endpoint or 'unmatched'
+    metadata = {"method": request.method, "path": request.path, "endpoint": endpoint, "status": status,
+                "duration_ms": round(duration_ms, 2), "started_at": started_at.isoformat()}
+    directory = current_app.config.get('PROFILE_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    stem = f"{started_at:%Y%m%dT%H%M%S%f}-{re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)}-{int(duration_ms)}ms"
+    try:
+        if mode == 'cprofile':
+            path = os.path.join(directory, stem + '.pstats')
+            profiler.dump_stats(path)
+            with open(path + '.json', 'w') as f:
+                json.dump(metadata, f)
+        else:
+            path = os.path.join(directory, stem + '.speedscope.json')
+            name = f"{request.method} {request.path} {status} {duration_ms:.1f}ms"
+            with open(path, 'w') as f:
+                json.dump(profiler.speedscope(name, metadata), f)
+    except OSError as e:
+        logger.error("Profile write failed: %s", e)
+        return
+    logger.info("Request profiled: endpoint=%s, duration_ms=%.1f, file=%s", endpoint, duration_ms, path)
+
+
+def _after_request(response):
+    if '_profiler' in g:
+        _finish(response.status_code)
+    return response
+
+
+def _teardown_request(exc):
+    # Requests that raised never reach after_request
+    if '_profiler' in g:
+        _finish(500)
+
+
+def list_profiles(directory):
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith(('.speedscope.json', '.pstats')):
+            profiles.append({"name": name, "bytes": os.path.getsize(os.path.join(directory, name))})
+    return profiles
+
+
+def start_tracemalloc(frames=25):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline['snapshot'] = tracemalloc.take_snapshot()
+
+
+def stop_tracemalloc():
+    _baseline['snapshot'] = None
+    tracemalloc.stop()
+
+
+def tracemalloc_report(limit=20, key_type='lineno', dump_dir=None):
+    """Top allocation sites and their growth since the previous report (or since tracing started)."""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    previous = _baseline['snapshot']
+    if previous is not None:
+        stats = snapshot.compare_to(previous, key_type)
+        top = [{"site": str(s.traceback), "size_bytes": s.size, "size_diff_bytes": s.size_diff,
+                "count": s.count, "count_diff": s.count_diff} for s in stats[:limit]]
+    else:
+        top = [{"site": str(s.traceback), "size_bytes": s.size, "count": s.count}
+               for s in snapshot.statistics(key_type)[:limit]]
+    _baseline['snapshot'] = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    report = {"traced_bytes": current, "peak_bytes": peak, "pid": os.getpid(), "top": top}
+    if dump_dir:
+        os.makedirs(dump_dir, exist_ok=True)
+        report["file"] = os.path.join(dump_dir, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}.tracemalloc")
+        snapshot.dump(report["file"])
+    return report
+
+
+def init_app(app):
+    """Profile requests on demand: an admin's X-Profile header, or sampling armed from the admin API."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,98 @@
+import logging
+from collections import Counter
+from functools import wraps
+from flask import g, has_request_context, request, current_app
+from app.utils.sql_timing import on_statement
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL statements than its budget allows."""
+
+
+def query_budget(limit):
+    """Cap the SQL statements a view may run, overriding QUERY_BUDGET and QUERY_BUDGETS."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return fn(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+def parse_budgets(spec):
+    """'payments.get_payment_history=2,admin.get_devices=3' -> {'payments.get_payment_history': 2, ...}"""
+    budgets = {}
+    for item in (spec or '').split(','):
+        name, sep, limit = item.partition('=')
+        if sep and name.strip() and limit.strip().isdigit():
+            budgets[name.strip()] = int(limit)
+    return budgets
+
+
+def _budget_for(endpoint):
+    config = current_app.config
+    view = current_app.view_functions.get(endpoint)
+    if getattr(view, 'query_budget', None) is not None:
+        return view.query_budget
+    budgets = current_app.extensions['query_audit_budgets']
+    return budgets.get(endpoint, config.get('QUERY_BUDGET', 0)) or None
+
+
+def _before_request():
+    g._query_audit = Counter()
+    g._query_audit_seconds = 0.0
+
+
+def _record_statement(statement, elapsed):
+    if has_request_context() and '_query_audit' in g:
+        # Statements differ only in their bound parameters, so a repeated text is a loop of lookups
+        g._query_audit[statement] += 1
+        g._query_audit_seconds += elapsed
+
+
+def _after_request(response):
+    statements = g.pop('_query_audit', None)
+    if statements is None:
+        return response
+    config = current_app.config
+    count = sum(statements.values())
+    db_ms = g.pop('_query_audit_seconds') * 1000
+    response.headers['X-Query-Count'] = str(count)
+    response.headers['X-DB-Time'] = f"{db_ms:.2f}ms"
+
+    endpoint = request.endpoint or 'unmatched'
+    threshold = config.get('QUERY_AUDIT_REPEAT_THRESHOLD', 5)
+    for statement, repeats in statements.most_common():
+        if repeats < threshold:
+            break
+        logger.warning("Possible N+1 query: endpoint=%s, repeats=%s, statement=%s",
+                       endpoint, repeats, ' '.join(statement.split())[:300])
+
+    budget = _budget_for(request.endpoint) if request.endpoint else None
+    if budget is not None and count > budget:
+        message = f"{endpoint} ran {count} SQL statements, budget is {budget}"
+        if config.get('QUERY_BUDGET_STRICT') or current_app.testing:
+            raise QueryBudgetExceeded(message)
+        logger.warning("Query budget exceeded: %s", message)
+    return response
+
+
+def init_app(app):
+    """Count and time the SQL run by each request when QUERY_AUDIT_ENABLED is set.
+
+    Responses get X-Query-Count and X-DB-Time headers, statements repeated
+    QUERY_AUDIT_REPEAT_THRESHOLD times in one request are logged as likely
+    N+1 loops, and requests over their query budget are logged, or raise
+    QueryBudgetExceeded under TESTING or QUERY_BUDGET_STRICT so tests fail.
+    """
+    if not app.config.get('QUERY_AUDIT_ENABLED'):
+        return
+    on_statement(_record_statement)
+    app.extensions['query_audit_budgets'] = parse_budgets(app.config.get('QUERY_BUDGETS'))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.logger.info("Query audit enabled: budget=%s", app.config.get('QUERY_BUDGET') or 'none')
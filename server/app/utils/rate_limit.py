@@ -0,0 +1,73 @@
+import hmac
+import re
+from flask import request, current_app
+from flask_limiter.util import get_remote_address
+
+MAC_RE = re.compile(r'^[0-9a-f]{2}([:-]?)[0-9a-f]{2}(\1[0-9a-f]{2}){4}$', re.IGNORECASE)
+
+
+def normalize_mac(value):
+    """Return a MAC address as lower-case aa:bb:cc:dd:ee:ff, or None if malformed."""
+    if not value or not MAC_RE.match(value.strip()):
+        return None
+    digits = re.sub(r'[^0-9a-fA-F]', '', value).lower()
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def gateway_attested():
+    """Whether the request came through a gateway: it carries the gateway token or comes from a trusted address.
+
+    With neither GATEWAY_API_TOKEN nor GATEWAY_TRUSTED_ADDRESSES configured,
+    only debug mode trusts requests, so a local setup works without a gateway.
+    """
+    config = current_app.config
+    token = config.get('GATEWAY_API_TOKEN')
+    trusted = [a.strip() for a in (config.get('GATEWAY_TRUSTED_ADDRESSES') or '').split(',') if a.strip()]
+    if token and hmac.compare_digest(request.headers.get('X-Gateway-Token', '').encode(), token.encode()):
+        return True
+    if request.remote_addr in trusted:
+        return True
+    return not token and not trusted and current_app.debug
+
+
+def client_mac():
+    """The requesting device's MAC from X-Client-MAC, or None unless a gateway vouches for the header.
+
+    Any browser can send X-Client-MAC, so it only identifies a device
+    when the gateway that proxies portal traffic set it.
+    """
+    mac = normalize_mac(request.headers.get('X-Client-MAC'))
+    return mac if mac and gateway_attested() else None
+
+
+def client_key():
+    """Rate-limit key for the client behind the captive portal.
+
+    Every device behind the venue router shares one public IP, so the
+    MAC the gateway forwards is preferred. A MAC the gateway did not
+    attest is ignored, since rotating it would reset the budget.
+    """
+    if current_app.config.get('RATELIMIT_TRUST_CLIENT_MAC', True):
+        mac = client_mac()
+        if mac:
+            return f"mac:{mac}"
+    return f"ip:{get_remote_address()}"
+
+
+def identity_key():
+    """Rate-limit key for the account a request targets (phone number or email in the body).
+
+    Stacked on client_key limits for /login and /verify-phone, so guesses
+    against one account share a budget however many clients send them.
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    identifier = data.get('phone_number') or data.get('email')
+    if isinstance(identifier, str) and identifier.strip():
+        return f"identity:{identifier.strip().lower()}"
+    return client_key()
+
+
+def route_limit(config_key):
+    """Budget for a route, read from config at request time so it can be tuned per deployment."""
+    return lambda: current_app.config[config_key]
@@ -0,0 +1,94 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from app.extensions import db
+from app.models.refund import Refund
+from app.models.transaction import Transaction
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def enqueue_refund(transaction):
+    """Queue a refund for a failed transaction. The caller commits.
+
+    Enqueueing is idempotent: a transaction only ever gets one refund
+    row, and that row keeps the same provider reference across retries.
+    """
+    refund = Refund.query.filter_by(transaction_id=transaction.transaction_id).first()
+    if refund:
+        return refund
+    refund = Refund(
+        transaction_id=transaction.transaction_id,
+        reference_id=str(uuid.uuid4()),
+        amount=transaction.amount,
+        status='PENDING',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(refund)
+    logger.info("Refund queued: transaction_id=%s, amount=%s", transaction.transaction_id, transaction.amount)
+    return refund
+
+
+def _backoff_seconds(attempts):
+    base = current_app.config.get('REFUND_RETRY_BASE_SECONDS', 30)
+    cap = current_app.config.get('REFUND_RETRY_MAX_SECONDS', 3600)
+    return min(cap, base * 2 ** max(attempts - 1, 0))
+
+
+def process_refund_queue(batch_size=None):
+    """Submit a batch of due refunds to MoMo. Must run inside an app context.
+
+    Returns the number of refunds attempted.
+    """
+    batch_size = batch_size or current_app.config.get('REFUND_BATCH_SIZE', 20)
+    max_attempts = current_app.config.get('REFUND_MAX_ATTEMPTS', 8)
+    now = datetime.utcnow()
+
+    query = Refund.query.filter(
+        Refund.status == 'PENDING',
+        Refund.next_attempt_at <= now
+    ).order_by(Refund.next_attempt_at).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Let several workers drain the queue without picking the same rows
+        query = query.with_for_update(skip_locked=True)
+    batch = query.all()
+    if not batch:
+        db.session.rollback()
+        return 0
+
+    # Claim the batch before calling the provider, so a crash mid-batch
+    # only delays these rows until their next attempt time.
+    for refund in batch:
+        refund.attempts += 1
+        refund.next_attempt_at = now + timedelta(seconds=_backoff_seconds(refund.attempts))
+    db.session.commit()
+
+    from app.utils.momo_api import MobileMoneyAPI
+    momo_api = MobileMoneyAPI()  # One access token for the whole batch
+    refunded = []
+    for refund in batch:
+        result = momo_api.refund_payment(refund.transaction_id, refund.amount, refund_id=refund.reference_id)
+        if 'error' not in result:
+            refund.status = 'SUCCEEDED'
+            refund.completed_at = datetime.utcnow()
+            refund.last_error = None
+            refunded.append(refund.transaction_id)
+            continue
+
+        refund.last_error = str(result.get('details', result['error']))[:500]
+        if refund.attempts >= max_attempts:
+            refund.status = 'FAILED'
+            logger.error("Refund abandoned after %s attempts: transaction_id=%s", refund.attempts, refund.transaction_id)
+        else:
+            logger.warning("Refund attempt %s failed, retrying at %s: transaction_id=%s", refund.attempts, refund.next_attempt_at, refund.transaction_id)
+
+    if refunded:
+        Transaction.query.filter(Transaction.transaction_id.in_(refunded)).update(
+            {Transaction.status: 'REFUNDED'}, synchronize_session=False
+        )
+    db.session.commit()
+    logger.info("Refund batch processed: attempted=%s, refunded=%s", len(batch), len(refunded))
+    return len(batch)
@@ -0,0 +1,30 @@
+from app.extensions import db
+
+
+class RowListing:
+    """Bulk listings serialized straight from column tuples.
+
+    Loading thousands of ORM objects only to call to_dict() on each pays for
+    identity-map bookkeeping and attribute instrumentation per row. Models
+    mixing this in name their LISTING_COLUMNS; listing() selects just those
+    columns and zips each row into a dict, leaving datetimes for the JSON
+    provider to encode.
+    """
+
+    LISTING_COLUMNS = ()
+
+    @classmethod
+    def listing_select(cls):
+        return db.select(*(getattr(cls, name) for name in cls.LISTING_COLUMNS))
+
+    @classmethod
+    def serialize_rows(cls, rows):
+        names = cls.LISTING_COLUMNS
+        return [dict(zip(names, row)) for row in rows]
+
+    @classmethod
+    def listing(cls, statement=None):
+        """Rows of listing_select(), or of a statement built from it with filters and ordering."""
+        if statement is None:
+            statement = cls.listing_select()
+        return cls.serialize_rows(db.session.execute(statement).all())
@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+import time
+from app.utils.background import LazyThreads, on_shutdown
+from app.utils.metrics import timed_call, set_backlog
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class TwilioBackend:
+    """Sends SMS through one shared Twilio client.
+
+    The client keeps a pooled requests session, so consecutive sends
+    reuse the same TLS connection instead of opening a new one each time.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number):
+        from twilio.rest import Client
+        from twilio.http.http_client import TwilioHttpClient
+        self.client = Client(account_sid, auth_token,
+                             http_client=TwilioHttpClient(pool_connections=True, timeout=10))
+        self.from_number = from_number
+
+    def send(self, to, body):
+        with timed_call('twilio', 'send'):
+            message = self.client.messages.create(body=body, from_=self.from_number, to=to)
+        return message.sid
+
+
+class ConsoleBackend:
+    """Local stand-in for Twilio: logs messages and keeps them in an outbox."""
+
+    def __init__(self, outbox_size=100):
+        self.outbox = []
+        self.outbox_size = outbox_size
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def send(self, to, body):
+        with self._lock:
+            self._counter += 1
+            sid = f"LOCAL{self._counter:010d}"
+            self.outbox.append({"sid": sid, "to": to, "body": body})
+            del self.outbox[:-self.outbox_size]
+        logger.info("[console sms] to=%s sid=%s body=%r", to, sid, body)
+        return sid
+
+
+class SmsDispatcher:
+    """Bounded queue of outgoing SMS drained by a small pool of worker threads."""
+
+    def __init__(self, backend, workers=2, max_queue=1000, max_attempts=3):
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = LazyThreads(self._run, 'sms-worker', count=workers)
+
+    def enqueue(self, to, body):
+        """Queue a message. Returns False if the queue is full."""
+        self._threads.ensure_started()
+        try:
+            self._queue.put_nowait((to, body))
+            set_backlog('sms', self._queue.qsize())
+            return True
+        except queue.Full:
+            logger.error("SMS queue full, dropping message: to=%s", to)
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            set_backlog('sms', self._queue.qsize())
+            if item is None:
+                self._queue.task_done()
+                return
+            to, body = item
+            try:
+                self._deliver(to, body)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, to, body):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                sid = self.backend.send(to, body)
+                logger.info("SMS sent: to=%s, sid=%s", to, sid)
+                return
+            except Exception as e:
+                status = getattr(e, 'status', None)
+                if (status and 400 <= status < 500) or attempt == self.max_attempts:
+                    # Client errors (bad number, unverified recipient) will not succeed on retry
+                    logger.error("SMS send failed: to=%s, attempt=%s, error=%s", to, attempt, e)
+                    return
+                logger.warning("SMS send failed, retrying: to=%s, attempt=%s, error=%s", to, attempt, e)
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
+    def shutdown(self, timeout=5):
+        """Let queued messages drain, then stop the workers."""
+        if not self._threads.running:
+            return
+        for _ in self._threads.threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+
+def init_app(app):
+    """Create the app's SMS dispatcher from config.
+
+    The console backend only logs messages, OTPs included, so it is used
+    when SMS_BACKEND=console asks for it or, failing Twilio credentials,
+    in debug mode. Anywhere else missing credentials stop the app here
+    rather than telling users an OTP was sent when it was not.
+    """
+    backend_name = app.config.get('SMS_BACKEND')
+    if not backend_name:
+        if app.config.get('TWILIO_ACCOUNT_SID'):
+            backend_name = 'twilio'
+        elif app.debug:
+            backend_name = 'console'
+        else:
+            raise RuntimeError("TWILIO_ACCOUNT_SID is not set; configure Twilio or set SMS_BACKEND=console")
+    if backend_name == 'twilio':
+        if not app.config.get('TWILIO_ACCOUNT_SID'):
+            raise RuntimeError("SMS_BACKEND=twilio needs TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN")
+        backend = TwilioBackend(
+            app.config['TWILIO_ACCOUNT_SID'],
+            app.config['TWILIO_AUTH_TOKEN'],
+            app.config['TWILIO_PHONE_NUMBER']
+        )
+    elif backend_name == 'console':
+        backend = ConsoleBackend()
+    else:
+        raise ValueError(f"Unknown SMS_BACKEND: {backend_name}")
+
+    dispatcher = SmsDispatcher(
+        backend,
+        workers=app.config.get('SMS_WORKERS', 2),
+        max_queue=app.config.get('SMS_QUEUE_SIZE', 1000)
+    )
+    app.extensions['sms'] = dispatcher
+    on_shutdown(dispatcher.shutdown)
+    app.logger.info("SMS dispatcher ready: backend=%s", backend_name)
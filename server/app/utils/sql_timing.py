@@ -0,0 +1,30 @@
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# fn(statement, elapsed_seconds) for every statement; metrics and query_audit both read these
+_subscribers = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, which is dropped with it when the statement fails
+    context._sql_timing_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._sql_timing_start
+    for fn in _subscribers:
+        fn(statement, elapsed)
+
+
+def on_statement(fn):
+    """Call fn(statement, elapsed_seconds) after each SQL statement on any engine.
+
+    All subscribers share one pair of engine listeners, so each statement
+    is timed once however many features want the figure.
+    """
+    if not _subscribers:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    if fn not in _subscribers:
+        _subscribers.append(fn)
@@ -0,0 +1,77 @@
+"""Compact signed access tickets, shared by the portal and the gateway.
+
+A ticket is ``<payload>.<signature>``, both base64url without padding. The
+payload is compact JSON::
+
+    {"v": 1, "jti": "...", "sub": "mac:00:1a:2b:3c:4d:5e", "pkg": "1", "exp": 1760000000}
+
+and the signature is HMAC-SHA256 over the encoded payload with a secret
+shared between the portal (ACCESS_TICKET_SECRET) and the gateway. This module
+only uses the standard library so it can be copied onto the router and used
+without the rest of the app.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+
+TICKET_VERSION = 1
+
+
+class TicketError(Exception):
+    """Raised when a ticket is malformed, forged, expired or revoked."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(secret, payload):
+    if isinstance(secret, str):
+        secret = secret.encode()
+    return hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+
+def sign_ticket(secret, subjects, expires_at, package=None):
+    """Return a ticket for subjects (e.g. ['mac:..', 'phone:..']) valid until expires_at (unix seconds)."""
+    claims = {"v": TICKET_VERSION, "jti": secrets.token_urlsafe(9), "sub": list(subjects), "exp": int(expires_at)}
+    if package is not None:
+        claims["pkg"] = package
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f"{payload}.{_b64encode(_signature(secret, payload))}"
+
+
+def verify_ticket(secret, ticket, subject=None, denied=(), now=None):
+    """Check a ticket offline and return its claims.
+
+    subject, when given, must be one of the ticket's subjects (the gateway
+    passes the client's 'mac:<addr>'). denied is a collection of revoked
+    jtis and subjects. Raises TicketError on any failure.
+    """
+    try:
+        payload, sig = ticket.split('.')
+        expected = _signature(secret, payload)
+        if not hmac.compare_digest(_b64decode(sig), expected):
+            raise TicketError("bad signature")
+        claims = json.loads(_b64decode(payload))
+    except TicketError:
+        raise
+    except (ValueError, AttributeError) as e:
+        raise TicketError(f"malformed ticket: {e}")
+
+    if claims.get('v') != TICKET_VERSION:
+        raise TicketError("unsupported ticket version")
+    if claims.get('exp', 0) <= (now if now is not None else time.time()):
+        raise TicketError("ticket expired")
+    subjects = claims.get('sub') or []
+    if subject is not None and subject not in subjects:
+        raise TicketError("ticket not issued to this client")
+    if claims.get('jti') in denied or any(s in denied for s in subjects):
+        raise TicketError("ticket revoked")
+    return claims
@@ -0,0 +1,56 @@
+import calendar
+import logging
+import time
+from flask import current_app
+from app.utils.ticket_signing import sign_ticket
+from app.utils.rate_limit import normalize_mac
+from app.utils.ttl_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DENY_PREFIX = 'ticket-deny:'
+
+
+def _subject(subject_type, value):
+    if subject_type == 'mac':
+        value = normalize_mac(value)
+    return f"{subject_type}:{value}" if value else None
+
+
+def issue_access_ticket(expiry, package=None, mac_address=None, phone_number=None, code=None):
+    """Signed ticket the gateway can check offline, or None if tickets are disabled.
+
+    The ticket lives until the entitlement expires, capped at
+    ACCESS_TICKET_MAX_SECONDS so that deny-list entries can be short-lived.
+    """
+    secret = current_app.config.get('ACCESS_TICKET_SECRET')
+    if not secret or not expiry:
+        return None
+    subjects = [s for s in (_subject('mac', mac_address), _subject('phone', phone_number), _subject('code', code)) if s]
+    if not subjects:
+        return None
+    expires_at = min(calendar.timegm(expiry.utctimetuple()),
+                     time.time() + current_app.config.get('ACCESS_TICKET_MAX_SECONDS', 86400))
+    return sign_ticket(secret, subjects, expires_at, package)
+
+
+def revoke_tickets(subject_type=None, value=None, jti=None):
+    """Deny-list a subject or a single ticket for as long as any ticket for it can still be valid."""
+    entry = jti if jti else _subject(subject_type, value)
+    if not entry:
+        return None
+    get_store().set(DENY_PREFIX + entry, True, ttl=current_app.config.get('ACCESS_TICKET_MAX_SECONDS', 86400))
+    logger.debug("Ticket deny-list entry added: %s", entry)
+    return entry
+
+
+def restore_tickets(subject_type, value):
+    entry = _subject(subject_type, value)
+    if entry:
+        get_store().delete(DENY_PREFIX + entry)
+
+
+def denied_entries():
+    """Current deny-list: revoked jtis and 'type:value' subjects."""
+    return sorted(key[len(DENY_PREFIX):] for key, _ in get_store().scan(DENY_PREFIX))
@@ -0,0 +1,179 @@
+import json
+import logging
+import threading
+import time
+from flask import current_app
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """Thread-safe in-process key-value store with per-key expiry.
+
+    Suitable for a single node. Values are kept as Python objects, so
+    callers should stick to JSON-friendly values to stay compatible
+    with RedisStore.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            return item[0] if item else default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it does not exist. Returns True if it was set."""
+        now = time.monotonic()
+        with self._lock:
+            if self._live(key, now):
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop(self, key, default=None):
+        """Remove key and return its value; of several concurrent callers only one gets it."""
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            if item is None:
+                return default
+            del self._data[key]
+            return item[0]
+
+    def incr(self, key, amount=1, ttl=None):
+        """Increment a counter, starting its expiry window on first use."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._live(key, now)
+            if item is None:
+                self._data[key] = (amount, now + ttl if ttl else None)
+                return amount
+            value, expires_at = item
+            self._data[key] = (value + amount, expires_at)
+            return value + amount
+
+    def ttl(self, key):
+        """Remaining seconds for key, None if it has no expiry or is missing."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._live(key, now)
+            if not item or item[1] is None:
+                return None
+            return item[1] - now
+
+    def scan(self, prefix):
+        """Live (key, value) pairs whose key starts with prefix."""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (v, exp) in self._data.items()
+                    if k.startswith(prefix) and (exp is None or exp > now)]
+
+    def purge(self):
+        """Drop expired entries. Called opportunistically by maintenance jobs."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+
+class RedisStore:
+    """Redis-backed store for deployments with several workers or nodes."""
+
+    def __init__(self, url, prefix='portal:'):
+        import redis  # Optional dependency, only needed when a redis:// URL is configured
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key, default=None):
+        raw = self._client.get(self._prefix + key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self._prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self._client.set(self._prefix + key, json.dumps(value), ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def pop(self, key, default=None):
+        # GET and DEL in one MULTI block, the equivalent of GETDEL on Redis before 6.2
+        pipe = self._client.pipeline(transaction=True)
+        pipe.get(self._prefix + key)
+        pipe.delete(self._prefix + key)
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw is not None else default
+
+    def incr(self, key, amount=1, ttl=None):
+        value = self._client.incrby(self._prefix + key, amount)
+        if ttl and value == amount:
+            # First increment opens the window
+            self._client.expire(self._prefix + key, int(ttl))
+        return value
+
+    def ttl(self, key):
+        remaining = self._client.ttl(self._prefix + key)
+        return remaining if remaining and remaining > 0 else None
+
+    def scan(self, prefix):
+        pairs = []
+        for raw_key in self._client.scan_iter(match=self._prefix + prefix + '*', count=500):
+            raw = self._client.get(raw_key)
+            if raw is not None:
+                pairs.append((raw_key.decode()[len(self._prefix):], json.loads(raw)))
+        return pairs
+
+    def purge(self):
+        # Redis expires keys itself
+        return 0
+
+
+_store_lock = threading.Lock()
+
+
+def create_store(url):
+    """Build a store from a URL: 'memory://' or 'redis://host:port/db'."""
+    if not url or url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported TTL store URL: {url}")
+
+
+def get_store(app=None):
+    """Return the app-wide TTL store, creating it on first use."""
+    app = app or current_app._get_current_object()
+    store = app.extensions.get('ttl_store')
+    if store is None:
+        with _store_lock:
+            store = app.extensions.get('ttl_store')
+            if store is None:
+                store = create_store(app.config.get('TTL_STORE_URL', 'memory://'))
+                app.extensions['ttl_store'] = store
+                logger.info("TTL store initialised: %s", type(store).__name__)
+    return store
@@ -0,0 +1,227 @@
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, func
+from app.extensions import db
+from app.models.entitlement_change import EntitlementChange
+from app.models.session_usage import SessionUsage
+from app.utils.background import LazyThreads, on_shutdown
+from app.utils.metrics import set_backlog
+from app.utils.rate_limit import normalize_mac
+from app.utils.tickets import revoke_tickets, restore_tickets
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rows per UPDATE batch
+UPDATE_CHUNK = 200
+QUOTA_CHECK_CHUNK = 5000
+
+
+def parse_counters(counters):
+    """Validate [mac, bytes_in, bytes_out] triples (or dicts with those keys).
+
+    Counters are byte deltas since the gateway's previous report.
+    Returns (valid_rows, rejected_count).
+    """
+    rows, rejected = [], 0
+    for item in counters:
+        try:
+            if isinstance(item, dict):
+                mac, bytes_in, bytes_out = item['mac'], item['bytes_in'], item['bytes_out']
+            else:
+                mac, bytes_in, bytes_out = item
+            mac = normalize_mac(mac)
+            bytes_in, bytes_out = int(bytes_in), int(bytes_out)
+        except (KeyError, TypeError, ValueError):
+            rejected += 1
+            continue
+        if not mac or bytes_in < 0 or bytes_out < 0:
+            rejected += 1
+            continue
+        rows.append((mac, bytes_in, bytes_out))
+    return rows, rejected
+
+
+def add_usage(totals, now):
+    """Add per-MAC byte totals to the devices' open usage sessions.
+
+    Only rows opened by start_usage_session() are counted; counters for
+    MACs the portal never authorized are dropped, so gateways reporting
+    every client on the LAN cannot grow the table without bound.
+    """
+    table = SessionUsage.__table__
+    stmt = table.update().where(
+        table.c.mac_address == bindparam('mac'),
+        table.c.session_key.isnot(None)
+    ).values(
+        bytes_in=table.c.bytes_in + bindparam('b_in'),
+        bytes_out=table.c.bytes_out + bindparam('b_out'),
+        updated_at=now
+    )
+    rows = [{'mac': mac, 'b_in': b_in, 'b_out': b_out} for mac, (b_in, b_out) in totals.items()]
+    for i in range(0, len(rows), UPDATE_CHUNK):
+        db.session.execute(stmt, rows[i:i + UPDATE_CHUNK])
+
+
+def entitlement_key(subject_type, value):
+    """Usage session key of an entitlement: ('tx', transaction_id) or ('code', access_code)."""
+    return f"{subject_type}:{value}"
+
+
+def enforce_quotas(mac_addresses, now):
+    """Cut off devices whose entitlement has used up its bundle, counting every MAC on it. Returns their MACs.
+
+    Only entitlements with a device among mac_addresses are checked. The
+    gateway gets one deauthorize call for the whole set. The cut-off is
+    also published to the entitlement feed and the ticket deny-list, so
+    gateways authorizing locally drop the device too.
+    """
+    mac_addresses = list(mac_addresses)
+    keys = set()
+    for i in range(0, len(mac_addresses), QUOTA_CHECK_CHUNK):
+        keys.update(key for (key,) in db.session.query(SessionUsage.session_key).filter(
+            SessionUsage.mac_address.in_(mac_addresses[i:i + QUOTA_CHECK_CHUNK]),
+            SessionUsage.session_key.isnot(None),
+            SessionUsage.quota_bytes.isnot(None),
+            SessionUsage.exceeded_at.is_(None)
+        ).distinct())
+    if not keys:
+        return []
+    keys = list(keys)
+    spent = []
+    for i in range(0, len(keys), QUOTA_CHECK_CHUNK):
+        spent.extend(key for (key,) in db.session.query(SessionUsage.session_key).filter(
+            SessionUsage.session_key.in_(keys[i:i + QUOTA_CHECK_CHUNK])
+        ).group_by(SessionUsage.session_key).having(
+            func.sum(SessionUsage.bytes_in + SessionUsage.bytes_out) >= func.max(SessionUsage.quota_bytes)
+        ))
+    if not spent:
+        return []
+    exceeded = [mac for (mac,) in db.session.query(SessionUsage.mac_address).filter(
+        SessionUsage.session_key.in_(spent),
+        SessionUsage.exceeded_at.is_(None)
+    )]
+    SessionUsage.query.filter(SessionUsage.mac_address.in_(exceeded)).update(
+        {SessionUsage.exceeded_at: now}, synchronize_session=False)
+    for mac in exceeded:
+        EntitlementChange.record('revoke', 'mac', mac)
+    db.session.commit()
+
+    # The authorize de-dup keys stay, so status polls for the same purchase do not re-open access
+    current_app.extensions['gateway'].deauthorize(exceeded)
+    for mac in exceeded:
+        revoke_tickets('mac', mac)
+    logger.info("Data quota exceeded, devices cut off: count=%s", len(exceeded))
+    return exceeded
+
+
+def start_usage_session(mac_address, session_key, quota_bytes=None):
+    """Count a device's usage against an entitlement (see entitlement_key). Returns False if its quota is used up.
+
+    Every MAC on one entitlement counts against the same bundle. Calling
+    it again for the same device and entitlement keeps the running totals,
+    so re-authorizing after an idle kick does not reset them; moving a
+    device to another entitlement starts its own counters afresh.
+    """
+    usage = SessionUsage.query.filter_by(mac_address=mac_address).first()
+    if usage and usage.session_key == session_key:
+        return usage.exceeded_at is None
+    if quota_bytes is not None and db.session.query(SessionUsage.id).filter(
+        SessionUsage.session_key == session_key,
+        SessionUsage.exceeded_at.isnot(None)
+    ).first():
+        return False  # Used up on the entitlement's other devices
+    if usage is None:
+        usage = SessionUsage(mac_address=mac_address)
+        db.session.add(usage)
+    was_cut_off = usage.exceeded_at is not None
+    now = datetime.utcnow()
+    usage.session_key = session_key
+    usage.bytes_in = usage.bytes_out = 0
+    usage.quota_bytes = quota_bytes
+    usage.started_at = usage.updated_at = now
+    usage.exceeded_at = None
+    db.session.commit()
+    if was_cut_off:
+        restore_tickets('mac', mac_address)
+    return True
+
+
+class UsageAggregator:
+    """Sums byte counters per device in memory and writes them as periodic batched updates.
+
+    Ingesting a batch is a dict update under one lock, so a single node
+    keeps up with tens of thousands of counter updates per second; the
+    database sees at most one row write per device per flush.
+    """
+
+    def __init__(self, app, interval=5):
+        self.app = app
+        self.interval = interval
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._threads = LazyThreads(self._run, 'usage-aggregator')
+
+    def add(self, rows):
+        self._threads.ensure_started()
+        with self._lock:
+            totals = self._totals
+            for mac, bytes_in, bytes_out in rows:
+                current = totals.get(mac)
+                if current is None:
+                    totals[mac] = [bytes_in, bytes_out]
+                else:
+                    current[0] += bytes_in
+                    current[1] += bytes_out
+            waiting = len(totals)
+        set_backlog('usage', waiting)
+
+    def flush(self):
+        with self._lock:
+            totals, self._totals = self._totals, {}
+        set_backlog('usage', 0)
+        if not totals:
+            return 0
+        now = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                add_usage(totals, now)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Usage update failed, keeping %s devices for the next flush: %s", len(totals), e)
+                self.add((mac, b_in, b_out) for mac, (b_in, b_out) in totals.items())
+                return 0
+            try:
+                enforce_quotas(totals.keys(), now)
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Quota enforcement failed: %s", e)
+        return len(totals)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def shutdown(self):
+        self._stopped = True
+        self._wake.set()
+        self._threads.join(self.interval + 1)
+        self.flush()
+
+
+def ingest_counters(rows):
+    current_app.extensions['usage'].add(rows)
+
+
+def init_app(app):
+    """Start the app's usage aggregator."""
+    aggregator = UsageAggregator(app, interval=app.config.get('USAGE_FLUSH_INTERVAL_SECONDS', 5))
+    app.extensions['usage'] = aggregator
+    on_shutdown(aggregator.shutdown)
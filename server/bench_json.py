@@ -0,0 +1,81 @@
+"""Benchmark for the admin bulk listings' serialization path.
+
+Fills an in-memory SQLite database with transactions and users, then times
+building and encoding the /api/admin/transactions and /api/admin/users
+payloads two ways: ORM objects + to_dict() + Flask's stdlib provider (the
+old path), and RowListing column tuples + the orjson provider (the new one).
+
+    python bench_json.py --rows 20000 --repeat 5
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DEV_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('RATELIMIT_STORAGE_URL', 'memory://')
+os.environ.setdefault('LOG_FILE', '')
+os.environ.setdefault('LOG_TO_STDERR', 'false')
+
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app.extensions import db
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.utils.json_provider import OrjsonProvider
+
+
+def fill(rows):
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Transaction), [{
+        "phone_number": f"+2567{i:08d}", "package_id": str(i % 3 + 1), "amount": 0.5 * (i % 3 + 1),
+        "transaction_id": f"{i:036d}", "status": random.choice(('SUCCESSFUL', 'EXPIRED', 'FAILED')),
+        "expiry": now + timedelta(hours=i % 48), "created_at": now - timedelta(minutes=i),
+        "completed_at": now - timedelta(minutes=i) if i % 4 else None
+    } for i in range(rows)])
+    db.session.execute(db.insert(User), [{
+        "phone_number": f"+2567{i:08d}", "email": f"user{i}@example.com", "is_admin": False,
+        "is_superuser": False, "is_phone_verified": bool(i % 2), "created_at": now, "updated_at": now
+    } for i in range(rows)])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        db.session.expunge_all()  # Every listing starts from an empty identity map, as a request does
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help='transactions and users to list')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (median reported)')
+    args = parser.parse_args()
+
+    app = create_app()
+    stdlib, fast = DefaultJSONProvider(app), OrjsonProvider(app)
+    with app.app_context():
+        db.create_all()
+        fill(args.rows)
+        print(f"{args.rows} rows per listing, median of {args.repeat}")
+        for name, model in (('transactions', Transaction), ('users', User)):
+            build_old = timed(lambda: [o.to_dict() for o in model.query.all()], args.repeat)
+            build_new = timed(model.listing, args.repeat)
+            old_payload = {name: [o.to_dict() for o in model.query.all()]}
+            new_payload = {name: model.listing()}
+            encode_old = timed(lambda: stdlib.dumps(old_payload), args.repeat)
+            encode_new = timed(lambda: fast._encode(new_payload), args.repeat)
+            total_old, total_new = build_old + encode_old, build_new + encode_new
+            print(f"  {name:<13} build {build_old * 1000:7.1f} -> {build_new * 1000:7.1f} ms   "
+                  f"encode {encode_old * 1000:7.1f} -> {encode_new * 1000:6.1f} ms   "
+                  f"total {total_old * 1000:7.1f} -> {total_new * 1000:7.1f} ms ({total_old / total_new:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Micro-benchmark for login password checks.
+
+Reports verifications per second on one core and through the hashing
+pool for a range of work factors, to help pick BCRYPT_ROUNDS and
+PBKDF2_ITERATIONS for the venue hardware.
+
+    python bench_password_hashing.py --rounds 10 11 12 --iterations 260000 600000 1000000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.passwords import BcryptHasher, Pbkdf2Hasher, PasswordHashingPool
+
+PASSWORD = 'SecureRandomPassword2025!'
+
+
+def single_core_rate(hasher, password_hash, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        hasher.verify(password_hash, PASSWORD)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def pool_rate(hasher, password_hash, total, workers):
+    pool = PasswordHashingPool(workers=workers, max_queue=total)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=total) as clients:
+        list(clients.map(lambda _: pool.run(hasher.verify, password_hash, PASSWORD), range(total)))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return total / elapsed
+
+
+def report(label, hasher, seconds, workers):
+    password_hash = hasher.hash(PASSWORD)
+    per_core = single_core_rate(hasher, password_hash, seconds)
+    pooled = pool_rate(hasher, password_hash, max(workers * 4, 8), workers)
+    print(f"{label:<28} {1000 / per_core:8.1f} ms/login {per_core:8.1f} logins/s/core {pooled:8.1f} logins/s (pool of {workers})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, nargs='*', default=[10, 11, 12], help='bcrypt costs to test')
+    parser.add_argument('--iterations', type=int, nargs='*', default=[260000, 600000, 1000000], help='PBKDF2 iterations to test')
+    parser.add_argument('--seconds', type=float, default=2.0, help='time spent per single-core measurement')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='hashing pool size')
+    args = parser.parse_args()
+
+    for rounds in args.rounds:
+        report(f"bcrypt rounds={rounds}", BcryptHasher(rounds), args.seconds, args.workers)
+    for iterations in args.iterations:
+        report(f"pbkdf2 iterations={iterations}", Pbkdf2Hasher(iterations), args.seconds, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Concurrency benchmark for provider-bound requests.
+
+Starts a local MoMo stand-in that answers after a fixed delay, then serves
+the portal with run.py in each SERVER_MODE (threaded Waitress, gevent) and
+fires concurrent POST /api/payments/initiate requests at it. Reports
+throughput and latency percentiles; with slow providers the threaded server
+is capped at threads/delay requests per second, the gevent one is not.
+
+    python bench_provider_concurrency.py --requests 2000 --concurrency 500 --delay 0.2
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeMomo(BaseHTTPRequestHandler):
+    """Just enough of the MoMo collection API for initiate and verify."""
+    delay = 0.2
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.startswith('/collection/token'):
+            self._reply(200, {"access_token": "bench-token", "expires_in": 3600})
+        else:
+            time.sleep(self.delay)
+            self._reply(202)
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self._reply(200, {"status": "PENDING", "amount": "1.0", "currency": "EUR", "payer": {"partyId": "256700000000"}})
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeMomoServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 4096
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def create_schema(env):
+    code = "from app import create_app; from app.extensions import db; app = create_app(); app.app_context().push(); db.create_all()"
+    subprocess.run([sys.executable, '-c', code], env=env, cwd=HERE, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_mode(mode, args, base_env):
+    port = free_port()
+    env = dict(base_env, SERVER_MODE=mode, PORT=str(port))
+    server = subprocess.Popen([sys.executable, 'run.py'], env=env, cwd=HERE,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        url = f"http://127.0.0.1:{port}/api/payments/initiate"
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                response = requests.post(url, json={"phone_number": f"+2567{mode[0] == 'g'}{i:08d}", "package_id": "1"},
+                                        # A new connection each time, so requests queue fairly behind Waitress's connection limit
+                                        headers={"X-Client-MAC": f"02:00:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}",
+                                                 "Connection": "close"},
+                                        timeout=120)
+            except requests.RequestException:
+                return None, time.perf_counter() - start
+            return response.status_code, time.perf_counter() - start
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(one, range(args.requests)))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for _, latency in results)
+    ok = sum(1 for status, _ in results if status == 200)
+    return {
+        "mode": mode,
+        "ok": ok,
+        "errors": len(results) - ok,
+        "rps": len(results) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='initiate calls per mode')
+    parser.add_argument('--concurrency', type=int, default=500, help='client requests in flight')
+    parser.add_argument('--delay', type=float, default=0.2, help='stand-in MoMo response time in seconds')
+    parser.add_argument('--threads', type=int, default=8, help='Waitress threads for the threaded mode')
+    parser.add_argument('--modes', default='threaded,gevent', help='comma-separated SERVER_MODE values')
+    args = parser.parse_args()
+
+    FakeMomo.delay = args.delay
+    momo = FakeMomoServer(('127.0.0.1', 0), FakeMomo)
+    threading.Thread(target=momo.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_env = dict(
+            os.environ,
+            FLASK_ENV='production',
+            DEV_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            MOMO_BASE_URL=f"http://127.0.0.1:{momo.server_address[1]}",
+            MOMO_POOL_SIZE=str(args.concurrency),
+            WAITRESS_THREADS=str(args.threads),
+            GEVENT_MAX_CONNECTIONS=str(args.concurrency * 2),
+            RUN_SCHEDULER='false',
+            RATELIMIT_INITIATE='1000000 per minute',
+            RATELIMIT_STORAGE_URL='memory://',
+            LOG_FILE='',
+            LOG_TO_STDERR='false'
+        )
+        base_env.pop('DATABASE_URI', None)
+        create_schema(base_env)
+        print(f"{args.requests} initiate requests, {args.concurrency} concurrent, provider delay {args.delay * 1000:.0f} ms")
+        for mode in args.modes.split(','):
+            r = run_mode(mode, args, base_env)
+            print(f"  {r['mode']:<9} {r['rps']:8.1f} req/s   p50 {r['p50_ms']:8.1f} ms   p95 {r['p95_ms']:8.1f} ms   "
+                  f"ok {r['ok']}  errors {r['errors']}")
+    momo.shutdown()
+
+
+if __name__ == '__main__':
+    main()
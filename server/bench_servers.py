@@ -0,0 +1,157 @@
+"""Compares the ways run.py can serve the portal on a realistic endpoint mix.
+
+Each option is started through run.py against a throwaway SQLite database
+and a local MoMo stand-in answering after --delay seconds, then driven with
+concurrent clients issuing the mix below. Reports throughput, overall
+latency percentiles and p95 per endpoint.
+
+    packages   GET  /api/payments/packages          catalogue page views
+    heartbeat  POST /api/payments/heartbeat         captive-portal keep-alives
+    verify     POST /api/payments/verify/<id>       payment polling (provider call on a miss)
+    initiate   POST /api/payments/initiate          new purchases (provider call)
+
+    python bench_servers.py --requests 2000 --concurrency 100 --delay 0.2
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_provider_concurrency import HERE, FakeMomo, FakeMomoServer, create_schema, free_port, wait_for_port
+
+OPTIONS = {
+    'waitress': {'SERVER_MODE': 'threaded'},
+    'gevent': {'SERVER_MODE': 'gevent'},
+    'gunicorn-gthread': {'SERVER_MODE': 'gunicorn', 'GUNICORN_WORKER_CLASS': 'gthread'},
+    'gunicorn-gevent': {'SERVER_MODE': 'gunicorn', 'GUNICORN_WORKER_CLASS': 'gevent'},
+}
+
+MIX = (('packages', 50), ('heartbeat', 25), ('verify', 15), ('initiate', 10))
+
+
+def mac(i):
+    return f"02:00:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}"
+
+
+def run_option(name, args, base_env):
+    port = free_port()
+    env = dict(base_env, PORT=str(port), **OPTIONS[name])
+    server = subprocess.Popen([sys.executable, 'run.py'], env=env, cwd=HERE,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}/api/payments"
+    # New connection per request, so no server gets an edge from keep-alive handling
+    headers = {"Connection": "close"}
+
+    def initiate(i):
+        return requests.post(f"{base}/initiate", json={"phone_number": f"+2567{i:08d}", "package_id": "1"},
+                             headers={**headers, "X-Client-MAC": mac(i)}, timeout=120)
+
+    try:
+        wait_for_port(port)
+        # Purchases for the verify share of the mix to poll
+        transaction_ids = [initiate(900000 + i).json().get('transaction_id') for i in range(10)]
+        transaction_ids = [t for t in transaction_ids if t]
+        endpoints = [endpoint for endpoint, weight in MIX for _ in range(weight)]
+        rng = random.Random(42)
+        plan = [rng.choice(endpoints) for _ in range(args.requests)]
+
+        def one(i):
+            endpoint = plan[i]
+            start = time.perf_counter()
+            try:
+                if endpoint == 'packages':
+                    response = requests.get(f"{base}/packages", headers=headers, timeout=120)
+                elif endpoint == 'heartbeat':
+                    response = requests.post(f"{base}/heartbeat", headers={**headers, "X-Client-MAC": mac(i)}, timeout=120)
+                elif endpoint == 'verify':
+                    response = requests.post(f"{base}/verify/{transaction_ids[i % len(transaction_ids)]}",
+                                             headers=headers, timeout=120)
+                else:
+                    response = initiate(i)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            return endpoint, ok, time.perf_counter() - start
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(one, range(args.requests)))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for _, _, latency in results)
+    by_endpoint = defaultdict(list)
+    for endpoint, _, latency in results:
+        by_endpoint[endpoint].append(latency)
+    return {
+        "option": name,
+        "errors": sum(1 for _, ok, _ in results if not ok),
+        "rps": len(results) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "endpoint_p95_ms": {e: percentile(sorted(v), 0.95) * 1000 for e, v in by_endpoint.items()}
+    }
+
+
+def percentile(values, q):
+    return values[max(0, int(len(values) * q) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per option')
+    parser.add_argument('--concurrency', type=int, default=100, help='client requests in flight')
+    parser.add_argument('--delay', type=float, default=0.2, help='stand-in MoMo response time in seconds')
+    parser.add_argument('--threads', type=int, default=8, help='threads for Waitress and Gunicorn gthread workers')
+    parser.add_argument('--workers', type=int, help='Gunicorn workers (default: sized from CPU count)')
+    parser.add_argument('--options', default=','.join(OPTIONS), help='comma-separated subset of: ' + ', '.join(OPTIONS))
+    args = parser.parse_args()
+
+    FakeMomo.delay = args.delay
+    momo = FakeMomoServer(('127.0.0.1', 0), FakeMomo)
+    threading.Thread(target=momo.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_env = dict(
+            os.environ,
+            FLASK_ENV='production',
+            DEV_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            MOMO_BASE_URL=f"http://127.0.0.1:{momo.server_address[1]}",
+            WAITRESS_THREADS=str(args.threads),
+            GUNICORN_THREADS=str(args.threads),
+            GEVENT_MAX_CONNECTIONS=str(args.concurrency * 2),
+            RUN_SCHEDULER='false',
+            RATELIMIT_INITIATE='1000000 per minute',
+            RATELIMIT_HEARTBEAT='1000000 per minute',
+            RATELIMIT_STORAGE_URL='memory://',
+            LOG_FILE='',
+            LOG_TO_STDERR='false'
+        )
+        base_env.pop('DATABASE_URI', None)
+        if args.workers:
+            base_env['WEB_CONCURRENCY'] = str(args.workers)
+        create_schema(base_env)
+        print(f"{args.requests} requests per option, {args.concurrency} concurrent, provider delay "
+              f"{args.delay * 1000:.0f} ms, {os.cpu_count()} CPUs")
+        print("  mix: " + ", ".join(f"{endpoint} {weight}%" for endpoint, weight in MIX))
+        for name in args.options.split(','):
+            r = run_option(name, args, base_env)
+            per_endpoint = "  ".join(f"{e} {r['endpoint_p95_ms'].get(e, 0):.0f}" for e, _ in MIX)
+            print(f"  {r['option']:<17} {r['rps']:7.1f} req/s   p50 {r['p50_ms']:7.1f} ms   p95 {r['p95_ms']:7.1f} ms   "
+                  f"errors {r['errors']}   p95 ms by endpoint: {per_endpoint}")
+    momo.shutdown()
+
+
+if __name__ == '__main__':
+    main()
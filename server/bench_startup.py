@@ -0,0 +1,81 @@
+"""Import-time and cold-start report for the portal.
+
+Runs `python -X importtime` on a fresh interpreter for each of --runs
+cold starts and reports the median time to import `app`, the median time
+for create_app() itself, the slowest top-level packages imported on the way
+and whether the dependencies that should load lazily (SMS, TOTP,
+provider HTTP, scheduler, migrations) stayed out.
+
+    python bench_startup.py --runs 5 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Only needed by specific commands or code paths, never to start serving
+LAZY = ('twilio', 'qrcode', 'pyotp', 'pytz', 'requests', 'apscheduler', 'alembic', 'flask_migrate')
+
+PROBE = """
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+print(f"TIMING {imported - start} {time.perf_counter() - imported}")
+"""
+
+
+def cold_start(env):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], env=env, cwd=HERE,
+                            capture_output=True, text=True, check=True)
+    import_s, create_app_s = next(line.split()[1:] for line in result.stdout.splitlines() if line.startswith('TIMING'))
+    packages = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if '.' not in name and name != 'app' and name not in packages:
+            packages[name] = int(cumulative) / 1e6
+    return float(import_s), float(create_app_s), packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to take the median of')
+    parser.add_argument('--top', type=int, default=15, help='slowest top-level packages to list')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DEV_DATABASE_URI=os.getenv('DEV_DATABASE_URI', 'sqlite://'),
+               RATELIMIT_STORAGE_URL='memory://', LOG_FILE='', LOG_TO_STDERR='false')
+    env.pop('DATABASE_URI', None)
+
+    imports, create_apps = [], []
+    package_times = defaultdict(list)
+    for _ in range(args.runs):
+        import_s, create_app_s, packages = cold_start(env)
+        imports.append(import_s)
+        create_apps.append(create_app_s)
+        for name, seconds in packages.items():
+            package_times[name].append(seconds)
+
+    print(f"{args.runs} cold starts (median)")
+    print(f"  import app     {statistics.median(imports) * 1000:8.1f} ms")
+    print(f"  create_app()   {statistics.median(create_apps) * 1000:8.1f} ms")
+    print("Slowest top-level imports (cumulative, includes their dependencies):")
+    ranked = sorted(package_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, times in ranked[:args.top]:
+        print(f"  {name:<24} {statistics.median(times) * 1000:8.1f} ms")
+    loaded = [name for name in LAZY if name in package_times]
+    print(f"Lazy dependencies loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+    return 1 if loaded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# Gunicorn settings for the portal; run.py uses them when SERVER_MODE=gunicorn.
+#
+#   gunicorn -c gunicorn.conf.py 'app:create_app()'
+#
+# Every setting can be overridden from the environment (or GUNICORN_CMD_ARGS).
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+cpus = multiprocessing.cpu_count()
+
+# Import 'app' from this directory wherever Gunicorn is started from
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+# gthread: a few threads per worker overlap DB and provider waits; gevent: thousands of
+# greenlets per worker for provider-heavy traffic (see SERVER_MODE=gevent in run.py)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Requests spend ~10 ms of CPU each under the GIL, so processes are what scale with cores;
+# greenlet workers need no more than one per core
+workers = int(os.getenv('WEB_CONCURRENCY', cpus if worker_class == 'gevent' else cpus * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GEVENT_MAX_CONNECTIONS', 1000))
+if worker_class == 'gevent':
+    # Patch before preload imports the app; the worker's own patching would come too late
+    from gevent import monkey
+    monkey.patch_all()
+
+# Import the app once in the master so workers share its memory copy-on-write.
+# Nothing in create_app may hold threads or connections across the fork: background
+# threads start on first use in each worker, and post_fork drops pooled DB connections.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# SIGTERM: stop accepting, give in-flight requests this long, then flush buffers in worker_exit
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+# Scheduled jobs run once, in their own process, never in web workers
+RUN_SCHEDULER = os.getenv('RUN_SCHEDULER', 'true').lower() == 'true'
+_scheduler = {'process': None}
+
+# Workers share metrics through files; must be set before prometheus_client is imported
+_own_metrics_dir = not os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if _own_metrics_dir:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='portal-metrics-')
+
+
+def on_starting(server):
+    if RUN_SCHEDULER:
+        _scheduler['process'] = subprocess.Popen([sys.executable, os.path.join(chdir, 'run_scheduler.py')], cwd=chdir)
+        server.log.info("Scheduler process started (pid: %s)", _scheduler['process'].pid)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (preload) must not be shared by workers
+    from app.extensions import db
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # In-flight requests are done; flush queued SMS, device sightings and usage counters
+    from app.utils import background
+    background.shutdown()
+
+
+def child_exit(server, worker):
+    from app.utils import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    process = _scheduler['process']
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(graceful_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
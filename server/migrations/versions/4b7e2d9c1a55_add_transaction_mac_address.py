@@ -0,0 +1,26 @@
+"""Record the purchasing device on transactions
+
+Revision ID: 4b7e2d9c1a55
+Revises: 616cd10bb01a
+Create Date: 2026-10-19 00:20:11.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2d9c1a55'
+down_revision = '616cd10bb01a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('mac_address', sa.String(length=17), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_column('mac_address')
@@ -0,0 +1,37 @@
+"""Add entitlement_changes log for gateway delta sync
+
+Revision ID: 5be81d0f7c26
+Revises: c27d5b9e0a18
+Create Date: 2026-10-18 14:21:50.117384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5be81d0f7c26'
+down_revision = 'c27d5b9e0a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('entitlement_changes',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('subject_type', sa.String(length=10), nullable=False),
+        sa.Column('subject', sa.String(length=50), nullable=False),
+        sa.Column('expiry', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('entitlement_changes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_entitlement_changes_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('entitlement_changes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_entitlement_changes_created_at'))
+
+    op.drop_table('entitlement_changes')
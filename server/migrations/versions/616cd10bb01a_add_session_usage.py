@@ -0,0 +1,40 @@
+"""Add session_usage for data-capped bundles
+
+Revision ID: 616cd10bb01a
+Revises: 7c461eede355
+Create Date: 2026-10-19 00:14:38.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '616cd10bb01a'
+down_revision = '7c461eede355'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('session_usage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('mac_address', sa.String(length=17), nullable=False),
+        sa.Column('session_key', sa.String(length=40), nullable=True),
+        sa.Column('bytes_in', sa.BigInteger(), nullable=False),
+        sa.Column('bytes_out', sa.BigInteger(), nullable=False),
+        sa.Column('quota_bytes', sa.BigInteger(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('exceeded_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('session_usage', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_session_usage_mac_address'), ['mac_address'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('session_usage', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_session_usage_mac_address'))
+
+    op.drop_table('session_usage')
@@ -0,0 +1,28 @@
+"""Add disconnected_at to devices for idle-timeout disconnects
+
+Revision ID: 7c461eede355
+Revises: 8d1aa375da8b
+Create Date: 2026-10-18 23:52:17.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c461eede355'
+down_revision = '8d1aa375da8b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('disconnected_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_devices_last_seen'), ['last_seen'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_devices_last_seen'))
+        batch_op.drop_column('disconnected_at')
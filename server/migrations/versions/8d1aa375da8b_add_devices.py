@@ -0,0 +1,38 @@
+"""Add devices index of MAC addresses and phone numbers
+
+Revision ID: 8d1aa375da8b
+Revises: 5be81d0f7c26
+Create Date: 2026-10-18 23:31:05.402871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1aa375da8b'
+down_revision = '5be81d0f7c26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('devices',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('mac_address', sa.String(length=17), nullable=False),
+        sa.Column('phone_number', sa.String(length=15), nullable=True),
+        sa.Column('first_seen', sa.DateTime(), nullable=False),
+        sa.Column('last_seen', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_devices_mac_address'), ['mac_address'], unique=True)
+        batch_op.create_index(batch_op.f('ix_devices_phone_number'), ['phone_number'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_devices_phone_number'))
+        batch_op.drop_index(batch_op.f('ix_devices_mac_address'))
+
+    op.drop_table('devices')
@@ -0,0 +1,26 @@
+"""Index session_usage.session_key for per-entitlement quota sums
+
+Revision ID: 9d3f6a1b7e24
+Revises: 4b7e2d9c1a55
+Create Date: 2026-10-19 09:42:17.530884
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6a1b7e24'
+down_revision = '4b7e2d9c1a55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('session_usage', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_session_usage_session_key'), ['session_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('session_usage', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_session_usage_session_key'))
@@ -0,0 +1,32 @@
+"""Index access_codes.mac_address for gateway lookups
+
+Revision ID: c27d5b9e0a18
+Revises: 8a4e2f6c1d93
+Create Date: 2026-10-18 13:05:44.902611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27d5b9e0a18'
+down_revision = '8a4e2f6c1d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('access_codes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_access_codes_mac_address'), ['mac_address'], unique=False)
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_phone_status_expiry', ['phone_number', 'status', 'expiry'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_phone_status_expiry')
+
+    with op.batch_alter_table('access_codes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_access_codes_mac_address'))
@@ -0,0 +1,25 @@
+"""Drop usage rows of devices that never had a usage session
+
+Revision ID: e5a8c3f0b612
+Revises: 9d3f6a1b7e24
+Create Date: 2026-10-19 10:15:03.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a8c3f0b612'
+down_revision = '9d3f6a1b7e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Gateway counters used to create a row for every MAC they reported
+    op.execute(sa.text("DELETE FROM session_usage WHERE session_key IS NULL"))
+
+
+def downgrade():
+    pass
@@ -1,27 +1,98 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import threading
+import time
 import urllib.parse
+from app.utils.ticket_signing import verify_ticket, TicketError
+
+PORTAL_URL = os.getenv('PORTAL_URL', 'http://localhost:5000')
+CLIENT_MAC = '00:1A:2B:3C:4D:5E'  # Mock MAC
+TICKET_SECRET = os.getenv('ACCESS_TICKET_SECRET', '')
+DENYLIST_REFRESH_SECONDS = 30
+
+# Revoked jtis/subjects, refreshed from the portal in the background
+denylist = set()
+# Clients authorized through the HTTP gateway driver endpoints
+clients = {}
+
+def refresh_denylist():
+    import requests
+    while True:
+        try:
+            response = requests.get(f'{PORTAL_URL}/api/gateway/ticket-denylist',
+                                    headers={'X-Gateway-Token': os.getenv('GATEWAY_API_TOKEN', '')}, timeout=5)
+            if response.ok:
+                denylist.clear()
+                denylist.update(response.json().get('denied', []))
+        except Exception as e:
+            print(f'Deny-list refresh failed: {e}')
+        time.sleep(DENYLIST_REFRESH_SECONDS)
 
 class NoDogSplashSimulator(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def _read_json(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(content_length) or b'{}')
+
     def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path == '/clients':
+            self._send_json(200, {'clients': list(clients.values())})
+            return
+        if parsed.path == '/auth':
+            # Check the ticket locally, like a FAS/binauth hook would, without calling /check-access
+            ticket = urllib.parse.parse_qs(parsed.query).get('ticket', [''])[0]
+            try:
+                claims = verify_ticket(TICKET_SECRET, ticket, subject=f'mac:{CLIENT_MAC.lower()}', denied=denylist)
+                status, body = 200, {'authenticated': True, 'expires': claims['exp']}
+            except TicketError as e:
+                status, body = 403, {'authenticated': False, 'error': str(e)}
+            self._send_json(status, body)
+            return
+
         # Redirect to splash page
         self.send_response(302)
         self.send_header('Location', 'http://localhost:3000')
-        self.send_header('X-Client-MAC', '00:1A:2B:3C:4D:5E')  # Mock MAC
+        self.send_header('X-Client-MAC', CLIENT_MAC)
         self.end_headers()
 
     def do_POST(self):
+        # Batched calls from the portal's http gateway driver
+        if self.path == '/authorize':
+            for client in self._read_json().get('clients', []):
+                clients[client['mac']] = {'mac': client['mac'], 'state': 'Authenticated',
+                                          'expires': time.time() + (client.get('seconds') or 0)}
+            self._send_json(200, {'authorized': len(clients)})
+            return
+        if self.path == '/deauthorize':
+            for mac in self._read_json().get('macs', []):
+                clients.pop(mac, None)
+            self._send_json(200, {'authorized': len(clients)})
+            return
+
         if self.path.startswith('/api/payments/activate-code'):
             # Forward to Flask backend with X-Client-MAC
             import requests
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
-            headers = {'X-Client-MAC': '00:1A:2B:3C:4D:5E', 'Content-Type': 'application/json'}
-            response = requests.post('http://localhost:5000/api/payments/activate-code', data=post_data, headers=headers)
+            # The token vouches for X-Client-MAC; the portal ignores the header without it
+            headers = {'X-Client-MAC': CLIENT_MAC, 'X-Gateway-Token': os.getenv('GATEWAY_API_TOKEN', ''),
+                       'Content-Type': 'application/json'}
+            response = requests.post(f'{PORTAL_URL}/api/payments/activate-code', data=post_data, headers=headers)
             self.send_response(response.status_code)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
             self.wfile.write(response.content)
 
-server = HTTPServer(('192.168.1.49', 8080), NoDogSplashSimulator)
-print('Simulating NoDogSplash on http://192.168.1.49:8080...')
+threading.Thread(target=refresh_denylist, daemon=True).start()
+BIND_HOST = os.getenv('SIMULATOR_HOST', '127.0.0.1')
+BIND_PORT = int(os.getenv('SIMULATOR_PORT', 8080))
+server = HTTPServer((BIND_HOST, BIND_PORT), NoDogSplashSimulator)
+print(f'Simulating NoDogSplash on http://{BIND_HOST}:{BIND_PORT}...')
 server.serve_forever()
@@ -1,21 +1,74 @@
-from app import create_app, register_commands
 import os
+import signal
+import sys
+
+# SERVER_MODE picks how the portal is served:
+#   gunicorn  preloaded Gunicorn master forking CPU-sized workers (gunicorn.conf.py);
+#             the default in production
+#   threaded  Waitress in production, Flask's dev server otherwise
+#   gevent    one process serving each request on a greenlet. Provider-bound routes
+#             (initiate, verify, refunds) then wait on MoMo/Twilio without holding an
+#             OS thread, so one process can keep thousands of provider calls in flight.
+env = os.getenv('FLASK_ENV', 'development')
+SERVER_MODE = os.getenv('SERVER_MODE', 'gunicorn' if env == 'production' else 'threaded')
+# Single-process modes run the scheduled jobs in-process unless they run elsewhere
+RUN_SCHEDULER = os.getenv('RUN_SCHEDULER', 'true').lower() == 'true'
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+
+if __name__ == "__main__" and SERVER_MODE == 'gunicorn':
+    # Gunicorn imports the app itself, once, in the master before forking
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', os.path.join(here, 'gunicorn.conf.py'),
+                               *sys.argv[1:], 'app:create_app()'])
+
+if SERVER_MODE == 'gevent':
+    # Sockets must be patched before anything else imports them
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()  # Make Postgres queries yield to other greenlets too
+    except ImportError:
+        pass
+
+from app import create_app
+from app.scheduler import create_scheduler
 
 if __name__ == "__main__":
     app = create_app()
-    register_commands(app)
-
-    # Determine environment (development or production)
-    env = os.getenv('FLASK_ENV', 'development')
     port = int(os.getenv('PORT', 5000))
 
-    if env == 'production':
+    scheduler = create_scheduler(app) if RUN_SCHEDULER else None
+    if scheduler:
+        scheduler.start()
+
+    if SERVER_MODE == 'gevent':
+        import gevent
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        max_connections = int(os.getenv('GEVENT_MAX_CONNECTIONS', 1000))
+        server = WSGIServer(('0.0.0.0', port), app, spawn=Pool(max_connections), backlog=2048, log=None)
+        # SIGTERM stops accepting and waits for in-flight requests
+        gevent.signal_handler(signal.SIGTERM, server.stop, GRACEFUL_TIMEOUT)
+        print(f"Starting gevent server on port {port} (max {max_connections} concurrent requests)...")
+        server.serve_forever()
+    elif env == 'production':
         # Use a production WSGI server like Waitress
-        from waitress import serve
-        print(f"Starting production server on port {port}...")
-        serve(app, host='0.0.0.0', port=port)
+        from waitress import create_server
+        threads = int(os.getenv('WAITRESS_THREADS', 4))
+        server = create_server(app, host='0.0.0.0', port=port, threads=threads)
+
+        def stop(signum, frame):
+            raise SystemExit(0)  # Waitress closes its listener and finishes running tasks on SystemExit
+
+        signal.signal(signal.SIGTERM, stop)
+        print(f"Starting production server on port {port} ({threads} threads)...")
+        server.run()
     else:
         # Run Flask's built-in server for development
         print(f"Starting development server on port {port}...")
         app.run(host='0.0.0.0', port=port, debug=True)
-    
\ No newline at end of file
+
+    if scheduler:
+        # Let running jobs finish; queued SMS, device and usage buffers flush at exit
+        scheduler.shutdown(wait=True)
@@ -0,0 +1,28 @@
+"""Runs the portal's scheduled jobs in a process of their own.
+
+Gunicorn web workers never start the scheduler; gunicorn.conf.py launches
+this script next to them (or run it from its own service unit with
+RUN_SCHEDULER=false on the web side). SIGTERM lets running jobs finish
+and flushes background buffers before exiting.
+"""
+import signal
+import threading
+
+from app import create_app
+from app.scheduler import create_scheduler
+from app.utils import background
+
+if __name__ == "__main__":
+    app = create_app()
+    scheduler = create_scheduler(app)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    scheduler.start()
+    app.logger.info("Scheduler process started: jobs=%s", len(scheduler.get_jobs()))
+    stopping.wait()
+    app.logger.info("Scheduler process stopping, waiting for running jobs")
+    scheduler.shutdown(wait=True)
+    background.shutdown()
@@ -0,0 +1,30 @@
+import os
+
+# Config reads the environment at import time, so set it before importing the app
+os.environ['DEV_DATABASE_URI'] = 'sqlite://'
+os.environ.pop('DATABASE_URI', None)
+os.environ.setdefault('SMS_BACKEND', 'console')
+os.environ.setdefault('LOG_FILE', '')
+os.environ.setdefault('LOG_TO_STDERR', 'false')
+os.environ.setdefault('RATELIMIT_STORAGE_URL', 'memory://')
+os.environ.setdefault('QUERY_AUDIT_ENABLED', 'true')
+
+import pytest
+from app import create_app
+from app.extensions import db
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
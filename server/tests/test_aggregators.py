@@ -0,0 +1,68 @@
+from app.extensions import db
+from app.models.device import Device
+from app.models.session_usage import SessionUsage
+from app.utils.devices import DeviceRecorder
+from app.utils.usage import UsageAggregator, entitlement_key, start_usage_session
+
+MAC_A, MAC_B, MAC_C = 'aa:aa:aa:aa:aa:01', 'aa:aa:aa:aa:aa:02', 'aa:aa:aa:aa:aa:03'
+
+
+def usage(mac):
+    db.session.expire_all()
+    return SessionUsage.query.filter_by(mac_address=mac).first()
+
+
+def test_usage_aggregator_sums_counters_per_device(app):
+    start_usage_session(MAC_A, entitlement_key('tx', 'tx-1'))
+    aggregator = UsageAggregator(app)
+    aggregator.add([(MAC_A, 100, 10), (MAC_A, 50, 5)])
+    aggregator.add([(MAC_A, 1, 1)])
+    assert aggregator.flush() == 1
+    row = usage(MAC_A)
+    assert (row.bytes_in, row.bytes_out) == (151, 16)
+    assert aggregator.flush() == 0
+
+
+def test_usage_for_devices_without_a_session_is_dropped(app):
+    aggregator = UsageAggregator(app)
+    aggregator.add([(MAC_B, 100, 100)])
+    aggregator.flush()
+    assert usage(MAC_B) is None
+
+
+def test_quota_is_shared_by_devices_on_one_entitlement(app):
+    key = entitlement_key('tx', 'tx-1')
+    assert start_usage_session(MAC_A, key, 1000)
+    assert start_usage_session(MAC_B, key, 1000)
+    aggregator = UsageAggregator(app)
+
+    aggregator.add([(MAC_A, 400, 0), (MAC_B, 400, 0)])
+    aggregator.flush()
+    assert usage(MAC_A).exceeded_at is None
+
+    aggregator.add([(MAC_B, 300, 0)])
+    aggregator.flush()
+    assert usage(MAC_A).exceeded_at is not None
+    assert usage(MAC_B).exceeded_at is not None
+    drv = app.extensions['gateway'].drivers[0]
+    assert ('deauthorize', sorted([MAC_A, MAC_B])) in [(op, sorted(args)) for op, args in drv.calls]
+
+    # A further device cannot reopen the spent bundle; another entitlement can
+    assert not start_usage_session(MAC_C, key, 1000)
+    assert start_usage_session(MAC_C, entitlement_key('code', 'ABC'), 1000)
+
+
+def test_device_recorder_coalesces_sightings(app):
+    recorder = DeviceRecorder(app)
+    recorder.note('AA-AA-AA-AA-AA-01', '+256700000001')
+    recorder.note(MAC_A)
+    recorder.note('not a mac')
+    assert recorder.pending_macs() == [MAC_A]
+    assert recorder.flush() == 1
+    device = Device.query.filter_by(mac_address=MAC_A).one()
+    assert device.phone_number == '+256700000001'  # A later sighting without a phone keeps it
+
+    recorder.note(MAC_A)
+    recorder.flush()
+    db.session.expire_all()
+    assert Device.query.filter_by(mac_address=MAC_A).one().phone_number == '+256700000001'
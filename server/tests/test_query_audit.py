@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import text
+from app.extensions import db
+from app.utils.query_audit import QueryBudgetExceeded, parse_budgets, query_budget
+
+
+def run_queries(count):
+    for _ in range(count):
+        db.session.execute(text("SELECT 1"))
+    return {"ok": True}
+
+
+@pytest.fixture
+def audited(app):
+    app.add_url_rule('/two', 'two', query_budget(2)(lambda: run_queries(2)))
+    app.add_url_rule('/three', 'three', query_budget(2)(lambda: run_queries(3)))
+    app.add_url_rule('/loop', 'loop', lambda: run_queries(6))
+    return app
+
+
+def test_response_carries_query_count_and_time(audited):
+    response = audited.test_client().get('/two')
+    assert response.status_code == 200
+    assert response.headers['X-Query-Count'] == '2'
+    assert response.headers['X-DB-Time'].endswith('ms')
+
+
+def test_over_budget_raises_under_testing(audited):
+    with pytest.raises(QueryBudgetExceeded, match='ran 3 SQL statements, budget is 2'):
+        audited.test_client().get('/three')
+
+
+def test_over_budget_only_logs_outside_testing(audited, caplog):
+    audited.config['TESTING'] = False
+    audited.config['PROPAGATE_EXCEPTIONS'] = True
+    response = audited.test_client().get('/three')
+    assert response.status_code == 200
+    assert 'Query budget exceeded' in caplog.text
+
+
+def test_config_budget_applies_to_endpoint(audited):
+    audited.extensions['query_audit_budgets'] = parse_budgets('loop=5')
+    with pytest.raises(QueryBudgetExceeded):
+        audited.test_client().get('/loop')
+
+
+def test_repeated_statement_is_logged_as_n_plus_one(audited, caplog):
+    audited.test_client().get('/loop')
+    assert 'Possible N+1 query: endpoint=loop, repeats=6' in caplog.text
+
+
+def test_parse_budgets_skips_malformed_entries():
+    assert parse_budgets('a.b=2, c=x,=3,d=4') == {'a.b': 2, 'd': 4}
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db
+from app.models.refund import Refund
+from app.models.transaction import Transaction
+from app.utils import momo_api
+from app.utils.refund_queue import enqueue_refund, process_refund_queue
+
+
+@pytest.fixture
+def refunds(monkeypatch):
+    """MoMo refund results to return in order; records each call's transaction id."""
+    calls, results = [], []
+
+    def refund_payment(self, transaction_id, amount, refund_id=None):
+        calls.append((transaction_id, refund_id))
+        return results.pop(0) if results else {"status": "SUCCESSFUL"}
+
+    monkeypatch.setattr(momo_api.MobileMoneyAPI, '__init__', lambda self: None)
+    monkeypatch.setattr(momo_api.MobileMoneyAPI, 'refund_payment', refund_payment)
+    return calls, results
+
+
+def failed_transaction(transaction_id='tx-1'):
+    transaction = Transaction(phone_number='+256700000001', package_id='1', amount=1.5,
+                              transaction_id=transaction_id, status='FAILED')
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction
+
+
+def make_due(refund):
+    refund.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_enqueue_is_idempotent(app):
+    transaction = failed_transaction()
+    first = enqueue_refund(transaction)
+    db.session.commit()
+    second = enqueue_refund(transaction)
+    assert second.id == first.id
+    assert Refund.query.count() == 1
+    assert first.status == 'PENDING' and first.amount == 1.5
+
+
+def test_successful_refund_marks_transaction_refunded(app, refunds):
+    calls, _ = refunds
+    refund = enqueue_refund(failed_transaction())
+    db.session.commit()
+    assert process_refund_queue() == 1
+    assert calls == [('tx-1', refund.reference_id)]
+    assert Refund.query.one().status == 'SUCCEEDED'
+    assert Transaction.query.one().status == 'REFUNDED'
+    assert process_refund_queue() == 0
+
+
+def test_failed_attempt_backs_off_and_keeps_reference(app, refunds):
+    calls, results = refunds
+    app.config.update(REFUND_RETRY_BASE_SECONDS=30, REFUND_RETRY_MAX_SECONDS=3600)
+    refund = enqueue_refund(failed_transaction())
+    db.session.commit()
+    results.append({"error": "timeout", "details": "MoMo timed out"})
+    before = datetime.utcnow()
+    process_refund_queue()
+
+    refund = Refund.query.one()
+    assert refund.status == 'PENDING'
+    assert refund.attempts == 1
+    assert refund.last_error == 'MoMo timed out'
+    assert refund.next_attempt_at >= before + timedelta(seconds=29)
+    assert process_refund_queue() == 0  # Not due yet
+
+    make_due(refund)
+    process_refund_queue()
+    assert [ref for _, ref in calls] == [refund.reference_id] * 2
+    assert Refund.query.one().status == 'SUCCEEDED'
+
+
+def test_refund_abandoned_after_max_attempts(app, refunds):
+    _, results = refunds
+    app.config['REFUND_MAX_ATTEMPTS'] = 2
+    enqueue_refund(failed_transaction())
+    db.session.commit()
+    results.extend([{"error": "rejected"}, {"error": "rejected"}])
+    process_refund_queue()
+    make_due(Refund.query.one())
+    process_refund_queue()
+    refund = Refund.query.one()
+    assert refund.status == 'FAILED' and refund.attempts == 2
+    assert Transaction.query.one().status == 'FAILED'
+
+
+def test_batch_size_limits_each_run(app, refunds):
+    for i in range(3):
+        enqueue_refund(failed_transaction(f"tx-{i}"))
+    db.session.commit()
+    assert process_refund_queue(batch_size=2) == 2
+    assert process_refund_queue(batch_size=2) == 1
+    assert Refund.query.filter_by(status='SUCCEEDED').count() == 3
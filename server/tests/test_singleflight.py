@@ -0,0 +1,64 @@
+import threading
+import time
+import pytest
+from app.utils.singleflight import SingleFlight
+
+
+def run_concurrently(n, target):
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results, errors
+
+
+def test_concurrent_callers_share_one_execution():
+    flight, calls = SingleFlight(), []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'result'
+
+    results, errors = run_concurrently(8, lambda: flight.do('key', slow))
+    assert calls == [1]
+    assert results == ['result'] * 8
+    assert errors == []
+
+
+def test_waiters_receive_the_leaders_exception():
+    flight, calls = SingleFlight(), []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError('provider down')
+
+    results, errors = run_concurrently(4, lambda: flight.do('key', failing))
+    assert calls == [1]
+    assert results == []
+    assert len(errors) == 4 and all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_key_is_released_after_each_call():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do('key', lambda: int('x'))
+    assert flight.do('key', lambda: 3) == 3
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 'a') == 'a'
+    assert flight.do('b', lambda: 'b') == 'b'